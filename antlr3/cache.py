@@ -0,0 +1,283 @@
+""" @package antlr3.cache
+@brief ANTLR3 runtime package, cache module
+
+An on-disk cache for parse results.  Entries are addressed by a hash of
+the input text, the grammar (lexer and parser modules), the start rule and
+the runtime version, and store the token buffer and AST in the format of
+the serialize module.
+
+"""
+
+# begin[licence]
+#
+# [The "BSD licence"]
+# Copyright (c) 2005-2012 Terence Parr
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. The name of the author may not be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# end[licence]
+
+import hashlib
+import os
+import sys
+import tempfile
+
+from . import __version__, serialize
+from .streams import ANTLRStringStream, CommonTokenStream
+
+SUFFIX = ".a3pr"
+
+# class -> digest of the module that defines it
+_grammarDigests = {}
+
+
+def grammarIdentity(cls):
+    """
+    @brief Return a string that identifies the grammar of a recognizer class.
+
+    This is the qualified class name plus a digest of the source file of
+    its module, so regenerating the recognizer from a changed grammar
+    yields a different identity.
+    """
+
+    digest = _grammarDigests.get(cls)
+    if digest is None:
+        h = hashlib.sha256()
+        module = sys.modules.get(cls.__module__)
+        path = getattr(module, "__file__", None)
+        if path is not None:
+            try:
+                with open(path, "rb") as fp:
+                    h.update(fp.read())
+            except OSError:
+                pass
+
+        digest = h.hexdigest()
+        _grammarDigests[cls] = digest
+
+    return "{}.{}:{}".format(cls.__module__, cls.__qualname__, digest)
+
+
+class ParseCache:
+    """
+    @brief A size bounded on-disk cache for parse results.
+
+    Each entry is a single file in directory, named after its key.  When
+    the total size exceeds maxSize bytes, the least recently used entries
+    are removed (file modification times serve as the LRU clock, a hit
+    touches the file).  Writes go through a temporary file and a rename, so
+    several processes may share a directory.
+
+    The counters hits, misses, stores and evictions are kept for the
+    lifetime of the object, see stats().
+    """
+
+    def __init__(self, directory, maxSize=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxSize = maxSize
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Total size of all entries, computed lazily on the first store.
+        self._size = None
+
+    def key(self, text, lexerClass, parserClass, rule):
+        """Compute the cache key for parsing text with the given rule."""
+
+        h = hashlib.sha256()
+        for part in (
+            __version__,
+            str(serialize.FORMAT_VERSION),
+            grammarIdentity(lexerClass),
+            grammarIdentity(parserClass),
+            rule,
+        ):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key, adaptor=None):
+        """
+        Return the (tokens, tree) tuple stored under key or None, if there
+        is no such entry.  The tree is built using adaptor, see
+        serialize.loads().
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+
+            result = serialize.loads(data, adaptor)
+
+        except OSError:
+            self.misses += 1
+            return None
+
+        except ValueError:
+            # corrupt or from an incompatible runtime, drop it
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return result
+
+    def put(self, key, tokens, tree, adaptor=None):
+        """Store tokens and tree under key."""
+
+        data = serialize.dumps(tree, tokens, adaptor)
+
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmpPath, self._path(key))
+
+        except BaseException:
+            self._remove(tmpPath)
+            raise
+
+        self.stores += 1
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += len(data)
+
+        if self._size > self.maxSize:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits maxSize."""
+
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        for _, entrySize, path in entries:
+            if size <= self.maxSize:
+                break
+
+            if self._remove(path):
+                self.evictions += 1
+            size -= entrySize
+
+        self._size = size
+
+    def clear(self):
+        """Remove all entries."""
+
+        for _, _, path in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def _entries(self):
+        """Return (mtime, size, path) for all entries."""
+
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def parse(self, inStream, lexerClass, parserClass, rule, adaptor=None, **kwargs):
+        """
+        @brief Parse inStream with rule, unless the result is in the cache.
+
+        inStream may be a CharStream or a string.  On a miss the input is
+        lexed and parsed as usual (kwargs are passed on to the parser) and
+        the result is stored, unless the lexer or parser reported syntax
+        errors.  Returns a (tokens, tree) tuple, the tree is None if the rule
+        does not build an AST.
+        """
+
+        if isinstance(inStream, str):
+            inStream = ANTLRStringStream(inStream)
+
+        text = inStream.substring(0, inStream.size() - 1)
+        key = self.key(text, lexerClass, parserClass, rule)
+
+        result = self.get(key, adaptor)
+        if result is not None:
+            return result
+
+        lexer = lexerClass(inStream)
+        tokenStream = CommonTokenStream(lexer)
+        parser = parserClass(tokenStream, **kwargs)
+        if adaptor is not None:
+            parser.adaptor = adaptor
+
+        ruleResult = getattr(parser, rule)()
+        tree = getattr(ruleResult, "tree", None)
+        tokens = tokenStream.getTokens() or []
+
+        if (
+            lexer.getNumberOfSyntaxErrors() == 0
+            and parser.getNumberOfSyntaxErrors() == 0
+        ):
+            self.put(key, tokens, tree, adaptor)
+
+        return tokens, tree
+
+    def stats(self):
+        """Return the hit/miss counters as a dict."""
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
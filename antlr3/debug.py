@@ -28,15 +28,19 @@
 #
 # end[licence]
 
+import json
 import socket
+import struct
 import sys
+import time
 
+from . import exceptions
 from .constants import INVALID_TOKEN_TYPE
 from .exceptions import RecognitionException
 from .recognizers import Parser
 from .streams import TokenStream
-from .tokens import Token
-from .tree import CommonTreeAdaptor, Tree, TreeAdaptor
+from .tokens import CommonToken, Token
+from .tree import CommonTree, CommonTreeAdaptor, Tree, TreeAdaptor
 
 
 class DebugParser(Parser):
@@ -738,17 +742,772 @@ class RecordDebugEventListener(TraceDebugEventListener):
         self.events.append(event)
 
 
+class ProfileDebugEventListener(BlankDebugEventListener):
+    """A listener that collects performance statistics of a parse.
+
+    For every rule it counts invocations, errors and inclusive/exclusive
+    time (time spent in the rule with and without the rules it invoked;
+    for recursive rules the inclusive time is only counted for the
+    outermost invocation).
+
+    For every decision it counts invocations and the time spent predicting
+    an alternative, keeps a histogram of the lookahead depth, i.e. how many
+    tokens past the decision point were examined (including the ones
+    consumed while backtracking), and counts backtracks and how many of
+    them succeeded.  Semantic predicates are counted per predicate text.
+
+    Tokens are counted as consumed, hidden (off-channel), speculative
+    (consumed while backtracking, thus seen more than once) and dropped
+    during error recovery.
+
+    Call report() for a dict of all statistics or writeReport() to dump it
+    as JSON.  timer is the clock used for all times, in seconds.
+    """
+
+    def __init__(self, timer=time.perf_counter):
+        super().__init__()
+
+        self.timer = timer
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics."""
+
+        # rule name -> stats
+        self.rules = {}
+        # decision number -> stats
+        self.decisions = {}
+        # predicate text -> stats
+        self.predicates = {}
+
+        self.time = 0.0
+        self.tokensConsumed = 0
+        self.hiddenTokensConsumed = 0
+        self.speculativeTokensConsumed = 0
+        self.resyncTokensConsumed = 0
+        self.errors = 0
+
+        # [rule name, stats, start time, time spent in invoked rules]
+        self._ruleStack = []
+        # [stats, start time, start position, max lookahead depth]
+        self._decisionStack = []
+        # rule name -> number of active invocations
+        self._ruleDepth = {}
+
+        # Number of on-channel tokens consumed, minus the ones given back
+        # by rewind().  Lookahead depths are relative to this.
+        self._position = 0
+        # marker -> position
+        self._marks = {}
+        self._lastMarker = None
+
+        self._backtracking = 0
+        self._resyncing = 0
+
+    ## rules
+
+    def enterRule(self, grammarFileName, ruleName):
+        stats = self.rules.get(ruleName)
+        if stats is None:
+            stats = self.rules[ruleName] = {
+                "invocations": 0,
+                "errors": 0,
+                "inclusiveTime": 0.0,
+                "exclusiveTime": 0.0,
+            }
+
+        stats["invocations"] += 1
+        self._ruleDepth[ruleName] = self._ruleDepth.get(ruleName, 0) + 1
+        self._ruleStack.append([ruleName, stats, self.timer(), 0.0])
+
+    def exitRule(self, grammarFileName, ruleName):
+        if not self._ruleStack:
+            return
+
+        _, stats, start, childTime = self._ruleStack.pop()
+        elapsed = self.timer() - start
+        stats["exclusiveTime"] += elapsed - childTime
+
+        depth = self._ruleDepth[ruleName] - 1
+        self._ruleDepth[ruleName] = depth
+        if depth == 0:
+            stats["inclusiveTime"] += elapsed
+
+        if self._ruleStack:
+            self._ruleStack[-1][3] += elapsed
+        else:
+            self.time += elapsed
+
+    def recognitionException(self, e):
+        self.errors += 1
+        if self._ruleStack:
+            self._ruleStack[-1][1]["errors"] += 1
+
+    ## decisions
+
+    def enterDecision(self, decisionNumber, couldBacktrack):
+        stats = self.decisions.get(decisionNumber)
+        if stats is None:
+            stats = self.decisions[decisionNumber] = {
+                "rule": self._ruleStack[-1][0] if self._ruleStack else None,
+                "couldBacktrack": bool(couldBacktrack),
+                "invocations": 0,
+                "time": 0.0,
+                "lookahead": {},
+                "maxLookahead": 0,
+                "backtracks": 0,
+                "successfulBacktracks": 0,
+            }
+
+        stats["invocations"] += 1
+        self._decisionStack.append([stats, self.timer(), self._position, 0])
+
+    def exitDecision(self, decisionNumber):
+        if not self._decisionStack:
+            return
+
+        stats, start, position, depth = self._decisionStack.pop()
+        stats["time"] += self.timer() - start
+
+        histogram = stats["lookahead"]
+        histogram[depth] = histogram.get(depth, 0) + 1
+        if depth > stats["maxLookahead"]:
+            stats["maxLookahead"] = depth
+
+        if self._decisionStack:
+            # a nested decision (e.g. while backtracking) looked ahead on
+            # behalf of the enclosing one
+            outer = self._decisionStack[-1]
+            depth += position - outer[2]
+            if depth > outer[3]:
+                outer[3] = depth
+
+    def LT(self, i, t):
+        if i > 0 and self._decisionStack:
+            frame = self._decisionStack[-1]
+            depth = self._position - frame[2] + i
+            if depth > frame[3]:
+                frame[3] = depth
+
+    def beginBacktrack(self, level):
+        self._backtracking += 1
+        if self._decisionStack:
+            self._decisionStack[-1][0]["backtracks"] += 1
+
+    def endBacktrack(self, level, successful):
+        self._backtracking -= 1
+        if successful and self._decisionStack:
+            self._decisionStack[-1][0]["successfulBacktracks"] += 1
+
+    def semanticPredicate(self, result, predicate):
+        stats = self.predicates.get(predicate)
+        if stats is None:
+            stats = self.predicates[predicate] = {"evaluations": 0, "true": 0}
+
+        stats["evaluations"] += 1
+        if result:
+            stats["true"] += 1
+
+    ## input
+
+    def consumeToken(self, t):
+        self._position += 1
+        self.tokensConsumed += 1
+        if self._backtracking:
+            self.speculativeTokensConsumed += 1
+        if self._resyncing:
+            self.resyncTokensConsumed += 1
+
+    def consumeHiddenToken(self, t):
+        self.hiddenTokensConsumed += 1
+
+    def consumeNode(self, t):
+        self.consumeToken(t)
+
+    def mark(self, marker):
+        self._marks[marker] = self._position
+        self._lastMarker = marker
+
+    def rewind(self, marker=None):
+        if marker is None:
+            marker = self._lastMarker
+
+        position = self._marks.get(marker)
+        if position is not None:
+            self._position = position
+
+    def beginResync(self):
+        self._resyncing += 1
+
+    def endResync(self):
+        self._resyncing -= 1
+
+    ## report
+
+    def report(self):
+        """
+        @brief Return all statistics as a dict.
+
+        The result only contains dicts, lists, strings and numbers, so it
+        can be passed to json.dump() as is.  Decisions are keyed by their
+        number, the lookahead histograms map depth to count.
+        """
+
+        decisions = {}
+        for decisionNumber, stats in sorted(self.decisions.items()):
+            stats = dict(stats)
+            histogram = stats["lookahead"]
+            count = sum(histogram.values())
+            stats["lookahead"] = dict(sorted(histogram.items()))
+            stats["meanLookahead"] = (
+                sum(depth * n for depth, n in histogram.items()) / count
+                if count
+                else 0.0
+            )
+            stats["backtrackSuccessRate"] = (
+                stats["successfulBacktracks"] / stats["backtracks"]
+                if stats["backtracks"]
+                else None
+            )
+            decisions[decisionNumber] = stats
+
+        return {
+            "time": self.time,
+            "errors": self.errors,
+            "tokens": {
+                "consumed": self.tokensConsumed,
+                "hidden": self.hiddenTokensConsumed,
+                "speculative": self.speculativeTokensConsumed,
+                "resync": self.resyncTokensConsumed,
+            },
+            "rules": {name: dict(stats) for name, stats in self.rules.items()},
+            "decisions": decisions,
+            "predicates": {
+                text: dict(stats) for text, stats in self.predicates.items()
+            },
+        }
+
+    def writeReport(self, out):
+        """Write report() as JSON to the text file out."""
+
+        json.dump(self.report(), out, indent=2, sort_keys=True)
+        out.write("\n")
+
+
+############################################################################
+#
+# Binary event logs
+#
+#   header        magic, version
+#   records       event code (uint8) and four int32 arguments, little
+#                 endian
+#
+# Strings (grammar and rule names, predicate texts, exception class names)
+# are referenced by id.  A string record (code 0) defines the next id, its
+# first argument is the length of the UTF-8 bytes that follow the record.
+# Tokens are referenced by index, type and channel, tree nodes by a number
+# assigned on first appearance.
+#
+############################################################################
+
+EVENT_LOG_MAGIC = b"A3DE"
+EVENT_LOG_VERSION = 1
+
+_EVENT_LOG_HEADER = struct.Struct("<4sH")
+_EVENT_RECORD = struct.Struct("<B4i")
+
+(
+    _STRING,
+    _ENTER_RULE,
+    _ENTER_ALT,
+    _EXIT_RULE,
+    _ENTER_SUB_RULE,
+    _EXIT_SUB_RULE,
+    _ENTER_DECISION,
+    _EXIT_DECISION,
+    _CONSUME_TOKEN,
+    _CONSUME_HIDDEN_TOKEN,
+    _LT_TOKEN,
+    _MARK,
+    _REWIND,
+    _BEGIN_BACKTRACK,
+    _END_BACKTRACK,
+    _LOCATION,
+    _RECOGNITION_EXCEPTION,
+    _BEGIN_RESYNC,
+    _END_RESYNC,
+    _SEMANTIC_PREDICATE,
+    _COMMENCE,
+    _TERMINATE,
+    _CONSUME_NODE,
+    _LT_NODE,
+    _NIL_NODE,
+    _ERROR_NODE,
+    _CREATE_NODE,
+    _BECOME_ROOT,
+    _ADD_CHILD,
+    _SET_TOKEN_BOUNDARIES,
+) = range(30)
+
+
+class BinaryEventRecorder(DebugEventListener):
+    """
+    @brief A listener that records events as fixed size binary records.
+
+    Each event takes 17 bytes, versus a formatted string per event for
+    RecordDebugEventListener.  Events are written to the binary file out
+    (buffered, call flush() or close() when done), kept in memory (see
+    getvalue()) or, if ringSize is given, kept in a ring buffer holding
+    the last ringSize events, e.g. to capture the events leading to an
+    error in production.  Use BinaryEventReplayer to read the log back.
+
+    Tree nodes are numbered in the order they first appear in an event,
+    telling them apart using adaptor.getUniqueID().
+    """
+
+    def __init__(self, out=None, ringSize=None, adaptor=None, bufferSize=65536):
+        super().__init__()
+
+        if adaptor is None:
+            adaptor = CommonTreeAdaptor()
+        self.adaptor = adaptor
+
+        if out is not None and ringSize is not None:
+            raise ValueError("out and ringSize are mutually exclusive")
+        if ringSize is not None and ringSize < 1:
+            raise ValueError("ringSize must be at least 1")
+
+        self.out = out
+        self.ringSize = ringSize
+        self.bufferSize = bufferSize
+
+        # Number of events recorded, including the ones that were dropped
+        # from the ring buffer.
+        self.count = 0
+
+        # string -> id
+        self._strings = {}
+        # unique node id -> node number
+        self._nodes = {}
+        self._buffer = bytearray(
+            _EVENT_LOG_HEADER.pack(EVENT_LOG_MAGIC, EVENT_LOG_VERSION)
+        )
+
+        if ringSize is not None:
+            self._ring = bytearray(ringSize * _EVENT_RECORD.size)
+            self._record = self._recordToRing
+        else:
+            self._ring = None
+            self._record = self._recordToBuffer
+
+    def _recordToBuffer(self, code, a=0, b=0, c=0, d=0):
+        self._buffer += _EVENT_RECORD.pack(code, a, b, c, d)
+        self.count += 1
+        if self.out is not None and len(self._buffer) >= self.bufferSize:
+            self.flush()
+
+    def _recordToRing(self, code, a=0, b=0, c=0, d=0):
+        offset = (self.count % self.ringSize) * _EVENT_RECORD.size
+        _EVENT_RECORD.pack_into(self._ring, offset, code, a, b, c, d)
+        self.count += 1
+
+    def _stringId(self, text):
+        if text is None:
+            return -1
+
+        sid = self._strings.get(text)
+        if sid is None:
+            sid = self._strings[text] = len(self._strings)
+            if self._ring is None:
+                data = text.encode("utf-8")
+                self._buffer += _EVENT_RECORD.pack(_STRING, len(data), 0, 0, 0)
+                self._buffer += data
+
+        return sid
+
+    def _nodeId(self, t):
+        uid = self.adaptor.getUniqueID(t)
+        nid = self._nodes.get(uid)
+        if nid is None:
+            nid = self._nodes[uid] = len(self._nodes)
+        return nid
+
+    def flush(self):
+        """Write all buffered events to out."""
+
+        if self.out is not None and self._buffer:
+            self.out.write(self._buffer)
+            del self._buffer[:]
+
+    def close(self):
+        """Flush and close out."""
+
+        if self.out is not None:
+            self.flush()
+            self.out.close()
+
+    def getvalue(self):
+        """
+        Return the log as bytes.  For a ring buffer these are the last
+        ringSize events.
+        """
+
+        if self.out is not None:
+            raise RuntimeError("events are written to a file")
+
+        if self._ring is None:
+            return bytes(self._buffer)
+
+        parts = [self._buffer]
+        for text in self._strings:
+            data = text.encode("utf-8")
+            parts.append(_EVENT_RECORD.pack(_STRING, len(data), 0, 0, 0))
+            parts.append(data)
+
+        if self.count <= self.ringSize:
+            parts.append(self._ring[: self.count * _EVENT_RECORD.size])
+        else:
+            split = (self.count % self.ringSize) * _EVENT_RECORD.size
+            parts.append(self._ring[split:])
+            parts.append(self._ring[:split])
+
+        return b"".join(parts)
+
+    ## events
+
+    def enterRule(self, grammarFileName, ruleName):
+        self._record(
+            _ENTER_RULE, self._stringId(grammarFileName), self._stringId(ruleName)
+        )
+
+    def enterAlt(self, alt):
+        self._record(_ENTER_ALT, alt)
+
+    def exitRule(self, grammarFileName, ruleName):
+        self._record(
+            _EXIT_RULE, self._stringId(grammarFileName), self._stringId(ruleName)
+        )
+
+    def enterSubRule(self, decisionNumber):
+        self._record(_ENTER_SUB_RULE, decisionNumber)
+
+    def exitSubRule(self, decisionNumber):
+        self._record(_EXIT_SUB_RULE, decisionNumber)
+
+    def enterDecision(self, decisionNumber, couldBacktrack):
+        self._record(_ENTER_DECISION, decisionNumber, 1 if couldBacktrack else 0)
+
+    def exitDecision(self, decisionNumber):
+        self._record(_EXIT_DECISION, decisionNumber)
+
+    def consumeToken(self, t):
+        self._record(_CONSUME_TOKEN, t.index, t.type, t.channel)
+
+    def consumeHiddenToken(self, t):
+        self._record(_CONSUME_HIDDEN_TOKEN, t.index, t.type, t.channel)
+
+    def LT(self, i, t):
+        if t is None:
+            self._record(_LT_TOKEN, i, -1)
+
+        elif isinstance(t, Token):
+            self._record(_LT_TOKEN, i, t.index, t.type, t.channel)
+
+        else:
+            # anything else is a node, which needn't be a Tree (e.g. the
+            # int handles of FlatTreeAdaptor)
+            self._record(_LT_NODE, i, self._nodeId(t), self.adaptor.getType(t))
+
+    def mark(self, marker):
+        self._record(_MARK, marker)
+
+    def rewind(self, marker=None):
+        if marker is None:
+            self._record(_REWIND, 0, 0)
+        else:
+            self._record(_REWIND, marker, 1)
+
+    def beginBacktrack(self, level):
+        self._record(_BEGIN_BACKTRACK, level)
+
+    def endBacktrack(self, level, successful):
+        self._record(_END_BACKTRACK, level, 1 if successful else 0)
+
+    def location(self, line, pos):
+        self._record(_LOCATION, line, pos)
+
+    def recognitionException(self, e):
+        self._record(
+            _RECOGNITION_EXCEPTION,
+            self._stringId(e.__class__.__name__),
+            -1 if e.index is None else e.index,
+            -1 if e.line is None else e.line,
+            -1 if e.charPositionInLine is None else e.charPositionInLine,
+        )
+
+    def beginResync(self):
+        self._record(_BEGIN_RESYNC)
+
+    def endResync(self):
+        self._record(_END_RESYNC)
+
+    def semanticPredicate(self, result, predicate):
+        self._record(_SEMANTIC_PREDICATE, 1 if result else 0, self._stringId(predicate))
+
+    def commence(self):
+        self._record(_COMMENCE)
+
+    def terminate(self):
+        self._record(_TERMINATE)
+
+    def consumeNode(self, t):
+        self._record(_CONSUME_NODE, self._nodeId(t), self.adaptor.getType(t))
+
+    def nilNode(self, t):
+        self._record(_NIL_NODE, self._nodeId(t), self.adaptor.getType(t))
+
+    def errorNode(self, t):
+        self._record(_ERROR_NODE, self._nodeId(t), self.adaptor.getType(t))
+
+    def createNode(self, node, token=None):
+        self._record(
+            _CREATE_NODE,
+            self._nodeId(node),
+            self.adaptor.getType(node),
+            -1 if token is None else token.index,
+        )
+
+    def becomeRoot(self, newRoot, oldRoot):
+        self._record(
+            _BECOME_ROOT,
+            self._nodeId(newRoot),
+            self._nodeId(oldRoot),
+        )
+
+    def addChild(self, root, child):
+        self._record(_ADD_CHILD, self._nodeId(root), self._nodeId(child))
+
+    def setTokenBoundaries(self, t, tokenStartIndex, tokenStopIndex):
+        self._record(
+            _SET_TOKEN_BOUNDARIES,
+            self._nodeId(t),
+            tokenStartIndex,
+            tokenStopIndex,
+        )
+
+
+class BinaryEventReplayer:
+    """
+    @brief Reads a log written by BinaryEventRecorder.
+
+    data is the log as bytes or a binary file.  events() yields the raw
+    records, replay() feeds them to a DebugEventListener.
+    """
+
+    def __init__(self, data, tokens=None):
+        if hasattr(data, "read"):
+            data = data.read()
+        self.data = memoryview(data)
+
+        if len(self.data) < _EVENT_LOG_HEADER.size:
+            raise ValueError("truncated event log")
+
+        magic, version = _EVENT_LOG_HEADER.unpack_from(self.data)
+        if magic != EVENT_LOG_MAGIC:
+            raise ValueError("not an event log")
+        if version != EVENT_LOG_VERSION:
+            raise ValueError("unsupported event log version {}".format(version))
+
+        # Tokens to pass to the listener, indexed by token index.  May be
+        # a list or a token stream.  Without them, tokens are rebuilt from
+        # the recorded index, type and channel (there is no text).
+        if hasattr(tokens, "getTokens"):
+            tokens = tokens.getTokens()
+        self.tokens = tokens
+
+    def events(self):
+        """
+        Yield an (event code, a, b, c, d) tuple for each event.  String ids
+        are not resolved, see strings.
+        """
+
+        data = self.data
+        size = _EVENT_RECORD.size
+        unpack = _EVENT_RECORD.unpack_from
+
+        self.strings = []
+        offset = _EVENT_LOG_HEADER.size
+        end = len(data)
+        while offset < end:
+            if offset + size > end:
+                raise ValueError("truncated event log")
+
+            record = unpack(data, offset)
+            offset += size
+
+            if record[0] == _STRING:
+                length = record[1]
+                if length < 0 or offset + length > end:
+                    raise ValueError("truncated event log")
+                self.strings.append(str(data[offset : offset + length], "utf-8"))
+                offset += length
+                continue
+
+            yield record
+
+    def _string(self, sid):
+        if sid == -1:
+            return None
+        return self.strings[sid]
+
+    def replay(self, listener):
+        """Call the listener method of every recorded event."""
+
+        tokenCache = {}
+        nodes = {}
+
+        def token(index, ttype, channel):
+            if index == -1:
+                return None
+
+            if self.tokens is not None and 0 <= index < len(self.tokens):
+                return self.tokens[index]
+
+            t = tokenCache.get(index)
+            if t is None:
+                t = CommonToken(type=ttype, channel=channel)
+                t.index = index
+                tokenCache[index] = t
+            return t
+
+        def node(nid, ttype=None):
+            n = nodes.get(nid)
+            if n is None:
+                n = nodes[nid] = CommonTree(CommonToken(type=ttype))
+            elif ttype is not None:
+                n.token.type = ttype
+            return n
+
+        for code, a, b, c, d in self.events():
+            if code == _CONSUME_TOKEN:
+                listener.consumeToken(token(a, b, c))
+            elif code == _LT_TOKEN:
+                listener.LT(a, token(b, c, d))
+            elif code == _ENTER_RULE:
+                listener.enterRule(self._string(a), self._string(b))
+            elif code == _EXIT_RULE:
+                listener.exitRule(self._string(a), self._string(b))
+            elif code == _ENTER_DECISION:
+                listener.enterDecision(a, bool(b))
+            elif code == _EXIT_DECISION:
+                listener.exitDecision(a)
+            elif code == _ENTER_ALT:
+                listener.enterAlt(a)
+            elif code == _ENTER_SUB_RULE:
+                listener.enterSubRule(a)
+            elif code == _EXIT_SUB_RULE:
+                listener.exitSubRule(a)
+            elif code == _CONSUME_HIDDEN_TOKEN:
+                listener.consumeHiddenToken(token(a, b, c))
+            elif code == _MARK:
+                listener.mark(a)
+            elif code == _REWIND:
+                if b:
+                    listener.rewind(a)
+                else:
+                    listener.rewind()
+            elif code == _BEGIN_BACKTRACK:
+                listener.beginBacktrack(a)
+            elif code == _END_BACKTRACK:
+                listener.endBacktrack(a, bool(b))
+            elif code == _LOCATION:
+                listener.location(a, b)
+            elif code == _RECOGNITION_EXCEPTION:
+                listener.recognitionException(self._exception(a, b, c, d))
+            elif code == _BEGIN_RESYNC:
+                listener.beginResync()
+            elif code == _END_RESYNC:
+                listener.endResync()
+            elif code == _SEMANTIC_PREDICATE:
+                listener.semanticPredicate(bool(a), self._string(b))
+            elif code == _COMMENCE:
+                listener.commence()
+            elif code == _TERMINATE:
+                listener.terminate()
+            elif code == _CONSUME_NODE:
+                listener.consumeNode(node(a, b))
+            elif code == _LT_NODE:
+                listener.LT(a, node(b, c))
+            elif code == _NIL_NODE:
+                listener.nilNode(node(a, b))
+            elif code == _ERROR_NODE:
+                listener.errorNode(node(a, b))
+            elif code == _CREATE_NODE:
+                if c == -1:
+                    listener.createNode(node(a, b))
+                else:
+                    listener.createNode(node(a, b), token(c, b, 0))
+            elif code == _BECOME_ROOT:
+                listener.becomeRoot(node(a), node(b))
+            elif code == _ADD_CHILD:
+                listener.addChild(node(a), node(b))
+            elif code == _SET_TOKEN_BOUNDARIES:
+                listener.setTokenBoundaries(node(a), b, c)
+            else:
+                raise ValueError("unknown event code {}".format(code))
+
+    def _exception(self, className, index, line, pos):
+        """Rebuild a recognition exception with its position fields set."""
+
+        cls = getattr(exceptions, self._string(className), None)
+        if not (isinstance(cls, type) and issubclass(cls, RecognitionException)):
+            cls = RecognitionException
+
+        e = cls.__new__(cls)
+        RecognitionException.__init__(e)
+        e.index = None if index == -1 else index
+        e.line = None if line == -1 else line
+        e.charPositionInLine = None if pos == -1 else pos
+        return e
+
+
 class DebugEventSocketProxy(DebugEventListener):
     """A proxy debug event listener that forwards events over a socket to
     a debugger (or any other listener) using a simple text-based protocol;
     one event per line.  ANTLRWorks listens on server socket with a
     RemoteDebugEventSocketListener instance.  These two objects must therefore
     be kept in sync.  New events must be handled on both sides of socket.
+
+    The debugger acknowledges every event with a line of its own.  By
+    default the proxy waits for that ack before the recognizer continues
+    (window = batchSize = 1), which lets the debugger stop the recognizer
+    after each event, but costs a network round trip per event.  Setting
+    window to N allows up to N events to be in flight before the proxy
+    waits for acks, and batchSize collects that many events before they
+    are written to the socket.  A debugger can then only pause the
+    recognizer some events after the fact, so use this for recording
+    traces of large inputs, not for single stepping.  Both can be set per
+    instance or on the class (for generated parsers, which create the
+    proxy themselves).
     """
 
     DEFAULT_DEBUGGER_PORT = 49100
 
-    def __init__(self, recognizer, adaptor=None, port=None, debug=None):
+    # Maximum number of events sent but not yet acknowledged.
+    window = 1
+
+    # Number of events buffered before they are sent.
+    batchSize = 1
+
+    def __init__(
+        self,
+        recognizer,
+        adaptor=None,
+        port=None,
+        debug=None,
+        window=None,
+        batchSize=None,
+    ):
         super().__init__()
 
         self.grammarFileName = recognizer.getGrammarFileName()
@@ -762,10 +1521,27 @@ class DebugEventSocketProxy(DebugEventListener):
 
         self.debug = debug
 
+        if window is not None:
+            self.window = window
+        if batchSize is not None:
+            self.batchSize = batchSize
+
+        if self.window < 1:
+            raise ValueError("window must be at least 1")
+        if self.batchSize < 1:
+            raise ValueError("batchSize must be at least 1")
+
         self.socket = None
         self.connection = None
-        self.input = None
-        self.output = None
+
+        # Encoded lines not yet sent, reused for all batches.
+        self._buffer = bytearray()
+        # Number of events in _buffer.
+        self._pending = 0
+        # Number of events sent, for which no ack was received yet.
+        self._unacked = 0
+        # Incomplete ack line received from the debugger.
+        self._ackBuffer = b""
 
     def log(self, msg):
         if self.debug:
@@ -787,25 +1563,71 @@ class DebugEventSocketProxy(DebugEventListener):
             self.connection.setblocking(1)
             self.connection.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
 
-            self.output = self.connection.makefile("w", 1)
-            self.input = self.connection.makefile("r", 1)
-
+            # the debugger acks both lines at once
             self.write(f"ANTLR {self.PROTOCOL_VERSION}")
             self.write(f'grammar "{self.grammarFileName}"')
-            self.ack()
+            self._pending += 1
+            self.sync()
 
     def write(self, msg):
-        self.log(f"> {msg}")
-        self.output.write(f"{msg}\n")
-        self.output.flush()
+        """Append a line to the send buffer, see flush()."""
+
+        if self.debug:
+            self.log("> " + msg)
+        self._buffer += (msg + "\n").encode("utf-8")
 
     def ack(self):
-        t = self.input.readline()
-        self.log(f"< {t.rstrip()}")
+        """
+        Read acks from the debugger.  Blocks until some data arrives and
+        returns the number of complete ack lines received.
+        """
+
+        data = self.connection.recv(4096)
+        if not data:
+            # debugger went away, the next send will fail
+            self._unacked = 0
+            return 0
+
+        lines = (self._ackBuffer + data).split(b"\n")
+        self._ackBuffer = lines.pop()
+        if self.debug:
+            for line in lines:
+                self.log("< " + line.decode("utf-8", "replace").rstrip())
+
+        self._unacked -= len(lines)
+        return len(lines)
+
+    def flush(self):
+        """
+        Send all buffered events, then wait for acks while window or more
+        events are unacknowledged.
+        """
+
+        if self._buffer:
+            self.connection.sendall(self._buffer)
+            del self._buffer[:]
+
+        self._unacked += self._pending
+        self._pending = 0
+
+        while self._unacked >= self.window:
+            self.ack()
+
+    def sync(self):
+        """Send all buffered events and wait until all of them are acked."""
+
+        self.flush()
+        while self._unacked > 0:
+            self.ack()
 
     def transmit(self, event):
-        self.write(event)
-        self.ack()
+        if self.debug:
+            self.log("> " + event)
+        self._buffer += (event + "\n").encode("utf-8")
+
+        self._pending += 1
+        if self._pending >= self.batchSize:
+            self.flush()
 
     def commence(self):
         # don't bother sending event; listener will trigger upon connection
@@ -813,8 +1635,7 @@ class DebugEventSocketProxy(DebugEventListener):
 
     def terminate(self):
         self.transmit("terminate")
-        self.output.close()
-        self.input.close()
+        self.sync()
         self.connection.close()
         self.socket.close()
 
@@ -1005,15 +1826,14 @@ class DebugEventSocketProxy(DebugEventListener):
         return self.adaptor
 
     def serializeToken(self, t):
-        buf = [
-            str(int(t.index)),
-            str(int(t.type)),
-            str(int(t.channel)),
-            str(int(t.line or 0)),
-            str(int(t.charPositionInLine or 0)),
-            '"' + self.escapeNewlines(t.text),
-        ]
-        return "\t".join(buf)
+        return '%d\t%d\t%d\t%d\t%d\t"%s' % (
+            t.index,
+            t.type,
+            t.channel,
+            t.line or 0,
+            t.charPositionInLine or 0,
+            self.escapeNewlines(t.text),
+        )
 
     def escapeNewlines(self, txt):
         if txt is None:
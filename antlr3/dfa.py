@@ -67,6 +67,9 @@ class DFA:
         self.special = special
         self.transition = transition
 
+    ## RecognizerCounters updated by predict(), see enableCounters()
+    counters = None
+
     def predict(self, input):
         """
         From the input stream, predict what alternative will succeed
@@ -75,9 +78,16 @@ class DFA:
         an exception upon error.
         """
         mark = input.mark()
+        counters = self.counters
+        if counters is not None:
+            counters.predictions += 1
+            counters._predictionDepth += 1
+
         s = 0  # we always start at s0
         try:
-            for _ in range(50000):
+            # every iteration but the last consumes one symbol, so steps is
+            # the number of symbols consumed so far
+            for steps in range(50000):
                 specialState = self.special[s]
                 if specialState >= 0:
                     s = self.specialStateTransition(specialState, input)
@@ -136,8 +146,28 @@ class DFA:
                 raise RuntimeError("DFA bang!")
 
         finally:
+            if counters is not None:
+                # syntactic predicates evaluated on the way count their own
+                # symbols, see BaseRecognizer._countingFragment()
+                counters.predictionSteps += steps
+                counters._predictionDepth -= 1
+
             input.rewind(mark)
 
+    def enableCounters(self, counters):
+        """
+        Count calls of predict() and the symbols consumed by it in the
+        RecognizerCounters object counters, see
+        BaseRecognizer.enableCounters().
+        """
+
+        self.counters = counters
+
+    def disableCounters(self):
+        """Stop counting, see enableCounters()."""
+
+        self.__dict__.pop("counters", None)
+
     def noViableAlt(self, s, input):
         if self.recognizer._state.backtracking > 0:
             raise BacktrackingFailed
@@ -32,7 +32,11 @@
 
 
 import argparse
+import gc
+import json
 import sys
+import time
+import tracemalloc
 
 from .streams import (
     ANTLRFileStream,
@@ -55,7 +59,13 @@ class _Main:
         argParser.add_argument("--interactive", "-i", action="store_true")
         argParser.add_argument("--no-output", action="store_true")
         argParser.add_argument("--profile", action="store_true")
-        argParser.add_argument("--hotshot", action="store_true")
+        argParser.add_argument(
+            "--profile-output", dest="profileOutput", default="profile.dat"
+        )
+        argParser.add_argument("--benchmark", action="store_true")
+        argParser.add_argument("--repeat", type=int, default=5)
+        argParser.add_argument("--warmup", type=int, default=1)
+        argParser.add_argument("--json", action="store_true")
         argParser.add_argument("--port", type=int)
         argParser.add_argument("--debug-socket", action="store_true")
         argParser.add_argument("file", nargs="?")
@@ -93,7 +103,10 @@ class _Main:
             else:
                 inStream = ANTLRInputStream(self.stdin)
 
-            if args.profile:
+            if args.benchmark:
+                self.benchmark(args, inStream)
+
+            elif args.profile:
                 try:
                     import cProfile as profile
                 except ImportError:
@@ -103,31 +116,124 @@ class _Main:
                     "self.parseStream(args, inStream)",
                     globals(),
                     locals(),
-                    "profile.dat",
+                    args.profileOutput,
                 )
 
                 import pstats
 
-                stats = pstats.Stats("profile.dat")
+                stats = pstats.Stats(args.profileOutput, stream=self.stdout)
                 stats.strip_dirs()
                 stats.sort_stats("time")
                 stats.print_stats(100)
 
-            elif args.hotshot:
-                import hotshot
-
-                profiler = hotshot.Profile("hotshot.dat")
-                profiler.runctx("self.parseStream(args, inStream)", globals(), locals())
-
             else:
                 self.parseStream(args, inStream)
 
+        self.tearDown(args)
+
     def setUp(self, args):
         pass
 
+    def tearDown(self, args):
+        pass
+
     def parseStream(self, args, inStream):
         raise NotImplementedError
 
+    def benchmarkStream(self, args, inStream, timings):
+        """
+        Process inStream once like parseStream(), but without output.  Add
+        the time spent in each phase (e.g. 'lex', 'parse', 'walk') to the
+        timings dict and return the number of tokens.
+        """
+
+        raise NotImplementedError
+
+    def benchmark(self, args, inStream):
+        """
+        @brief Time benchmarkStream() and write a report.
+
+        After args.warmup untimed runs, the input is processed args.repeat
+        times, recording the time of each phase.  A final run under
+        tracemalloc measures the peak memory use; it is not part of the
+        timings, as tracing slows everything down.
+        """
+
+        chars = inStream.size()
+        tokens = 0
+
+        for _ in range(args.warmup):
+            inStream.reset()
+            self.benchmarkStream(args, inStream, {})
+
+        runs = []
+        gcBefore = [stats["collections"] for stats in gc.get_stats()]
+        for _ in range(max(args.repeat, 1)):
+            inStream.reset()
+            timings = {}
+            start = time.perf_counter()
+            tokens = self.benchmarkStream(args, inStream, timings)
+            timings["total"] = time.perf_counter() - start
+            runs.append(timings)
+        gcAfter = [stats["collections"] for stats in gc.get_stats()]
+
+        inStream.reset()
+        tracemalloc.start()
+        try:
+            self.benchmarkStream(args, inStream, {})
+            _, peakMemory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        phases = {}
+        for name in runs[0]:
+            times = [timings[name] for timings in runs]
+            phases[name] = {
+                "min": min(times),
+                "mean": sum(times) / len(times),
+                "max": max(times),
+            }
+
+        best = phases["total"]["min"]
+        report = {
+            "repeat": len(runs),
+            "warmup": args.warmup,
+            "chars": chars,
+            "tokens": tokens,
+            "phases": phases,
+            "charsPerSecond": chars / best if best else None,
+            "tokensPerSecond": tokens / best if best else None,
+            "peakMemory": peakMemory,
+            "gcCollections": [b - a for a, b in zip(gcBefore, gcAfter)],
+        }
+
+        if args.json:
+            json.dump(report, self.stdout, indent=2)
+            self.stdout.write("\n")
+            return
+
+        self.stdout.write(
+            "{chars} chars, {tokens} tokens, best of {repeat} runs "
+            "({warmup} warmup)\n".format(**report)
+        )
+        for name, times in phases.items():
+            self.stdout.write(
+                "  {:<8} min {:.6f}s  mean {:.6f}s  max {:.6f}s\n".format(
+                    name, times["min"], times["mean"], times["max"]
+                )
+            )
+        if best:
+            self.stdout.write(
+                "  {:.0f} chars/s, {:.0f} tokens/s\n".format(
+                    report["charsPerSecond"], report["tokensPerSecond"]
+                )
+            )
+        self.stdout.write(
+            "  peak memory {} bytes, gc collections {}\n".format(
+                peakMemory, report["gcCollections"]
+            )
+        )
+
     def write(self, args, text):
         if not args.no_output:
             self.stdout.write(text)
@@ -135,6 +241,14 @@ class _Main:
     def writeln(self, args, text):
         self.write(args, text + "\n")
 
+    def writeTree(self, args, tree):
+        if not args.no_output:
+            if hasattr(tree, "writeStringTree"):
+                tree.writeStringTree(self.stdout)
+                self.stdout.write("\n")
+            else:
+                self.writeln(args, tree.toStringTree())
+
 
 class LexerMain(_Main):
     def __init__(self, lexerClass):
@@ -147,6 +261,15 @@ class LexerMain(_Main):
         for token in lexer:
             self.writeln(args, str(token))
 
+    def benchmarkStream(self, args, inStream, timings):
+        tokenStream = CommonTokenStream(self.lexerClass(inStream))
+
+        start = time.perf_counter()
+        tokenStream.fillBuffer()
+        timings["lex"] = time.perf_counter() - start
+
+        return len(tokenStream.getTokens() or [])
+
 
 class ParserMain(_Main):
     def __init__(self, lexerClassName, parserClass):
@@ -155,17 +278,33 @@ class ParserMain(_Main):
         self.lexerClassName = lexerClassName
         self.lexerClass = None
         self.parserClass = parserClass
+        self.cache = None
 
     def setupArgs(self, argParser):
         argParser.add_argument(
             "--lexer", dest="lexerClass", default=self.lexerClassName
         )
         argParser.add_argument("--rule", dest="parserRule")
+        argParser.add_argument("--cache-dir", dest="cacheDir")
+        argParser.add_argument("--cache-stats", action="store_true")
 
     def setUp(self, args):
         lexerMod = __import__(args.lexerClass)
         self.lexerClass = getattr(lexerMod, args.lexerClass)
 
+        if args.cacheDir and args.port is None and not args.debug_socket:
+            from .cache import ParseCache
+
+            self.cache = ParseCache(args.cacheDir)
+
+    def tearDown(self, args):
+        if self.cache is not None and args.cache_stats:
+            stats = self.cache.stats()
+            self.stderr.write(
+                "cache: {hits} hits, {misses} misses, {stores} stores, "
+                "{evictions} evictions\n".format(**stats)
+            )
+
     def parseStream(self, args, inStream):
         kwargs = {}
         if args.port is not None:
@@ -173,16 +312,53 @@ class ParserMain(_Main):
         if args.debug_socket:
             kwargs["debug_socket"] = sys.stderr
 
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                inStream.substring(0, inStream.size() - 1),
+                self.lexerClass,
+                self.parserClass,
+                args.parserRule,
+            )
+            cached = self.cache.get(key)
+            # entries stored by ParseCache.parse() may have no tree, parse
+            # those again to get the rule's output
+            if cached is not None and cached[1] is not None:
+                self.writeTree(args, cached[1])
+                return
+
         lexer = self.lexerClass(inStream)
         tokenStream = CommonTokenStream(lexer)
         parser = self.parserClass(tokenStream, **kwargs)
         result = getattr(parser, args.parserRule)()
         if result:
             if hasattr(result, "tree") and result.tree:
-                self.writeln(args, result.tree.toStringTree())
+                self.writeTree(args, result.tree)
+
+                if (
+                    key is not None
+                    and lexer.getNumberOfSyntaxErrors() == 0
+                    and parser.getNumberOfSyntaxErrors() == 0
+                ):
+                    self.cache.put(key, tokenStream.getTokens() or [], result.tree)
+
             else:
                 self.writeln(args, repr(result))
 
+    def benchmarkStream(self, args, inStream, timings):
+        tokenStream = CommonTokenStream(self.lexerClass(inStream))
+
+        start = time.perf_counter()
+        tokenStream.fillBuffer()
+        timings["lex"] = time.perf_counter() - start
+
+        parser = self.parserClass(tokenStream)
+        start = time.perf_counter()
+        getattr(parser, args.parserRule)()
+        timings["parse"] = time.perf_counter() - start
+
+        return len(tokenStream.getTokens() or [])
+
 
 class WalkerMain(_Main):
     def __init__(self, walkerClass):
@@ -217,6 +393,27 @@ class WalkerMain(_Main):
             result = getattr(walker, args.walkerRule)()
             if result:
                 if hasattr(result, "tree"):
-                    self.writeln(args, result.tree.toStringTree())
+                    self.writeTree(args, result.tree)
                 else:
                     self.writeln(args, repr(result))
+
+    def benchmarkStream(self, args, inStream, timings):
+        tokenStream = CommonTokenStream(self.lexerClass(inStream))
+
+        start = time.perf_counter()
+        tokenStream.fillBuffer()
+        timings["lex"] = time.perf_counter() - start
+
+        parser = self.parserClass(tokenStream)
+        start = time.perf_counter()
+        result = getattr(parser, args.parserRule)()
+        timings["parse"] = time.perf_counter() - start
+
+        nodeStream = CommonTreeNodeStream(result.tree)
+        nodeStream.setTokenStream(tokenStream)
+        walker = self.walkerClass(nodeStream)
+        start = time.perf_counter()
+        getattr(walker, args.walkerRule)()
+        timings["walk"] = time.perf_counter() - start
+
+        return len(tokenStream.getTokens() or [])
@@ -0,0 +1,229 @@
+""" @package antlr3.parallel
+@brief ANTLR3 runtime package, parallel module
+
+Lexing of a single large input on several processes.  The input is cut
+into chunks at boundaries where the lexer can safely restart (by default
+after a newline, which suits line oriented grammars), the chunks are
+lexed in a process pool and the tokens are merged into one
+CommonTokenStream, as if the input had been lexed in one go.
+
+"""
+
+# begin[licence]
+#
+# [The "BSD licence"]
+# Copyright (c) 2005-2012 Terence Parr
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. The name of the author may not be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# end[licence]
+
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from .streams import ANTLRStringStream, CommonTokenStream
+from .tokens import CommonToken
+
+
+def _lexChunk(lexerClass, text, line, charPositionInLine, channel, sourceName):
+    """
+    Lex one chunk in a worker.  Returns the token fields as int columns
+    (type, channel, start, stop, line, charPositionInLine), the text of
+    tokens with overridden text by position and the number of errors.
+    """
+
+    stream = ANTLRStringStream(text)
+    stream.name = sourceName
+    # line and column are relative to the start of the whole input, so
+    # tokens and error messages come out right
+    stream.line = line
+    stream.charPositionInLine = charPositionInLine
+
+    lexer = lexerClass(stream)
+    tokens = lexer.tokenize(channel)
+
+    columns = tuple(array("i") for _ in range(6))
+    types, channels, starts, stops, lines, positions = columns
+    texts = {}
+    for i, token in enumerate(tokens):
+        types.append(token.type)
+        channels.append(token.channel)
+        starts.append(token.start)
+        stops.append(token.stop)
+        lines.append(token.line)
+        positions.append(token.charPositionInLine)
+        if token._text is not None:
+            texts[i] = token._text
+
+    return columns, texts, lexer.getNumberOfSyntaxErrors()
+
+
+class ParallelLexer:
+    """
+    @brief Lex one input in chunks on a process pool.
+
+    This only works for grammars where the input can be split at points at
+    which the lexer is in its default state, e.g. at newlines of a log
+    file or a statement-per-line language.  Chunks end after the first
+    separator at or after every chunkSize chars.  For other rules pass
+    findBoundary, a callable (text, offset) that returns the index of the
+    first safe restart point at or after offset (or len(text)).  It is up
+    to the caller that no token and no lexer state spans a boundary,
+    otherwise the result differs from a serial lex.
+
+    lexerClass and the values it needs must be picklable, i.e. the class
+    must be defined at module level.  The tokens are rebuilt as
+    CommonTokens, so a lexer emitting other token classes loses them.
+    """
+
+    def __init__(
+        self,
+        lexerClass,
+        chunkSize=1024 * 1024,
+        separator="\n",
+        findBoundary=None,
+        processes=None,
+        executor=None,
+    ):
+        if chunkSize < 1:
+            raise ValueError("chunkSize must be positive")
+
+        self.lexerClass = lexerClass
+        self.chunkSize = chunkSize
+        self.separator = separator
+        self.findBoundary = findBoundary
+        self.processes = processes
+
+        # Any concurrent.futures executor, if None a ProcessPoolExecutor
+        # with the given number of processes is created for each call.
+        self.executor = executor
+
+    def chunks(self, text):
+        """Return the (start, stop) index pairs of the chunks of text."""
+
+        n = len(text)
+        chunks = []
+        start = 0
+        while start < n:
+            offset = start + self.chunkSize
+            if offset >= n:
+                end = n
+
+            elif self.findBoundary is not None:
+                end = self.findBoundary(text, offset)
+
+            else:
+                end = text.find(self.separator, offset)
+                if end == -1:
+                    end = n
+                else:
+                    end += len(self.separator)
+
+            end = min(max(end, start + 1), n)
+            chunks.append((start, end))
+            start = end
+
+        return chunks
+
+    def tokenize(self, inStream, channel=None):
+        """
+        @brief Lex inStream and return a filled CommonTokenStream.
+
+        inStream may be an ANTLRStringStream or a string.  The tokens
+        reference inStream and have the index, start, stop, line and
+        charPositionInLine values of a serial lex, see Lexer.tokenize()
+        for channel.  The token source of the returned stream is a
+        lexerClass instance positioned at the end of inStream, its
+        getNumberOfSyntaxErrors() is the total over all chunks.
+        """
+
+        if isinstance(inStream, str):
+            inStream = ANTLRStringStream(inStream)
+
+        text = inStream.strdata
+        sourceName = inStream.getSourceName()
+
+        chunks = self.chunks(text)
+        jobs = []
+        line = 1
+        lineStart = 0
+        previous = 0
+        for start, end in chunks:
+            line += text.count("\n", previous, start)
+            newline = text.rfind("\n", previous, start)
+            if newline != -1:
+                lineStart = newline + 1
+            previous = start
+
+            jobs.append(
+                (
+                    self.lexerClass,
+                    text[start:end],
+                    line,
+                    start - lineStart,
+                    channel,
+                    sourceName,
+                )
+            )
+
+        if len(jobs) <= 1:
+            results = [_lexChunk(*job) for job in jobs]
+
+        elif self.executor is not None:
+            results = list(self.executor.map(_lexChunk, *zip(*jobs)))
+
+        else:
+            with ProcessPoolExecutor(self.processes) as executor:
+                results = list(executor.map(_lexChunk, *zip(*jobs)))
+
+        tokens = []
+        errors = 0
+        for (start, _), (columns, texts, chunkErrors) in zip(chunks, results):
+            types, channels, starts, stops, lines, positions = columns
+            base = len(tokens)
+            for i in range(len(types)):
+                token = CommonToken(
+                    types[i],
+                    channels[i],
+                    texts.get(i),
+                    inStream,
+                    starts[i] + start,
+                    stops[i] + start,
+                )
+                token.line = lines[i]
+                token.charPositionInLine = positions[i]
+                token.index = base + i
+                tokens.append(token)
+
+            errors += chunkErrors
+
+        inStream.seek(inStream.size())
+        lexer = self.lexerClass(inStream)
+        lexer._state.syntaxErrors = errors
+
+        stream = CommonTokenStream(lexer)
+        stream.tokens = tokens
+        stream.p = stream.skipOffTokenChannels(0)
+        return stream
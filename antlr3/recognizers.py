@@ -31,6 +31,7 @@
 # end[licence]
 
 import inspect
+import re
 import sys
 
 from .constants import (
@@ -41,6 +42,7 @@ from .constants import (
     INVALID_TOKEN_TYPE,
     compatible_api_versions,
 )
+from .dfa import DFA
 from .exceptions import (
     BacktrackingFailed,
     EarlyExitException,
@@ -55,6 +57,7 @@ from .exceptions import (
     RecognitionException,
     UnwantedTokenException,
 )
+from .streams import ANTLRStringStream, CommonTokenStream
 from .tokens import SKIP_TOKEN, CommonToken
 
 
@@ -133,6 +136,72 @@ class RecognizerSharedState:
         # the input char buffer.  Use setText() or can set this instance var.
         self.text = None
 
+        ## RecognizerCounters of all recognizers sharing this state, if
+        # enabled.  See BaseRecognizer.enableCounters().
+        self.counters = None
+
+
+class RecognizerCounters:
+    """
+    @brief Counts the work done by recognizers.
+
+    tokens              tokens matched by a parser or tree parser, tokens
+                        returned by a lexer (not counting EOF)
+    predictions         calls of DFA.predict()
+    predictionSteps     symbols consumed by DFA.predict() before it rewinds,
+                        including the ones consumed by syntactic
+                        predicates evaluated during prediction
+    backtracks          syntactic predicates evaluated
+    backtrackFailures   syntactic predicates that did not match
+    memoHits            rule invocations answered by the memo table
+    memoMisses          rule invocations not found in the memo table
+    exceptions          recognition exceptions reported
+    recoveries          error recoveries (resync or single token
+                        insertion/deletion)
+
+    All counters are plain ints.  See BaseRecognizer.enableCounters().
+    """
+
+    fields = (
+        "tokens",
+        "predictions",
+        "predictionSteps",
+        "backtracks",
+        "backtrackFailures",
+        "memoHits",
+        "memoMisses",
+        "exceptions",
+        "recoveries",
+    )
+
+    def __init__(self):
+        self.reset()
+
+        # number of DFA.predict() calls in progress
+        self._predictionDepth = 0
+
+    def reset(self):
+        """Set all counters to zero."""
+
+        for name in self.fields:
+            setattr(self, name, 0)
+
+    def toDict(self):
+        """Return a dict of all counters."""
+
+        return {name: getattr(self, name) for name in self.fields}
+
+    def __repr__(self):
+        return "{}({})".format(
+            self.__class__.__name__,
+            ", ".join("{}={}".format(k, v) for k, v in self.toDict().items()),
+        )
+
+
+# Names of the methods generated for syntactic predicates and the
+# synpredN_Grammar_fragment methods they call.
+_synpredName = re.compile(r"synpred\d+_\w+$")
+
 
 class BaseRecognizer:
     """
@@ -830,6 +899,162 @@ class BaseRecognizer:
 
         return rules
 
+    def enableCounters(self, counters=None):
+        """
+        @brief Count the work done by this recognizer.
+
+        Returns the RecognizerCounters object that is updated from now on,
+        counters or a new one.  It is stored in the shared state, so pass
+        it to the delegates of a composite grammar, too.  Read (and reset)
+        it between parses.
+
+        Counting is done by wrappers around match(), reportError(),
+        recover(), alreadyParsedRule() and the syntactic predicates, which
+        are installed on this recognizer as instance attributes, and by
+        DFA.predict() itself.  Symbols consumed by syntactic predicates
+        are counted from the input's index(), so literals skipped over by
+        Lexer.match() count, too.
+        """
+
+        if counters is None:
+            counters = RecognizerCounters()
+
+        self.disableCounters()
+        self._state.counters = counters
+
+        for name, hook in self._counterHooks(counters).items():
+            setattr(self, name, hook)
+
+        for value in list(vars(self).values()):
+            if isinstance(value, DFA):
+                value.enableCounters(counters)
+
+        return counters
+
+    def disableCounters(self):
+        """Remove the counting wrappers installed by enableCounters()."""
+
+        counters = self._state.counters
+        if counters is None:
+            return
+
+        for name in self._counterHooks(counters):
+            self.__dict__.pop(name, None)
+
+        for value in list(vars(self).values()):
+            if isinstance(value, DFA):
+                value.disableCounters()
+
+        self._state.counters = None
+
+    def getCounters(self):
+        """Return the RecognizerCounters if enabled, else None."""
+
+        return self._state.counters
+
+    def _counterHooks(self, counters):
+        """Return a dict of method name -> counting wrapper."""
+
+        cls = self.__class__
+        hooks = {}
+
+        def match(*args):
+            matchedSymbol = cls.match(self, *args)
+            counters.tokens += 1
+            return matchedSymbol
+
+        def matchAny(*args):
+            cls.matchAny(self, *args)
+            counters.tokens += 1
+
+        def recoverFromMismatchedToken(*args):
+            matchedSymbol = cls.recoverFromMismatchedToken(self, *args)
+            counters.recoveries += 1
+            return matchedSymbol
+
+        hooks["match"] = match
+        hooks["matchAny"] = matchAny
+        hooks["recoverFromMismatchedToken"] = recoverFromMismatchedToken
+        hooks.update(self._commonCounterHooks(counters))
+        return hooks
+
+    def _commonCounterHooks(self, counters):
+        """The counting wrappers shared by all kinds of recognizers."""
+
+        cls = self.__class__
+        hooks = {}
+
+        def reportError(*args):
+            counters.exceptions += 1
+            cls.reportError(self, *args)
+
+        def recover(*args):
+            counters.recoveries += 1
+            cls.recover(self, *args)
+
+        def alreadyParsedRule(*args):
+            try:
+                parsed = cls.alreadyParsedRule(self, *args)
+            except BacktrackingFailed:
+                # memo says the rule failed here before
+                counters.memoHits += 1
+                raise
+
+            if parsed:
+                counters.memoHits += 1
+            else:
+                counters.memoMisses += 1
+            return parsed
+
+        hooks["reportError"] = reportError
+        hooks["recover"] = recover
+        hooks["alreadyParsedRule"] = alreadyParsedRule
+
+        for name in dir(cls):
+            if not _synpredName.match(name):
+                continue
+
+            if name.endswith("_fragment"):
+                hooks[name] = self._countingFragment(getattr(cls, name), counters)
+            else:
+                hooks[name] = self._countingSynpred(getattr(cls, name), counters)
+
+        return hooks
+
+    def _countingSynpred(self, synpred, counters):
+        def countingSynpred():
+            counters.backtracks += 1
+            success = synpred(self)
+            if not success:
+                counters.backtrackFailures += 1
+            return success
+
+        return countingSynpred
+
+    def _countingFragment(self, fragment, counters):
+        def countingFragment():
+            if counters._predictionDepth == 0:
+                return fragment(self)
+
+            # evaluated during a prediction: count the symbols consumed
+            # before the syntactic predicate rewinds
+            input = self.input
+            start = input.index()
+            try:
+                return fragment(self)
+            finally:
+                end = input.index()
+                if isinstance(input, CommonTokenStream):
+                    # off-channel tokens are skipped, not consumed
+                    channel = input.channel
+                    counters.predictionSteps += sum(
+                        1 for t in input.tokens[start:end] if t.channel == channel
+                    )
+                else:
+                    counters.predictionSteps += end - start
+
+        return countingFragment
+
     def getBacktrackingLevel(self):
         return self._state.backtracking
 
@@ -1004,6 +1229,19 @@ class Lexer(BaseRecognizer, TokenSource):
         # Where is the lexer drawing characters from?
         self.input = input
 
+        # Maps token text to a shared string, if text interning is enabled.
+        self.internTable = None
+
+    def setTextInterning(self, enable=True):
+        """
+        Copy the text into each emitted token, sharing one string for all
+        tokens with equal text.  Reading the text of such a token costs no
+        substring operation, and identifiers and keywords that occur many
+        times are only stored once.
+        """
+
+        self.internTable = {} if enable else None
+
     def reset(self):
         super().reset()  # reset all recognizer state variables
 
@@ -1071,6 +1309,131 @@ class Lexer(BaseRecognizer, TokenSource):
                 self.reportError(re)
                 # match() routine has already called recover()
 
+    def tokenize(self, channel=None):
+        """
+        @brief Return a list of all remaining tokens, without EOF.
+
+        See tokenizeInto().
+        """
+
+        tokens = []
+        self.tokenizeInto(tokens, channel)
+        return tokens
+
+    def tokenizeInto(self, buffer, channel=None):
+        """
+        @brief Append all remaining tokens to buffer.
+
+        This is the nextToken() loop run to the end of the input, with the
+        lookups hoisted out of it.  No token objects are created for
+        skipped tokens and, if channel is not None, for tokens emitted on
+        any other channel.  Each appended token gets its position in buffer
+        as index; the EOF token is not appended.
+
+        buffer may be any object with append() and __len__().  Returns the
+        number of tokens appended.
+        """
+
+        start = len(buffer)
+        append = buffer.append
+
+        if "nextToken" in vars(self) or type(self).nextToken is not Lexer.nextToken:
+            # nextToken() is overridden or hooked (e.g. by enableCounters()),
+            # so it has to see every token.
+            index = start
+            for token in self:
+                if channel is None or token.channel == channel:
+                    token.index = index
+                    append(token)
+                    index += 1
+            return index - start
+
+        state = self._state
+        input = self.input
+        LA = input.LA
+        charIndex = input.index
+        mTokens = self.mTokens
+        reportError = self.reportError
+        # the default emit() is inlined unless it is overridden or would
+        # intern the text
+        emit = None
+        if (
+            "emit" in vars(self)
+            or type(self).emit is not Lexer.emit
+            or self.internTable is not None
+        ):
+            emit = self.emit
+
+        index = start
+        while LA(1) != EOF:
+            state.token = None
+            state.channel = DEFAULT_CHANNEL
+            tokenStart = state.tokenStartCharIndex = charIndex()
+            state.tokenStartCharPositionInLine = input.charPositionInLine
+            state.tokenStartLine = input.line
+            state.text = None
+
+            try:
+                mTokens()
+
+            except NoViableAltException as re:
+                reportError(re)
+                self.recover(re)  # throw out current char and try again
+                continue
+
+            except RecognitionException as re:
+                reportError(re)
+                # match() routine has already called recover()
+                continue
+
+            token = state.token
+            if token is None:
+                if emit is not None:
+                    token = emit()
+                    if channel is not None and token.channel != channel:
+                        continue
+
+                elif channel is not None and state.channel != channel:
+                    continue
+
+                else:
+                    token = CommonToken(
+                        state.type,
+                        state.channel,
+                        state.text,
+                        input,
+                        tokenStart,
+                        charIndex() - 1,
+                    )
+                    token.line = state.tokenStartLine
+                    token.charPositionInLine = state.tokenStartCharPositionInLine
+                    state.token = token
+
+            elif token is SKIP_TOKEN:
+                continue
+
+            elif channel is not None and token.channel != channel:
+                continue
+
+            token.index = index
+            append(token)
+            index += 1
+
+        return index - start
+
+    def _counterHooks(self, counters):
+        cls = self.__class__
+
+        def nextToken():
+            token = cls.nextToken(self)
+            if token.type != EOF:
+                counters.tokens += 1
+            return token
+
+        hooks = self._commonCounterHooks(counters)
+        hooks["nextToken"] = nextToken
+        return hooks
+
     def skip(self):
         """
         Instruct the lexer to skip creating a token for current lexer rule
@@ -1121,12 +1484,30 @@ class Lexer(BaseRecognizer, TokenSource):
             token.text = self._state.text
             token.charPositionInLine = self._state.tokenStartCharPositionInLine
 
+            if self.internTable is not None:
+                text = self.text
+                token.text = self.internTable.setdefault(text, text)
+
         self._state.token = token
 
         return token
 
     def match(self, s):
         if isinstance(s, str):
+            input = self.input
+            # Plain string streams can compare the whole literal against
+            # their buffer and skip ahead, line and column follow from p.
+            # On a mismatch the loop below consumes the matching prefix and
+            # fails at the same char as before.
+            cls = type(input)
+            if (
+                cls.LA is ANTLRStringStream.LA
+                and cls.consume is ANTLRStringStream.consume
+                and input.strdata.startswith(s, input.p)
+            ):
+                input.p += len(s)
+                return
+
             for c in s:
                 if self.input.LA(1) != ord(c):
                     if self._state.backtracking > 0:
@@ -1205,6 +1586,7 @@ class Lexer(BaseRecognizer, TokenSource):
         ##
         ## self.errorRecovery = True
 
+        self._state.syntaxErrors += 1
         self.displayRecognitionError(e)
 
     def getErrorMessage(self, e):
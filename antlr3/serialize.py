@@ -0,0 +1,370 @@
+""" @package antlr3.serialize
+@brief ANTLR3 runtime package, serialize module
+
+A compact binary format for token lists and ASTs, so parse results can be
+stored and shipped between processes without pickling the object graph
+(which would also drag the complete char stream along via Token.input).
+
+"""
+
+# begin[licence]
+#
+# [The "BSD licence"]
+# Copyright (c) 2005-2012 Terence Parr
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. The name of the author may not be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# end[licence]
+
+import struct
+import sys
+from array import array
+
+from .constants import INVALID_TOKEN_TYPE
+from .tokens import CommonToken
+from .tree import CommonTreeAdaptor
+
+############################################################################
+#
+# File layout (all integers are little endian)
+#
+#   header        magic, version, flags, string count, token count,
+#                 stream token count, node count
+#   strings       int32 byte length per string, then the UTF-8 bytes
+#   tokens        one int32 column each for type, channel, start, stop,
+#                 line, charPositionInLine, index and text (a string
+#                 table index or -1)
+#   tree          one int32 column each for type, token (a token table
+#                 index or -1 for nil nodes), child count, token start
+#                 index and token stop index, nodes in preorder
+#
+# The first 'stream token count' entries of the token table are the
+# tokens passed to dump(), the remaining ones are imaginary tokens that
+# are only referenced from the tree.  A node count of 0 means no tree was
+# stored.
+#
+############################################################################
+
+MAGIC = b"A3PR"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIIII")
+_TOKEN_COLUMNS = 8
+_NODE_COLUMNS = 5
+_SWAP = sys.byteorder == "big"
+
+
+def _int(value):
+    if value is None:
+        return -1
+    return value
+
+
+def _pack(column):
+    if _SWAP:
+        column = array("i", column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _unpack(data, offset, count):
+    end = offset + 4 * count
+    if end > len(data):
+        raise ValueError("truncated data")
+
+    column = array("i")
+    column.frombytes(data[offset:end])
+    if _SWAP:
+        column.byteswap()
+    return column, end
+
+
+def dumps(tree=None, tokens=(), adaptor=None):
+    """
+    @brief Serialize a tree and/or a list of tokens to bytes.
+
+    tokens may be a list of tokens or a CommonTokenStream, in which case
+    all tokens of the stream are stored.  The tree is navigated using
+    adaptor (default CommonTreeAdaptor).  Token text is copied into the
+    output, so the result does not depend on the char stream.
+    """
+
+    if adaptor is None:
+        adaptor = CommonTreeAdaptor()
+
+    if hasattr(tokens, "getTokens"):
+        tokens = tokens.getTokens() or []
+
+    tokenList = list(tokens)
+    streamTokenCount = len(tokenList)
+    tokenRefs = {id(token): i for i, token in enumerate(tokenList)}
+
+    # preorder walk over the tree, collecting node columns
+    nodeTypes = array("i")
+    nodeTokens = array("i")
+    childCounts = array("i")
+    startIndexes = array("i")
+    stopIndexes = array("i")
+
+    if tree is not None:
+        work = [tree]
+        while work:
+            t = work.pop()
+            token = adaptor.getToken(t)
+            if token is None:
+                if adaptor.isNil(t):
+                    if nodeTypes:
+                        # adding it to a parent would flatten it, so it
+                        # couldn't be rebuilt as stored
+                        raise ValueError("nested nil node")
+                    ref = -1
+
+                else:
+                    # e.g. an error node, keep its type and text
+                    token = CommonToken(
+                        type=adaptor.getType(t), text=adaptor.getText(t)
+                    )
+
+            if token is not None:
+                ref = tokenRefs.get(id(token))
+                if ref is None:
+                    ref = len(tokenList)
+                    tokenRefs[id(token)] = ref
+                    tokenList.append(token)
+
+            n = adaptor.getChildCount(t)
+            nodeTypes.append(_int(adaptor.getType(t)))
+            nodeTokens.append(ref)
+            childCounts.append(n)
+            startIndexes.append(_int(adaptor.getTokenStartIndex(t)))
+            stopIndexes.append(_int(adaptor.getTokenStopIndex(t)))
+
+            for i in range(n - 1, -1, -1):
+                work.append(adaptor.getChild(t, i))
+
+    # token columns and the string table
+    strings = {}
+    textRefs = array("i")
+    for token in tokenList:
+        text = token.text
+        if text is None:
+            textRefs.append(-1)
+        else:
+            textRefs.append(strings.setdefault(text, len(strings)))
+
+    encoded = [text.encode("utf-8") for text in strings]
+    tokenTypes = array("i", [token.type for token in tokenList])
+    for i, ttype in enumerate(tokenTypes):
+        if ttype is None:
+            tokenTypes[i] = INVALID_TOKEN_TYPE
+
+    parts = [
+        _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            0,
+            len(encoded),
+            len(tokenList),
+            streamTokenCount,
+            len(nodeTypes),
+        ),
+        _pack(array("i", [len(b) for b in encoded])),
+        b"".join(encoded),
+        _pack(tokenTypes),
+        _pack(array("i", [_int(token.channel) for token in tokenList])),
+        _pack(array("i", [_int(getattr(token, "start", None)) for token in tokenList])),
+        _pack(array("i", [_int(getattr(token, "stop", None)) for token in tokenList])),
+        _pack(array("i", [_int(token.line) for token in tokenList])),
+        _pack(array("i", [_int(token.charPositionInLine) for token in tokenList])),
+        _pack(array("i", [_int(token.index) for token in tokenList])),
+        _pack(textRefs),
+        _pack(nodeTypes),
+        _pack(nodeTokens),
+        _pack(childCounts),
+        _pack(startIndexes),
+        _pack(stopIndexes),
+    ]
+
+    return b"".join(parts)
+
+
+def dump(out, tree=None, tokens=(), adaptor=None):
+    """Serialize a tree and/or a list of tokens to the binary file out."""
+
+    out.write(dumps(tree, tokens, adaptor))
+
+
+def loads(data, adaptor=None):
+    """
+    @brief Deserialize the output of dumps().
+
+    Returns a (tokens, tree) tuple.  tokens is the list of tokens that was
+    passed to dumps(), rebuilt as CommonTokens with their text set and no
+    input stream.  tree is built using adaptor (default CommonTreeAdaptor)
+    or None if no tree was stored.  Pass a FlatTreeAdaptor to load the tree
+    into its arena, in which case tree is the handle of the root node.
+    """
+
+    data = memoryview(data)
+    if len(data) < _HEADER.size:
+        raise ValueError("truncated data")
+
+    (
+        magic,
+        version,
+        flags,
+        stringCount,
+        tokenCount,
+        streamTokenCount,
+        nodeCount,
+    ) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a serialized parse result")
+
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported format version {}".format(version))
+
+    if streamTokenCount > tokenCount:
+        raise ValueError("corrupt token table")
+
+    offset = _HEADER.size
+
+    # string table
+    lengths, offset = _unpack(data, offset, stringCount)
+    strings = []
+    for length in lengths:
+        end = offset + length
+        if length < 0 or end > len(data):
+            raise ValueError("truncated data")
+        strings.append(str(data[offset:end], "utf-8"))
+        offset = end
+
+    # token table
+    columns = []
+    for _ in range(_TOKEN_COLUMNS):
+        column, offset = _unpack(data, offset, tokenCount)
+        columns.append(column)
+
+    tokenList = []
+    for ttype, channel, start, stop, line, pos, index, text in zip(*columns):
+        token = CommonToken(
+            type=ttype,
+            channel=channel,
+            text=strings[text] if text != -1 else None,
+            start=start if start != -1 else None,
+            stop=stop if stop != -1 else None,
+        )
+        token.line = line
+        token.charPositionInLine = pos
+        token.index = index
+        tokenList.append(token)
+
+    # tree
+    columns = []
+    for _ in range(_NODE_COLUMNS):
+        column, offset = _unpack(data, offset, nodeCount)
+        columns.append(column)
+
+    if offset != len(data):
+        raise ValueError("trailing data")
+
+    tree = None
+    if nodeCount > 0:
+        if adaptor is None:
+            adaptor = CommonTreeAdaptor()
+
+        tree = _buildTree(adaptor, tokenList, *columns)
+
+    return tokenList[:streamTokenCount], tree
+
+
+def load(inp, adaptor=None):
+    """Deserialize a (tokens, tree) tuple from the binary file inp."""
+
+    return loads(inp.read(), adaptor)
+
+
+def _buildTree(adaptor, tokens, types, tokenRefs, childCounts, starts, stops):
+    root = None
+    # stack of [node, number of children still to read]
+    stack = []
+    for ttype, ref, n, start, stop in zip(types, tokenRefs, childCounts, starts, stops):
+        if ref == -1:
+            if stack or root is not None:
+                raise ValueError("corrupt tree encoding")
+            node = adaptor.nil()
+
+        else:
+            try:
+                token = tokens[ref]
+            except IndexError:
+                raise ValueError("corrupt token reference") from None
+
+            node = adaptor.createWithPayload(token)
+
+        if ttype != -1 and adaptor.getType(node) != ttype:
+            try:
+                adaptor.setType(node, ttype)
+            except (RuntimeError, NotImplementedError):
+                # the adaptor takes the type from the token
+                token = CommonToken(oldToken=adaptor.getToken(node))
+                token.type = ttype
+                node = adaptor.createWithPayload(token)
+
+        if start != -1 or stop != -1:
+            adaptor.setTokenBoundaries(
+                node, _boundaryToken(tokens, start), _boundaryToken(tokens, stop)
+            )
+
+        if stack:
+            frame = stack[-1]
+            adaptor.addChild(frame[0], node)
+            frame[1] -= 1
+            if frame[1] == 0:
+                stack.pop()
+
+        elif root is None:
+            root = node
+
+        else:
+            raise ValueError("corrupt tree encoding")
+
+        if n > 0:
+            stack.append([node, n])
+
+    if stack:
+        raise ValueError("corrupt tree encoding")
+
+    return root
+
+
+def _boundaryToken(tokens, index):
+    """Return a token with the given index for setTokenBoundaries()."""
+
+    if 0 <= index < len(tokens) and tokens[index].index == index:
+        return tokens[index]
+
+    token = CommonToken()
+    token.index = index
+    return token
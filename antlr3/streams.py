@@ -30,6 +30,7 @@
 #
 # end[licence]
 
+from bisect import bisect_left
 from io import StringIO
 
 from .constants import DEFAULT_CHANNEL, EOF
@@ -339,9 +340,23 @@ class ANTLRStringStream(CharStream):
         # 0..n-1 index into string of next char
         self.p = 0
 
-        # A list of CharStreamState objects that tracks the stream state
-        # values line, charPositionInLine, and p that can change as you
-        # move through the input stream.  Indexed from 0..markDepth-1.
+        # Sorted offsets of all '\n' characters, built on first use.  line
+        # and charPositionInLine are computed from p with a binary search,
+        # so consume() and seek() don't need to track them.
+        self._newlines = None
+        # (index, result) of the last _lineAt() call
+        self._lastLineAt = (-1, None)
+
+        # Adjustments made by assigning line or charPositionInLine.  The
+        # column adjustment only applies to the line starting at
+        # _columnLineStart.
+        self._lineDelta = 0
+        self._columnDelta = 0
+        self._columnLineStart = -1
+
+        # A list of (p, _lineDelta, _columnDelta, _columnLineStart) tuples
+        # that tracks the stream state that can change as you move through
+        # the input stream.  Indexed from 0..markDepth-1.
         self._markers = []
         self.lastMarker = None
         self.markDepth = 0
@@ -357,20 +372,71 @@ class ANTLRStringStream(CharStream):
         """
 
         self.p = 0
-        self._line = 1
-        self.charPositionInLine = 0
+        self._lineDelta = 0
+        self._columnDelta = 0
+        self._columnLineStart = -1
         self._markers = []
         self.lastMarker = None
         self.markDepth = 0
 
+    def _lineAt(self, index):
+        """
+        Return the number of newlines before index (the 0-based line
+        number) and the index of the first char of that line.
+        """
+
+        # line and charPositionInLine are usually read together
+        if index == self._lastLineAt[0]:
+            return self._lastLineAt[1]
+
+        newlines = self._newlines
+        if newlines is None:
+            newlines = self._newlines = []
+            find = self.strdata.find
+            i = find("\n")
+            while i != -1:
+                newlines.append(i)
+                i = find("\n", i + 1)
+
+        lineIndex = bisect_left(newlines, index)
+        if lineIndex == 0:
+            result = (0, 0)
+        else:
+            result = (lineIndex, newlines[lineIndex - 1] + 1)
+
+        self._lastLineAt = (index, result)
+        return result
+
+    @property
+    def line(self):
+        """ANTLR tracks the line information automatically"""
+        return self._lineAt(self.p)[0] + 1 + self._lineDelta
+
+    @line.setter
+    def line(self, value):
+        """
+        Because this stream can rewind, we need to be able to reset the line
+        """
+        self._lineDelta = value - self._lineAt(self.p)[0] - 1
+
+    @property
+    def charPositionInLine(self):
+        """
+        The index of the character relative to the beginning of the line 0..n-1
+        """
+        lineStart = self._lineAt(self.p)[1]
+        if lineStart == self._columnLineStart:
+            return self.p - lineStart + self._columnDelta
+        return self.p - lineStart
+
+    @charPositionInLine.setter
+    def charPositionInLine(self, pos):
+        lineStart = self._lineAt(self.p)[1]
+        self._columnLineStart = lineStart
+        self._columnDelta = pos - (self.p - lineStart)
+
     def consume(self):
         if self.p < self.n:
-            if self.data[self.p] == 10:  # ord('\n')
-                self._line += 1
-                self.charPositionInLine = 0
-            else:
-                self.charPositionInLine += 1
-
             self.p += 1
 
         # else we reached EOF
@@ -413,7 +479,7 @@ class ANTLRStringStream(CharStream):
         return self.n
 
     def mark(self):
-        state = (self.p, self.line, self.charPositionInLine)
+        state = (self.p, self._lineDelta, self._columnDelta, self._columnLineStart)
         if self.markDepth < len(self._markers):
             self._markers[self.markDepth] = state
         else:
@@ -428,11 +494,12 @@ class ANTLRStringStream(CharStream):
         if marker is None:
             marker = self.lastMarker
 
-        p, line, charPositionInLine = self._markers[marker - 1]
-
-        self.seek(p)
-        self._line = line
-        self.charPositionInLine = charPositionInLine
+        (
+            self.p,
+            self._lineDelta,
+            self._columnDelta,
+            self._columnLineStart,
+        ) = self._markers[marker - 1]
         self.release(marker)
 
     def release(self, marker=None):
@@ -443,17 +510,11 @@ class ANTLRStringStream(CharStream):
 
     def seek(self, index):
         """
-        consume() ahead until p==index; can't just set p=index as we must
-        update line and charPositionInLine.
+        Set p to index (at most n).  line and charPositionInLine follow, as
+        they are computed from p.
         """
 
-        if index <= self.p:
-            self.p = index  # just jump; don't update stream state (line, ...)
-            return
-
-        # seek forward, consume until p hits index
-        while self.p < index:
-            self.consume()
+        self.p = min(index, self.n)
 
     def substring(self, start, stop):
         return self.strdata[start : stop + 1]
@@ -461,6 +522,44 @@ class ANTLRStringStream(CharStream):
     def getSourceName(self):
         return self.name
 
+    def applyEdit(self, start, end, newText):
+        """
+        @brief Replace the chars start..end-1 with newText.
+
+        The newline index is patched instead of rebuilt.  p is clamped to
+        the new size, marks are dropped.
+        """
+
+        if not 0 <= start <= end <= self.n:
+            raise ValueError("invalid edit range {}..{}".format(start, end))
+
+        delta = len(newText) - (end - start)
+
+        newlines = self._newlines
+        if newlines is not None:
+            first = bisect_left(newlines, start)
+            last = bisect_left(newlines, end, first)
+            added = []
+            i = newText.find("\n")
+            while i != -1:
+                added.append(start + i)
+                i = newText.find("\n", i + 1)
+            if delta:
+                added.extend(i + delta for i in newlines[last:])
+                newlines[first:] = added
+            else:
+                newlines[first:last] = added
+        self._lastLineAt = (-1, None)
+
+        self.strdata = self.strdata[:start] + newText + self.strdata[end:]
+        self.data[start:end] = [ord(c) for c in newText]
+        self.n = len(self.strdata)
+
+        self.p = min(self.p, self.n)
+        self._markers = []
+        self.lastMarker = None
+        self.markDepth = 0
+
 
 class ANTLRFileStream(ANTLRStringStream):
     """
@@ -578,7 +677,17 @@ class CommonTokenStream(TokenStream):
         # how deep have we gone?
         self._range = -1
 
+        # EOF token and source name of a detached stream, see detach()
+        self._eofToken = None
+        self._sourceName = None
+
+        # Maps token text to a shared string, if text interning is enabled.
+        self.internTable = None
+
     def makeEOFToken(self):
+        if self.tokenSource is None and self._eofToken is not None:
+            return self._eofToken
+
         return self.tokenSource.makeEOFToken()
 
     def setTokenSource(self, tokenSource):
@@ -593,6 +702,15 @@ class CommonTokenStream(TokenStream):
         self.p = 0
         self.lastMarker = None
 
+    def setTextInterning(self, enable=True):
+        """
+        Copy the text into each token as it is buffered, sharing one string
+        for all tokens with equal text.  See also Lexer.setTextInterning(),
+        which does the same for all tokens a lexer emits.
+        """
+
+        self.internTable = {} if enable else None
+
     def fillBuffer(self):
         """
         Load all tokens from the token source and put in tokens.
@@ -600,27 +718,27 @@ class CommonTokenStream(TokenStream):
         set some token type / channel overrides before filling buffer.
         """
 
+        tokenizeInto = getattr(self.tokenSource, "tokenizeInto", None)
+        if (
+            tokenizeInto is not None
+            and not self.discardSet
+            and not self.channelOverrideMap
+            and self.internTable is None
+        ):
+            # let the lexer run its batch loop, nothing to filter per token
+            channel = None
+            if self.discardOffChannelTokens:
+                channel = self.channel
+            tokenizeInto(self.tokens, channel)
+
+            self.p = 0
+            self.p = self.skipOffTokenChannels(self.p)
+            return
+
         index = 0
         t = self.tokenSource.nextToken()
         while t and t.type != EOF:
-            discard = False
-
-            if self.discardSet and t.type in self.discardSet:
-                discard = True
-
-            elif self.discardOffChannelTokens and t.channel != self.channel:
-                discard = True
-
-            # is there a channel override for token type?
-            if t.type in self.channelOverrideMap:
-                overrideChannel = self.channelOverrideMap[t.type]
-
-                if overrideChannel == self.channel:
-                    t.channel = overrideChannel
-                else:
-                    discard = True
-
-            if not discard:
+            if self._keepToken(t):
                 t.index = index
                 self.tokens.append(t)
                 index += 1
@@ -631,6 +749,39 @@ class CommonTokenStream(TokenStream):
         self.p = 0
         self.p = self.skipOffTokenChannels(self.p)
 
+    def _keepToken(self, t):
+        """
+        Apply the discard set, channel filter, channel overrides and text
+        interning to t.  Returns False if t is to be dropped.
+        """
+
+        discard = False
+
+        if self.discardSet and t.type in self.discardSet:
+            discard = True
+
+        elif self.discardOffChannelTokens and t.channel != self.channel:
+            discard = True
+
+        # is there a channel override for token type?
+        if t.type in self.channelOverrideMap:
+            overrideChannel = self.channelOverrideMap[t.type]
+
+            if overrideChannel == self.channel:
+                t.channel = overrideChannel
+            else:
+                discard = True
+
+        if discard:
+            return False
+
+        if self.internTable is not None:
+            text = t.text
+            if text is not None:
+                t.text = self.internTable.setdefault(text, text)
+
+        return True
+
     def consume(self):
         """
         Move the input pointer to the next incoming token.  The stream
@@ -818,8 +969,58 @@ class CommonTokenStream(TokenStream):
         return self.tokenSource
 
     def getSourceName(self):
+        if self.tokenSource is None and self._sourceName is not None:
+            return self._sourceName
+
         return self.tokenSource.getSourceName()
 
+    def materializeText(self, intern=True):
+        """
+        Copy the text of each buffered token into the token, so it does not
+        need to be sliced from the char stream anymore.  If intern is true,
+        tokens with equal text share a single string (from the intern table,
+        if text interning is enabled for this stream).
+        """
+
+        if self.p == -1:
+            self.fillBuffer()
+
+        strings = self.internTable
+        if strings is None:
+            strings = {}
+
+        for t in self.tokens:
+            text = t.text
+            if intern and text is not None:
+                text = strings.setdefault(text, text)
+            t.text = text
+
+    def detach(self, intern=True):
+        """
+        @brief Cut all ties between the tokens and the char stream.
+
+        The text of all tokens is materialized (see materializeText()) and
+        their input references are dropped.  The stream also releases its
+        token source, after it has buffered all tokens, so the char stream
+        (and the lexer) can be freed, while the tokens and any trees built
+        from them stay usable and can be pickled without dragging the input
+        along.
+        """
+
+        self.materializeText(intern)
+
+        for t in self.tokens:
+            t.input = None
+
+        if self.tokenSource is not None:
+            eof = self.tokenSource.makeEOFToken()
+            eof.text = eof.text
+            eof.input = None
+            self._eofToken = eof
+            if hasattr(self.tokenSource, "getSourceName"):
+                self._sourceName = self.tokenSource.getSourceName()
+            self.tokenSource = None
+
     def toString(self, start=None, stop=None):
         """Returns a string of all tokens between start and stop (inclusive)."""
         if self.p == -1:
@@ -841,6 +1042,121 @@ class CommonTokenStream(TokenStream):
         return "".join([t.text for t in self.tokens[start : stop + 1]])
 
 
+class IncrementalTokenStream(CommonTokenStream):
+    """
+    @brief A CommonTokenStream that follows edits of its input.
+
+    The token source must be a Lexer reading from an ANTLRStringStream.
+    applyEdit() changes the char stream and re-lexes it from the last token
+    before the edit, until the lexer produces a token of the same type
+    at the same (shifted) position as an old token behind the edit.  From
+    there on the old tokens are kept and only their positions are updated.
+
+    This assumes that the lexer produces the same tokens when it is
+    restarted at any token boundary, i.e. it does not carry state from one
+    token to the next (e.g. modes or flags set in actions).
+    """
+
+    def applyEdit(self, start, end, newText):
+        """
+        @brief Replace the chars start..end-1 of the input with newText.
+
+        The tokens list is patched in place.  Returns (first, stop), the
+        slice of tokens that holds the new tokens; all tokens from stop on
+        are the old ones with updated index, start, stop, line and
+        charPositionInLine.  The stream is rewound to the first token.
+        """
+
+        if self.p == -1:
+            self.fillBuffer()
+
+        lexer = self.tokenSource
+        input = lexer.input
+        tokens = self.tokens
+
+        delta = len(newText) - (end - start)
+        lineDelta = newText.count("\n") - input.strdata.count("\n", start, end)
+
+        # first token ending at or after start
+        lo, hi = 0, len(tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tokens[mid].stop < start:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # The token before that one may have looked at the edited chars, so
+        # it is lexed again, too.
+        if lo > 0:
+            first = lo - 1
+            restart = tokens[first].start
+        else:
+            first = 0
+            restart = 0
+
+        input.applyEdit(start, end, newText)
+        input.seek(restart)
+
+        newEnd = start + len(newText)
+        newTokens = []
+        stop = len(tokens)
+        j = lo
+        while True:
+            t = lexer.nextToken()
+            if t.type == EOF:
+                break
+
+            if t.start >= newEnd:
+                # past the edit, look for an old token at this position
+                oldStart = t.start - delta
+                while j < len(tokens) and tokens[j].start < oldStart:
+                    j += 1
+
+                if (
+                    j < len(tokens)
+                    and tokens[j].start == oldStart
+                    and tokens[j].type == t.type
+                ):
+                    stop = j
+                    break
+
+            if self._keepToken(t):
+                newTokens.append(t)
+
+        input.seek(input.size())
+
+        # shift the unchanged tail
+        indexDelta = len(newTokens) - (stop - first)
+        if stop < len(tokens):
+            resyncLine = tokens[stop].line
+            columnDelta = t.charPositionInLine - tokens[stop].charPositionInLine
+
+            for i in range(stop, len(tokens)):
+                old = tokens[i]
+                if delta:
+                    old.start += delta
+                    old.stop += delta
+                if indexDelta:
+                    old.index += indexDelta
+                if old.line == resyncLine:
+                    if columnDelta:
+                        old.charPositionInLine += columnDelta
+                elif not (lineDelta or delta or indexDelta):
+                    break
+                if lineDelta:
+                    old.line += lineDelta
+
+        for i, t in enumerate(newTokens):
+            t.index = first + i
+        tokens[first:stop] = newTokens
+
+        self.p = self.skipOffTokenChannels(0)
+        self.lastMarker = None
+
+        return first, first + len(newTokens)
+
+
 class RewriteOperation:
     """@brief Internal helper class."""
 
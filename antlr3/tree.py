@@ -39,6 +39,9 @@ This module contains all support classes for AST construction and tree parsers.
 # pylint: disable-msg=C0111
 
 import re
+from array import array
+from collections import deque
+from operator import attrgetter
 
 from antlr3.constants import DOWN, EOF, INVALID_TOKEN_TYPE, UP
 from antlr3.exceptions import (
@@ -111,6 +114,8 @@ class Tree:
     This is a tree node without any payload; just navigation and factory stuff.
     """
 
+    __slots__ = ()
+
     def getChild(self, i):
         raise NotImplementedError
 
@@ -629,6 +634,10 @@ class BaseTree(Tree):
     # methods
     # pylint: disable-msg=W0223
 
+    # Subclasses which don't declare __slots__ themselves still get a
+    # __dict__, so this only matters for slotted trees like CompactCommonTree.
+    __slots__ = ("children", "parent", "childIndex")
+
     def __init__(self, node=None):
         """
         Create a new node from an existing node does nothing for BaseTree
@@ -847,24 +856,82 @@ class BaseTree(Tree):
     def toStringTree(self):
         """Print out a whole tree not just a node"""
 
-        if len(self.children) == 0:
-            return self.toString()
-
         buf = []
-        if not self.isNil():
-            buf.append("(")
-            buf.append(self.toString())
-            buf.append(" ")
+        self._writeStringTree(buf.append)
+        return "".join(buf)
 
-        for i, child in enumerate(self.children):
-            if i > 0:
-                buf.append(" ")
-            buf.append(child.toStringTree())
+    def writeStringTree(self, out):
+        """Write the whole tree in LISP notation to a text stream.
 
-        if not self.isNil():
-            buf.append(")")
+        out can be any object with a write() method.  The tree is walked
+        with an explicit stack, so this works for arbitrarily deep trees.
+        Descendants which are not BaseTree instances or override
+        toStringTree() are written using their own toStringTree().
+        """
 
-        return "".join(buf)
+        self._writeStringTree(out.write)
+
+    def _writeStringTree(self, write):
+        if not self.children:
+            write(self.toString())
+            return
+
+        # Classes whose nodes can be walked here.  Nodes of other classes are
+        # written using their own toStringTree().
+        walkable = set()
+
+        # stack of (children, index of next child, number of children,
+        # closing text) for the nodes we're in
+        stack = []
+
+        t = self
+        sep = ""
+        while True:
+            # open t, which has children
+            if t.isNil():
+                write(sep)
+                close = ""
+            else:
+                write(sep + "(" + t.getTreeLabel() + " ")
+                close = ")"
+
+            children = t.children
+            i = 0
+            n = len(children)
+
+            while True:
+                if i < n:
+                    t = children[i]
+                    sep = " " if i else ""
+                    i += 1
+
+                    if t.__class__ not in walkable:
+                        cls = t.__class__
+                        if not issubclass(cls, BaseTree) or (
+                            cls.toStringTree is not BaseTree.toStringTree
+                        ):
+                            write(sep + t.toStringTree())
+                            continue
+
+                        walkable.add(cls)
+
+                    if t.children:
+                        stack.append((children, i, n, close))
+                        break
+
+                    write(sep + t.toString())
+
+                else:
+                    write(close)
+                    if not stack:
+                        return
+
+                    children, i, n, close = stack.pop()
+
+    def getTreeLabel(self):
+        """The text for this node as the root of a subtree in toStringTree()"""
+
+        return self.toString()
 
     def getLine(self):
         return 0
@@ -986,7 +1053,7 @@ class BaseTreeAdaptor(TreeAdaptor):
         if oldRoot is None:
             return newRoot
 
-        if not isinstance(newRoot, CommonTree):
+        if not isinstance(newRoot, BaseCommonTree):
             newRoot = self.createWithPayload(newRoot)
 
         # handle ^(nil real-node)
@@ -1090,27 +1157,28 @@ class BaseTreeAdaptor(TreeAdaptor):
 #
 # Tree
 # \- BaseTree
-#    \- CommonTree
-#       \- CommonErrorNode
+#    \- BaseCommonTree
+#       +- CommonTree
+#       |  \- CommonErrorNode
+#       \- CompactCommonTree
 #
 # TreeAdaptor
 # \- BaseTreeAdaptor
 #    \- CommonTreeAdaptor
+#       \- CompactTreeAdaptor
 #
 ############################################################################
 
 
-class CommonTree(BaseTree):
-    """@brief A tree node that is wrapper for a Token object.
-
-    After 3.0 release
-    while building tree rewrite stuff, it became clear that computing
-    parent and child index is very difficult and cumbersome.  Better to
-    spend the space in every tree node.  If you don't want these extra
-    fields, it's easy to cut them out in your own BaseTree subclass.
+class BaseCommonTree(BaseTree):
+    """@brief Implementation shared by CommonTree and CompactCommonTree.
 
+    All fields live in __slots__, so instances of this class don't carry a
+    __dict__.  Don't use it directly, use one of the subclasses.
     """
 
+    __slots__ = ("token", "startIndex", "stopIndex")
+
     def __init__(self, payload):
         BaseTree.__init__(self)
 
@@ -1129,7 +1197,7 @@ class CommonTree(BaseTree):
         if payload is None:
             self.token = None
 
-        elif isinstance(payload, CommonTree):
+        elif isinstance(payload, BaseCommonTree):
             self.token = payload.token
             self.startIndex = payload.startIndex
             self.stopIndex = payload.stopIndex
@@ -1143,9 +1211,6 @@ class CommonTree(BaseTree):
     def getToken(self):
         return self.token
 
-    def dupNode(self):
-        return CommonTree(self)
-
     def isNil(self):
         return self.token is None
 
@@ -1262,20 +1327,70 @@ class CommonTree(BaseTree):
 
     __str__ = toString
 
-    def toStringTree(self):
-        if not self.children:
-            return self.toString()
+    def getTreeLabel(self):
+        return str(self)
+
+
+class CommonTree(BaseCommonTree):
+    """@brief A tree node that is wrapper for a Token object.
+
+    After 3.0 release
+    while building tree rewrite stuff, it became clear that computing
+    parent and child index is very difficult and cumbersome.  Better to
+    spend the space in every tree node.  If you don't want these extra
+    fields, it's easy to cut them out in your own BaseTree subclass.
+
+    """
 
-        ret = ""
-        if not self.isNil():
-            ret += f"({self!s} "
+    def dupNode(self):
+        return CommonTree(self)
 
-        ret += " ".join([child.toStringTree() for child in self.children])
 
-        if not self.isNil():
-            ret += ")"
+# The child list shared by all CompactCommonTree nodes without children.
+EMPTY_CHILDREN = ()
 
-        return ret
+
+class CompactCommonTree(BaseCommonTree):
+    """@brief A memory saving variant of CommonTree.
+
+    Nodes have no __dict__, so you can't set arbitrary attributes on them,
+    and nodes without children share the immutable EMPTY_CHILDREN tuple
+    instead of owning an empty list.  The list is only created by the first
+    addChild() call, so don't modify the children attribute (or the result
+    of getChildren()) directly.
+
+    Use CompactTreeAdaptor to make a parser build these nodes.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, payload):
+        BaseCommonTree.__init__(self, payload)
+        self.children = EMPTY_CHILDREN
+
+    def dupNode(self):
+        return CompactCommonTree(self)
+
+    def addChild(self, childTree):
+        if childTree is None:
+            return
+
+        if self.children is EMPTY_CHILDREN:
+            self.children = []
+
+        BaseCommonTree.addChild(self, childTree)
+
+    def addChildren(self, children):
+        if self.children is EMPTY_CHILDREN:
+            self.children = []
+
+        BaseCommonTree.addChildren(self, children)
+
+    def setChild(self, i, t):
+        if self.children is EMPTY_CHILDREN:
+            self.children = []
+
+        BaseCommonTree.setChild(self, i, t)
 
 
 INVALID_NODE = CommonTree(INVALID_TOKEN)
@@ -1459,7 +1574,7 @@ class CommonTreeAdaptor(BaseTreeAdaptor):
         override this in your own adaptor.
         """
 
-        if isinstance(t, CommonTree):
+        if isinstance(t, BaseCommonTree):
             return t.getToken()
 
         return None  # no idea what to do
@@ -1493,6 +1608,505 @@ class CommonTreeAdaptor(BaseTreeAdaptor):
             parent.replaceChildren(startChildIndex, stopChildIndex, t)
 
 
+class CompactTreeAdaptor(CommonTreeAdaptor):
+    """
+    @brief A CommonTreeAdaptor that builds CompactCommonTree nodes.
+
+    Set an instance of this as the parser's tree adaptor to build large
+    ASTs with less memory per node.
+    """
+
+    def createWithPayload(self, payload):
+        return CompactCommonTree(payload)
+
+
+############################################################################
+#
+# flat tree implementation
+#
+# TreeAdaptor
+# \- BaseTreeAdaptor
+#    \- FlatTreeAdaptor
+#
+############################################################################
+
+
+class FlatTreeAdaptor(BaseTreeAdaptor):
+    """
+    @brief A TreeAdaptor that stores all nodes in parallel arrays.
+
+    Nodes are not objects, but integer handles into a set of array columns
+    owned by the adaptor (the arena).  Children are kept as linked lists
+    through the firstChildren/nextSiblings columns.  The token of a node is
+    an index into the payloads list, or -1 for nil nodes.
+
+    This needs a small fraction of the memory of CommonTree nodes and
+    doesn't put any objects on the garbage collector's plate.  The columns
+    are plain array objects, so they can be scanned in bulk (e.g. via
+    numpy.frombuffer) to query node types.
+
+    Nodes are never freed, so use one adaptor per tree (or per batch of
+    trees that are discarded together).  As with any linked list, a node
+    can only be in one child list at a time; adding a nil node to a tree
+    moves its children over and leaves the nil node empty.
+
+    Use importTree() and toCommonTree() to convert from and to CommonTree.
+    """
+
+    def __init__(self):
+        # the columns, one entry per node
+        self.types = array("i")
+        self.tokens = array("i")
+        self.parents = array("i")
+        self.firstChildren = array("i")
+        self.lastChildren = array("i")
+        self.nextSiblings = array("i")
+        self.childCounts = array("i")
+        self.childIndexes = array("i")
+        self.startIndexes = array("i")
+        self.stopIndexes = array("i")
+
+        # the token table referenced by the tokens column
+        self.payloads = []
+
+        # parent -> list of its children, built by getChild() on first
+        # access and kept up to date by the methods that relink children,
+        # so indexed access is O(1) in any walk order.
+        self._childLists = {}
+
+    def size(self):
+        """Number of nodes in the arena."""
+
+        return len(self.types)
+
+    __len__ = size
+
+    def _newNode(self, ttype, tokenRef):
+        node = len(self.types)
+        self.types.append(ttype)
+        self.tokens.append(tokenRef)
+        self.parents.append(-1)
+        self.firstChildren.append(-1)
+        self.lastChildren.append(-1)
+        self.nextSiblings.append(-1)
+        self.childCounts.append(0)
+        self.childIndexes.append(-1)
+        self.startIndexes.append(-1)
+        self.stopIndexes.append(-1)
+        return node
+
+    def _children(self, t):
+        children = []
+        c = self.firstChildren[t]
+        while c != -1:
+            children.append(c)
+            c = self.nextSiblings[c]
+
+        return children
+
+    def _setChildren(self, t, children):
+        """Relink the child list of t, fixing parent and child indexes."""
+
+        prev = -1
+        for idx, child in enumerate(children):
+            if prev == -1:
+                self.firstChildren[t] = child
+            else:
+                self.nextSiblings[prev] = child
+
+            self.parents[child] = t
+            self.childIndexes[child] = idx
+            prev = child
+
+        if prev == -1:
+            self.firstChildren[t] = -1
+        else:
+            self.nextSiblings[prev] = -1
+
+        self.lastChildren[t] = prev
+        self.childCounts[t] = len(children)
+        self._childLists[t] = list(children)
+
+    def _clearChildren(self, t):
+        self.firstChildren[t] = -1
+        self.lastChildren[t] = -1
+        self.childCounts[t] = 0
+        self._childLists.pop(t, None)
+
+    # C o n s t r u c t i o n
+
+    def createWithPayload(self, payload):
+        if payload is None:
+            return self._newNode(INVALID_TOKEN_TYPE, -1)
+
+        if not isinstance(payload, Token):
+            raise TypeError(type(payload).__name__)
+
+        self.payloads.append(payload)
+        ttype = payload.type
+        if ttype is None:
+            ttype = INVALID_TOKEN_TYPE
+
+        return self._newNode(ttype, len(self.payloads) - 1)
+
+    def createToken(self, fromToken=None, tokenType=None, text=None):
+        if fromToken is not None:
+            return CommonToken(oldToken=fromToken)
+
+        return CommonToken(type=tokenType, text=text)
+
+    def dupNode(self, treeNode):
+        if treeNode is None:
+            return None
+
+        node = self._newNode(self.types[treeNode], self.tokens[treeNode])
+        self.startIndexes[node] = self.startIndexes[treeNode]
+        self.stopIndexes[node] = self.stopIndexes[treeNode]
+        return node
+
+    def errorNode(self, input, start, stop, exc):
+        """
+        Create a node of type INVALID_TOKEN_TYPE, which has the text of a
+        CommonErrorNode for the same error.
+        """
+
+        error = CommonErrorNode(input, start, stop, exc)
+        node = self.createWithPayload(
+            CommonToken(type=INVALID_TOKEN_TYPE, text=error.toString())
+        )
+        if isinstance(error.start, Token):
+            self.setTokenBoundaries(node, error.start, error.stop)
+
+        return node
+
+    def isNil(self, tree):
+        return self.tokens[tree] == -1
+
+    def getUniqueID(self, node):
+        return node
+
+    def addChild(self, tree, child):
+        """
+        Add a child to the tree t.  If child is a flat tree (a list), move
+        all its children to t.
+        """
+
+        if tree is None or child is None:
+            return
+
+        if self.tokens[child] == -1:
+            # child is a nil node, possibly with children
+            if child == tree:
+                raise ValueError("attempt to add child list to itself")
+
+            first = self.firstChildren[child]
+            if first == -1:
+                return
+
+            idx = self.childCounts[tree]
+            c = first
+            while c != -1:
+                self.parents[c] = tree
+                self.childIndexes[c] = idx
+                idx += 1
+                c = self.nextSiblings[c]
+
+            last = self.lastChildren[tree]
+            if last == -1:
+                self.firstChildren[tree] = first
+            else:
+                self.nextSiblings[last] = first
+
+            self.lastChildren[tree] = self.lastChildren[child]
+            self.childCounts[tree] = idx
+
+            children = self._childLists.get(tree)
+            if children is not None:
+                children.extend(self._children(child))
+
+            self._clearChildren(child)
+
+        else:
+            last = self.lastChildren[tree]
+            if last == -1:
+                self.firstChildren[tree] = child
+            else:
+                self.nextSiblings[last] = child
+
+            self.nextSiblings[child] = -1
+            self.lastChildren[tree] = child
+            self.parents[child] = tree
+            self.childIndexes[child] = self.childCounts[tree]
+            self.childCounts[tree] += 1
+
+            children = self._childLists.get(tree)
+            if children is not None:
+                children.append(child)
+
+    def becomeRoot(self, newRoot, oldRoot):
+        if isinstance(newRoot, Token):
+            newRoot = self.createWithPayload(newRoot)
+
+        if oldRoot is None:
+            return newRoot
+
+        # handle ^(nil real-node)
+        if self.isNil(newRoot):
+            nc = self.childCounts[newRoot]
+            if nc == 1:
+                newRoot = self.firstChildren[newRoot]
+
+            elif nc > 1:
+                raise RuntimeError("more than one node as root")
+
+        self.addChild(newRoot, oldRoot)
+        return newRoot
+
+    def rulePostProcessing(self, root):
+        """Transform ^(nil x) to x and nil to null"""
+
+        if root is not None and self.isNil(root):
+            nc = self.childCounts[root]
+            if nc == 0:
+                root = None
+
+            elif nc == 1:
+                root = self.firstChildren[root]
+                # whoever invokes rule will set parent and child index
+                self.parents[root] = -1
+                self.childIndexes[root] = -1
+
+        return root
+
+    # C o n t e n t
+
+    def getType(self, t):
+        if t is None:
+            return INVALID_TOKEN_TYPE
+
+        return self.types[t]
+
+    def setType(self, t, type):
+        self.types[t] = type
+
+    def getText(self, t):
+        if t is None:
+            return None
+
+        ref = self.tokens[t]
+        if ref == -1:
+            return None
+
+        return self.payloads[ref].text
+
+    def setText(self, t, text):
+        ref = self.tokens[t]
+        if ref == -1:
+            raise ValueError("can't set the text of a nil node")
+
+        token = self.createToken(self.payloads[ref])
+        token.text = text
+        self.payloads.append(token)
+        self.tokens[t] = len(self.payloads) - 1
+
+    def getToken(self, t):
+        if t is None:
+            return None
+
+        ref = self.tokens[t]
+        if ref == -1:
+            return None
+
+        return self.payloads[ref]
+
+    def setTokenBoundaries(self, t, startToken, stopToken):
+        if t is None:
+            return
+
+        start = 0
+        stop = 0
+
+        if startToken is not None:
+            start = startToken.index
+
+        if stopToken is not None:
+            stop = stopToken.index
+
+        self.startIndexes[t] = start
+        self.stopIndexes[t] = stop
+
+    def getTokenStartIndex(self, t):
+        if t is None:
+            return -1
+
+        index = self.startIndexes[t]
+        if index == -1 and self.tokens[t] != -1:
+            return self.payloads[self.tokens[t]].index
+
+        return index
+
+    def getTokenStopIndex(self, t):
+        if t is None:
+            return -1
+
+        index = self.stopIndexes[t]
+        if index == -1 and self.tokens[t] != -1:
+            return self.payloads[self.tokens[t]].index
+
+        return index
+
+    # N a v i g a t i o n  /  T r e e  P a r s i n g
+
+    def getChild(self, t, i):
+        if t is None:
+            return None
+
+        n = self.childCounts[t]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            return None
+
+        if i == 0:
+            return self.firstChildren[t]
+
+        if i == n - 1:
+            return self.lastChildren[t]
+
+        children = self._childLists.get(t)
+        if children is None:
+            children = self._childLists[t] = self._children(t)
+
+        return children[i]
+
+    def setChild(self, t, i, child):
+        if child is None:
+            return
+
+        if self.isNil(child):
+            raise ValueError("Can't set single child to a list")
+
+        children = self._children(t)
+        children[i] = child
+        self._setChildren(t, children)
+
+    def deleteChild(self, t, i):
+        children = self._children(t)
+        killed = children.pop(i)
+        self._setChildren(t, children)
+        self.nextSiblings[killed] = -1
+        return killed
+
+    def getChildCount(self, t):
+        if t is None:
+            return 0
+
+        return self.childCounts[t]
+
+    def getParent(self, t):
+        parent = self.parents[t]
+        if parent == -1:
+            return None
+
+        return parent
+
+    def setParent(self, t, parent):
+        if parent is None:
+            parent = -1
+
+        self.parents[t] = parent
+
+    def getChildIndex(self, t):
+        if t is None:
+            return 0
+
+        return self.childIndexes[t]
+
+    def setChildIndex(self, t, index):
+        self.childIndexes[t] = index
+
+    def replaceChildren(self, parent, startChildIndex, stopChildIndex, t):
+        if parent is None:
+            return
+
+        children = self._children(parent)
+        if startChildIndex >= len(children) or stopChildIndex >= len(children):
+            raise IndexError("indexes invalid")
+
+        if self.isNil(t):
+            newChildren = self._children(t)
+            self._clearChildren(t)
+
+        else:
+            newChildren = [t]
+
+        children[startChildIndex : stopChildIndex + 1] = newChildren
+        self._setChildren(parent, children)
+
+    # C o n v e r s i o n
+
+    def importTree(self, tree, adaptor=None):
+        """Copy a tree into the arena and return the handle of its root.
+
+        The tree is navigated using adaptor, which defaults to a
+        CommonTreeAdaptor.  Tokens are shared, not copied.
+        """
+
+        if tree is None:
+            return None
+
+        if adaptor is None:
+            adaptor = CommonTreeAdaptor()
+
+        root = self._importNode(tree, adaptor)
+        work = [(tree, root)]
+        while work:
+            t, node = work.pop()
+            for i in range(adaptor.getChildCount(t)):
+                child = adaptor.getChild(t, i)
+                childNode = self._importNode(child, adaptor)
+                self.addChild(node, childNode)
+                work.append((child, childNode))
+
+        return root
+
+    def _importNode(self, t, adaptor):
+        token = adaptor.getToken(t)
+        if token is None and not adaptor.isNil(t):
+            # e.g. an error node, keep at least its type and text
+            token = CommonToken(type=adaptor.getType(t), text=adaptor.getText(t))
+
+        node = self.createWithPayload(token)
+        self.startIndexes[node] = adaptor.getTokenStartIndex(t)
+        self.stopIndexes[node] = adaptor.getTokenStopIndex(t)
+        return node
+
+    def toCommonTree(self, t):
+        """Build a CommonTree from the subtree rooted at handle t."""
+
+        if t is None:
+            return None
+
+        root = self._exportNode(t)
+        work = [(t, root)]
+        while work:
+            node, tree = work.pop()
+            c = self.firstChildren[node]
+            while c != -1:
+                child = self._exportNode(c)
+                tree.addChild(child)
+                work.append((c, child))
+                c = self.nextSiblings[c]
+
+        return root
+
+    def _exportNode(self, t):
+        tree = CommonTree(self.getToken(t))
+        tree.startIndex = self.startIndexes[t]
+        tree.stopIndex = self.stopIndexes[t]
+        return tree
+
+
 ############################################################################
 #
 # streams
@@ -1724,6 +2338,21 @@ class CommonTreeNodeStream(TreeNodeStream):
         # Stack of indexes used for push/pop calls
         self.calls = []
 
+        # Maps each node to the stream index of its first occurrence, so
+        # getNodeIndex() doesn't have to scan the buffer.  Built on first
+        # use, unhashable nodes are left out.
+        self._nodeIndex = None
+
+        # Token types of the buffered nodes, parallel to self.nodes, so LA()
+        # doesn't have to go through the adaptor.  None if some node has a
+        # type that doesn't fit into an int array.
+        self._types = array("i")
+        if nodes is not None:
+            try:
+                self._types.extend(adaptor.getType(node) for node in nodes)
+            except (TypeError, OverflowError):
+                self._types = None
+
     def fillBuffer(self):
         """Walk tree with depth-first-search and fill nodes buffer.
         Don't do DOWN, UP nodes if its a list (t is isNil).
@@ -1737,6 +2366,7 @@ class CommonTreeNodeStream(TreeNodeStream):
 
         if not nil:
             self.nodes.append(t)  # add this node
+            self._addType(t)
 
         # add DOWN node if t has children
         n = self.adaptor.getChildCount(t)
@@ -1759,12 +2389,35 @@ class CommonTreeNodeStream(TreeNodeStream):
         if self.p == -1:
             self.fillBuffer()
 
+        if self._nodeIndex is None:
+            self._buildNodeIndex()
+
+        try:
+            i = self._nodeIndex.get(node)
+        except TypeError:
+            i = None
+
+        if i is not None:
+            return i
+
+        # unhashable nodes, or nodes that are equal to a buffered node
+        # without hashing alike
         for i, t in enumerate(self.nodes):
             if t == node:
                 return i
 
         return -1
 
+    def _buildNodeIndex(self):
+        index = {}
+        for i, t in enumerate(self.nodes):
+            try:
+                index.setdefault(t, i)
+            except TypeError:
+                pass
+
+        self._nodeIndex = index
+
     def addNavigationNode(self, ttype):
         """
         As we flatten the tree, we use UP, DOWN nodes to represent
@@ -1789,6 +2442,14 @@ class CommonTreeNodeStream(TreeNodeStream):
                 navNode = self.up
 
         self.nodes.append(navNode)
+        self._addType(navNode)
+
+    def _addType(self, t):
+        if self._types is not None:
+            try:
+                self._types.append(self.adaptor.getType(t))
+            except (TypeError, OverflowError):
+                self._types = None
 
     def get(self, i):
         if self.p == -1:
@@ -1826,7 +2487,7 @@ class CommonTreeNodeStream(TreeNodeStream):
         return self.nodes[self.p - k]
 
     def isEOF(self, obj):
-        return self.adaptor.getType(obj) == EOF
+        return obj is self.eof or self.adaptor.getType(obj) == EOF
 
     def getTreeSource(self):
         return self.root
@@ -1856,6 +2517,16 @@ class CommonTreeNodeStream(TreeNodeStream):
         self.p += 1
 
     def LA(self, i):
+        if self.p == -1:
+            self.fillBuffer()
+
+        types = self._types
+        if types is not None and i > 0:
+            try:
+                return types[self.p + i - 1]
+            except IndexError:
+                pass
+
         return self.adaptor.getType(self.LT(i))
 
     def mark(self):
@@ -1961,11 +2632,10 @@ class CommonTreeNodeStream(TreeNodeStream):
 
             return self.tokens.toString(beginTokenIndex, endTokenIndex)
 
-        # walk nodes looking for start
-        i, t = 0, None
-        for i, t in enumerate(self.nodes):
-            if t == start:
-                break
+        # look up start, default to the last node like a failed scan would
+        i = self.getNodeIndex(start)
+        if i == -1:
+            i = max(len(self.nodes) - 1, 0)
 
         # now walk until we see stop, filling string buffer with text
         buf = []
@@ -2003,6 +2673,26 @@ class CommonTreeNodeStream(TreeNodeStream):
 #############################################################################
 
 
+_typeOf = attrgetter("type")
+
+# node classes that don't override getParent(), see _parentOf()
+_plainParentTypes = set()
+
+
+def _parentOf(t):
+    """Return t.getParent(), reading the attribute directly where possible."""
+
+    cls = type(t)
+    if cls in _plainParentTypes:
+        return t.parent
+
+    if cls.getParent is BaseCommonTree.getParent:
+        _plainParentTypes.add(cls)
+        return t.parent
+
+    return t.getParent()
+
+
 class TreeParser(BaseRecognizer):
     """@brief Baseclass for generated tree parsers.
 
@@ -2047,6 +2737,11 @@ class TreeParser(BaseRecognizer):
     dotdotPattern = re.compile(dotdot)
     doubleEtcPattern = re.compile(doubleEtc)
 
+    # (id(tokenNames), context) -> (tokenNames, compiled context), see
+    # _compileContext()
+    _contextCache = {}
+    contextCacheSize = 1024
+
     def inContext(self, context, adaptor=None, tokenName=None, t=None):
         """Check if current node in input has a context.
 
@@ -2072,41 +2767,46 @@ class TreeParser(BaseRecognizer):
         It's static and full of parameters for testing purposes.
         """
 
-        if cls.dotdotPattern.match(context):
-            # don't allow "..", must be "..."
-            raise ValueError("invalid syntax: ..")
+        nodes = cls._compileContext(tokenNames, context)
 
-        if cls.doubleEtcPattern.match(context):
-            # don't allow double "..."
-            raise ValueError("invalid syntax: ... ...")
+        if (
+            type(adaptor).getParent is CommonTreeAdaptor.getParent
+            and type(adaptor).getType is CommonTreeAdaptor.getType
+        ):
+            # fast path for the common adaptor: read the attributes it would
+            # read, checking each node's class before reading its parent
+            getParent = _parentOf
+            getType = _typeOf
 
-        # ensure spaces around ...
-        context = context.replace("...", " ... ")
-        context = context.strip()
-        nodes = context.split()
+        else:
+            getParent = adaptor.getParent
+            getType = adaptor.getType
 
         ni = len(nodes) - 1
-        t = adaptor.getParent(t)
+        t = getParent(t)
         while ni >= 0 and t is not None:
-            if nodes[ni] == "...":
-                # walk upwards until we see nodes[ni-1] then continue walking
+            types = nodes[ni]
+            if types is None:
+                # "...": walk upwards until we see nodes[ni-1] then continue
+                # walking
                 if ni == 0:
                     # ... at start is no-op
                     return True
                 goal = nodes[ni - 1]
-                ancestor = cls._getAncestor(adaptor, tokenNames, t, goal)
-                if ancestor is None:
+                if goal is None:
                     return False
-                t = ancestor
+                while getType(t) not in goal:
+                    t = getParent(t)
+                    if t is None:
+                        return False
                 ni -= 1
 
-            name = tokenNames[adaptor.getType(t)]
-            if name != nodes[ni]:
+            elif getType(t) not in types:
                 return False
 
             # advance to parent and to previous element in context node list
             ni -= 1
-            t = adaptor.getParent(t)
+            t = getParent(t)
 
         # at root but more nodes to match
         if t is None and ni >= 0:
@@ -2114,16 +2814,49 @@ class TreeParser(BaseRecognizer):
 
         return True
 
-    @staticmethod
-    def _getAncestor(adaptor, tokenNames, t, goal):
-        """Helper for static inContext."""
-        while t is not None:
-            name = tokenNames[adaptor.getType(t)]
-            if name == goal:
-                return t
-            t = adaptor.getParent(t)
+    @classmethod
+    def _compileContext(cls, tokenNames, context):
+        """
+        Translate a context string into a tuple with one entry per context
+        element, None for "..." and the set of matching token types for
+        token names.  Results are cached, so this is cheap when called with
+        the same context again.
+        """
 
-        return None
+        key = (id(tokenNames), context)
+        cache = cls._contextCache
+        entry = cache.get(key)
+        if entry is not None and entry[0] is tokenNames:
+            return entry[1]
+
+        if cls.dotdotPattern.match(context):
+            # don't allow "..", must be "..."
+            raise ValueError("invalid syntax: ..")
+
+        if cls.doubleEtcPattern.match(context):
+            # don't allow double "..."
+            raise ValueError("invalid syntax: ... ...")
+
+        # ensure spaces around ...
+        context = context.replace("...", " ... ")
+        context = context.strip()
+        names = context.split()
+
+        typesByName = {}
+        for ttype, name in enumerate(tokenNames):
+            if name in names:
+                typesByName.setdefault(name, set()).add(ttype)
+
+        nodes = tuple(
+            None if name == "..." else frozenset(typesByName.get(name, ()))
+            for name in names
+        )
+
+        if len(cache) >= cls.contextCacheSize:
+            cache.clear()
+        # keep a reference to tokenNames, so its id can't be reused
+        cache[key] = (tokenNames, nodes)
+        return nodes
 
     def matchAny(self):
         """
@@ -2270,94 +3003,94 @@ class TreeIterator:
         self.root = tree
         self.adaptor = adaptor
 
-        self.first_time = True
-        self.tree = tree
-
-        # If we emit UP/DOWN nodes, we need to spit out multiple nodes per
-        # next() call.
-        self.nodes = []
-
         # navigation nodes to return during walk and at end
         self.down = adaptor.createFromType(DOWN, "DOWN")
         self.up = adaptor.createFromType(UP, "UP")
         self.eof = adaptor.createFromType(EOF, "EOF")
 
+        self.reset()
+
     def reset(self):
-        self.first_time = True
-        self.tree = self.root
-        self.nodes = []
+        # Nodes pulled from the walk by has_next(), but not yet returned.
+        self.nodes = deque()
+        self._walker = self._walk()
 
-    def __iter__(self):
-        return self
+    def _walk(self):
+        """Generate the node sequence for the tree below (and including) root.
 
-    def has_next(self):
-        if self.first_time:
-            return self.root is not None
+        Each child list is visited once, the child count of a node is only
+        asked for when descending into it.
+        """
 
-        if len(self.nodes) > 0:
-            return True
+        root = self.root
+        if root is None:
+            return
 
-        if self.tree is None:
-            return False
+        getChild = self.adaptor.getChild
+        getChildCount = self.adaptor.getChildCount
+        down = self.down
+        up = self.up
 
-        if self.adaptor.getChildCount(self.tree) > 0:
-            return True
+        yield root
 
-        # back at root?
-        return self.adaptor.getParent(self.tree) is not None
+        n = getChildCount(root)
+        if n > 0:
+            yield down
 
-    def __next__(self):
-        if not self.has_next():
-            raise StopIteration
+            # stack of [node, child count, index of next child to visit]
+            stack = [[root, n, 0]]
+            while stack:
+                frame = stack[-1]
+                t, n, i = frame
+                if i == n:
+                    # we're moving back up
+                    stack.pop()
+                    yield up
+                    continue
 
-        if self.first_time:
-            # initial condition
-            self.first_time = False
-            if self.adaptor.getChildCount(self.tree) == 0:
-                # single node tree (special)
-                self.nodes.append(self.eof)
-                return self.tree
+                frame[2] = i + 1
+                child = getChild(t, i)
+                yield child
 
-            return self.tree
+                n = getChildCount(child)
+                if n > 0:
+                    yield down
+                    stack.append([child, n, 0])
 
-        # if any queued up, use those first
-        if len(self.nodes) > 0:
-            return self.nodes.pop(0)
+        yield self.eof
 
-        # no nodes left?
-        if self.tree is None:
-            return self.eof
+    def __iter__(self):
+        # Hand out a generator over the shared state instead of self, so
+        # for-loops don't pay for a __next__() call per node.
+        nodes = self.nodes
+        for node in self._walker:
+            if nodes:
+                # has_next() pulled nodes ahead of this one, queue it up
+                nodes.append(node)
+                while nodes:
+                    yield nodes.popleft()
 
-        # next node will be child 0 if any children
-        if self.adaptor.getChildCount(self.tree) > 0:
-            self.tree = self.adaptor.getChild(self.tree, 0)
-            # real node is next after DOWN
-            self.nodes.append(self.tree)
-            return self.down
-
-        # if no children, look for next sibling of tree or ancestor
-        parent = self.adaptor.getParent(self.tree)
-        # while we're out of siblings, keep popping back up towards root
-        while parent is not None and self.adaptor.getChildIndex(
-            self.tree
-        ) + 1 >= self.adaptor.getChildCount(parent):
-            # we're moving back up
-            self.nodes.append(self.up)
-            self.tree = parent
-            parent = self.adaptor.getParent(self.tree)
-
-        # no nodes left?
-        if parent is None:
-            self.tree = None  # back at root? nothing left then
-            self.nodes.append(self.eof)  # add to queue, might have UP nodes in there
-            return self.nodes.pop(0)
-
-        # must have found a node with an unvisited sibling
-        # move to it and return it
-        nextSiblingIndex = self.adaptor.getChildIndex(self.tree) + 1
-        self.tree = self.adaptor.getChild(parent, nextSiblingIndex)
-        self.nodes.append(self.tree)  # add to queue, might have UP nodes in there
-        return self.nodes.pop(0)
+            else:
+                yield node
+
+        while nodes:
+            yield nodes.popleft()
+
+    def has_next(self):
+        if self.nodes:
+            return True
+
+        for node in self._walker:
+            self.nodes.append(node)
+            return True
+
+        return False
+
+    def __next__(self):
+        if self.nodes:
+            return self.nodes.popleft()
+
+        return next(self._walker)
 
 
 #############################################################################
@@ -36,6 +36,8 @@ See <http://www.antlr.org/wiki/display/~admin/2007/07/02/Exploring+Concept+of+Tr
 #
 # end[licence]
 
+from collections import OrderedDict
+
 from .constants import INVALID_TOKEN_TYPE
 from .tokens import CommonToken
 from .tree import CommonTree, CommonTreeAdaptor
@@ -293,6 +295,463 @@ class TreePatternTreeAdaptor(CommonTreeAdaptor):
         return TreePattern(payload)
 
 
+class TreeIndex:
+    """
+    @brief A token type to nodes index of a tree.
+
+    The index is built once by walking the tree.  If the tree is mutated
+    through an IndexingTreeAdaptor (which is what generated parsers and
+    tree rewriters do), the index is kept up to date incrementally, so it
+    stays valid for the lifetime of the tree.  Mutations that bypass the
+    adaptor (e.g. calling addChild() on a node directly, or changing a
+    node's token type) are not seen; call rebuild() after those.
+
+    Nodes of each type are kept in the order they were indexed, which is
+    preorder for a freshly built index, but not after mutations.
+    """
+
+    def __init__(self, tree, adaptor=None):
+        if adaptor is None:
+            adaptor = CommonTreeAdaptor()
+
+        self.adaptor = adaptor
+        self.root = tree
+
+        # node -> type of all indexed nodes
+        self._types = {}
+
+        # type -> dict with the nodes of that type as keys (an ordered set)
+        self._nodes = {}
+
+        self.add(tree)
+
+        if isinstance(adaptor, IndexingTreeAdaptor):
+            adaptor.indexes.append(self)
+
+    def rebuild(self):
+        """Drop all entries and index the tree again."""
+
+        self._types.clear()
+        self._nodes.clear()
+        self.add(self.root)
+
+    def close(self):
+        """Stop maintaining this index."""
+
+        if isinstance(self.adaptor, IndexingTreeAdaptor):
+            try:
+                self.adaptor.indexes.remove(self)
+            except ValueError:
+                pass
+
+    def __contains__(self, t):
+        return t in self._types
+
+    def __len__(self):
+        return len(self._types)
+
+    def get(self, ttype):
+        """Return a list of all nodes with token type ttype."""
+
+        nodes = self._nodes.get(ttype)
+        if nodes is None:
+            return []
+        return list(nodes)
+
+    def types(self):
+        """Return the set of token types that occur in the tree."""
+
+        return set(self._nodes)
+
+    def toDict(self):
+        """Return the index in the format of TreeWizard.index()."""
+
+        return {ttype: list(nodes) for ttype, nodes in self._nodes.items()}
+
+    def add(self, t):
+        """
+        Index t and all its descendants.  Nodes already indexed are skipped
+        together with their subtrees, which are indexed, too.
+        """
+
+        if t is None:
+            return
+
+        adaptor = self.adaptor
+        types = self._types
+        work = [t]
+        while work:
+            t = work.pop()
+            if t in types:
+                continue
+
+            ttype = adaptor.getType(t)
+            types[t] = ttype
+            nodes = self._nodes.get(ttype)
+            if nodes is None:
+                self._nodes[ttype] = nodes = {}
+            nodes[t] = None
+
+            for i in range(adaptor.getChildCount(t) - 1, -1, -1):
+                work.append(adaptor.getChild(t, i))
+
+    def remove(self, t):
+        """Remove t and all its descendants from the index."""
+
+        if t is None:
+            return
+
+        adaptor = self.adaptor
+        work = [t]
+        while work:
+            t = work.pop()
+            self._forget(t)
+            for i in range(adaptor.getChildCount(t)):
+                work.append(adaptor.getChild(t, i))
+
+    def _forget(self, t):
+        """Remove the single node t from the index."""
+
+        if t in self._types:
+            ttype = self._types.pop(t)
+            nodes = self._nodes[ttype]
+            del nodes[t]
+            if not nodes:
+                del self._nodes[ttype]
+
+
+class IndexingTreeAdaptor(CommonTreeAdaptor):
+    """
+    @brief A CommonTreeAdaptor that keeps TreeIndex and SubtreeHasher
+    objects up to date.
+
+    Every mutation of an indexed tree that goes through addChild(),
+    setChild(), deleteChild(), replaceChildren(), becomeRoot() or
+    rulePostProcessing() is reported to the indexes in the indexes list,
+    which TreeIndex objects created with this adaptor add themselves to.
+    Likewise, the hashers in the hashers list drop the cached hashes of
+    the modified node and its ancestors.  Building nodes that are not (yet)
+    part of an indexed tree costs nothing extra.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.indexes = []
+        self.hashers = []
+
+    def _indexesOf(self, t):
+        return [index for index in self.indexes if t in index]
+
+    def _invalidateHashes(self, t):
+        for hasher in self.hashers:
+            hasher.invalidate(t)
+
+    def addChild(self, t, child):
+        if self.hashers:
+            self._invalidateHashes(t)
+
+        indexes = self._indexesOf(t) if self.indexes else None
+        if not indexes or child is None:
+            super().addChild(t, child)
+            return
+
+        if self.isNil(child):
+            added = [self.getChild(child, i) for i in range(self.getChildCount(child))]
+        else:
+            added = [child]
+
+        super().addChild(t, child)
+
+        for index in indexes:
+            for node in added:
+                index.add(node)
+
+    def setChild(self, t, i, child):
+        if self.hashers:
+            self._invalidateHashes(t)
+
+        indexes = self._indexesOf(t) if self.indexes else None
+        if not indexes:
+            super().setChild(t, i, child)
+            return
+
+        old = self.getChild(t, i)
+        super().setChild(t, i, child)
+
+        for index in indexes:
+            index.remove(old)
+            index.add(child)
+
+    def deleteChild(self, t, i):
+        if self.hashers:
+            self._invalidateHashes(t)
+
+        indexes = self._indexesOf(t) if self.indexes else None
+        if not indexes:
+            return super().deleteChild(t, i)
+
+        old = self.getChild(t, i)
+        result = super().deleteChild(t, i)
+
+        for index in indexes:
+            index.remove(old)
+
+        return result
+
+    def replaceChildren(self, parent, startChildIndex, stopChildIndex, t):
+        if self.hashers:
+            self._invalidateHashes(parent)
+
+        indexes = self._indexesOf(parent) if self.indexes else None
+        if not indexes:
+            super().replaceChildren(parent, startChildIndex, stopChildIndex, t)
+            return
+
+        old = [
+            self.getChild(parent, i) for i in range(startChildIndex, stopChildIndex + 1)
+        ]
+        remaining = self.getChildCount(parent) - len(old)
+        super().replaceChildren(parent, startChildIndex, stopChildIndex, t)
+        added = self.getChildCount(parent) - remaining
+
+        for index in indexes:
+            for node in old:
+                index.remove(node)
+            for i in range(startChildIndex, startChildIndex + added):
+                index.add(self.getChild(parent, i))
+
+    def becomeRoot(self, newRoot, oldRoot):
+        indexes = self._indexesOf(oldRoot) if self.indexes else None
+        result = super().becomeRoot(newRoot, oldRoot)
+
+        if self.hashers:
+            self._invalidateHashes(result)
+            if oldRoot is not None and self.isNil(oldRoot):
+                self._invalidateHashes(oldRoot)
+
+        if indexes:
+            for index in indexes:
+                if self.isNil(oldRoot):
+                    # its children moved over to result, the node is gone
+                    index._forget(oldRoot)
+
+                if index.root is oldRoot:
+                    index.root = result
+                index.add(result)
+
+        return result
+
+    def rulePostProcessing(self, root):
+        indexes = self._indexesOf(root) if self.indexes else None
+        result = super().rulePostProcessing(root)
+
+        if indexes and result is not root:
+            for index in indexes:
+                index._forget(root)
+                if index.root is root:
+                    index.root = result
+
+        return result
+
+
+class SubtreeHasher:
+    """
+    @brief Structural hashes of subtrees.
+
+    The hash of a subtree is computed Merkle-style from the type and text
+    of its root and the hashes of its children, bottom-up in a single walk,
+    and cached for every node of the subtree in a side table.  Two subtrees
+    with different hashes are never equal, so most inequality checks cost
+    a dict lookup; equal hashes are confirmed by comparing the trees.
+
+    If the adaptor is an IndexingTreeAdaptor, the hasher registers with it
+    and cached hashes are invalidated when a subtree is modified through
+    the adaptor.  Otherwise call invalidate() (or clear()) after modifying
+    a tree.  The side table keeps references to all hashed nodes until
+    clear() is called.
+    """
+
+    def __init__(self, adaptor=None):
+        if adaptor is None:
+            adaptor = CommonTreeAdaptor()
+
+        self.adaptor = adaptor
+
+        # node -> structural hash
+        self._hashes = {}
+
+        # structural hash -> list of canonical subtrees, see canonical()
+        self._canonical = {}
+
+        if isinstance(adaptor, IndexingTreeAdaptor):
+            adaptor.hashers.append(self)
+
+    def close(self):
+        """Stop receiving invalidations from the adaptor."""
+
+        if isinstance(self.adaptor, IndexingTreeAdaptor):
+            try:
+                self.adaptor.hashers.remove(self)
+            except ValueError:
+                pass
+
+    def clear(self):
+        """Forget all cached hashes and canonical subtrees."""
+
+        self._hashes.clear()
+        self._canonical.clear()
+
+    def hash(self, t):
+        """Return the structural hash of the subtree t."""
+
+        hashes = self._hashes
+        h = hashes.get(t)
+        if h is not None:
+            return h
+
+        adaptor = self.adaptor
+
+        # postorder walk, children of a node are hashed before the node
+        work = [(t, False)]
+        while work:
+            node, childrenDone = work.pop()
+            if node in hashes:
+                continue
+
+            n = adaptor.getChildCount(node)
+            if childrenDone or n == 0:
+                hashes[node] = hash(
+                    (adaptor.getType(node), adaptor.getText(node))
+                    + tuple(hashes[adaptor.getChild(node, i)] for i in range(n))
+                )
+
+            else:
+                work.append((node, True))
+                for i in range(n - 1, -1, -1):
+                    child = adaptor.getChild(node, i)
+                    if child not in hashes:
+                        work.append((child, False))
+
+        return hashes[t]
+
+    def invalidate(self, t):
+        """
+        Drop the cached hashes of t and its ancestors, which change when
+        t's children or content are modified.
+        """
+
+        hashes = self._hashes
+        adaptor = self.adaptor
+        while t is not None and t in hashes:
+            del hashes[t]
+            t = adaptor.getParent(t)
+
+    def equals(self, t1, t2, exact=True):
+        """
+        Compare t1 and t2 like TreeWizard.equals(), returning early if
+        their hashes differ.
+
+        Equal hashes are confirmed by comparing the trees, unless exact is
+        false, in which case the (very unlikely) event of a hash collision
+        is accepted and the check always takes constant time for hashed
+        subtrees.
+        """
+
+        if t1 is None or t2 is None:
+            return False
+
+        if t1 is t2:
+            return True
+
+        if self.hash(t1) != self.hash(t2):
+            return False
+
+        if not exact:
+            return True
+
+        adaptor = self.adaptor
+        getType = adaptor.getType
+        getText = adaptor.getText
+        getChildCount = adaptor.getChildCount
+        getChild = adaptor.getChild
+
+        work = [(t1, t2)]
+        while work:
+            a, b = work.pop()
+            if a is b:
+                continue
+
+            if getType(a) != getType(b) or getText(a) != getText(b):
+                return False
+
+            n = getChildCount(a)
+            if n != getChildCount(b):
+                return False
+
+            for i in range(n):
+                work.append((getChild(a, i), getChild(b, i)))
+
+        return True
+
+    def canonical(self, t):
+        """
+        Return the first subtree passed to canonical() that is structurally
+        equal to t, or t itself, which then becomes the canonical subtree
+        for its structure.
+        """
+
+        h = self.hash(t)
+        candidates = self._canonical.get(h)
+        if candidates is None:
+            self._canonical[h] = [t]
+            return t
+
+        for candidate in candidates:
+            if self.equals(candidate, t):
+                return candidate
+
+        candidates.append(t)
+        return t
+
+    def share(self, tree):
+        """
+        @brief Hash-cons tree, so identical subtrees are shared.
+
+        Each subtree of tree is replaced by its canonical subtree (see
+        canonical()), and the possibly replaced root is returned.  This
+        turns the tree into a DAG: a shared node is a child of several
+        parents, but its parent and child index only refer to the one it
+        was attached to last, so shared subtrees must be treated as
+        read-only.
+        """
+
+        if tree is None:
+            return None
+
+        adaptor = self.adaptor
+
+        # postorder walk, children are replaced before their parent is
+        # looked up
+        work = [(tree, False)]
+        while work:
+            node, childrenDone = work.pop()
+            n = adaptor.getChildCount(node)
+            if childrenDone or n == 0:
+                for i in range(n):
+                    child = adaptor.getChild(node, i)
+                    shared = self.canonical(child)
+                    if shared is not child:
+                        adaptor.setChild(node, i, shared)
+
+            else:
+                work.append((node, True))
+                for i in range(n - 1, -1, -1):
+                    work.append((adaptor.getChild(node, i), False))
+
+        return self.canonical(tree)
+
+
 class TreeWizard:
     """
     Build and navigate trees with this object.  Must know about the names
@@ -312,6 +771,9 @@ class TreeWizard:
     match subtrees against it.
     """
 
+    ## Maximum number of compiled patterns kept by compile()
+    patternCacheSize = 1024
+
     def __init__(self, adaptor=None, tokenNames=None, typeMap=None):
         if adaptor is None:
             self.adaptor = CommonTreeAdaptor()
@@ -328,6 +790,42 @@ class TreeWizard:
 
             self.tokenNameToTypeMap = typeMap
 
+        # pattern string -> TreePattern (or None), least recently used first
+        self._patternCache = OrderedDict()
+
+    def compile(self, pattern):
+        """
+        Compile a pattern string like "(ASSIGN %lhs:ID %rhs:.)" into a
+        TreePattern, which can be passed to parse(), find() and visit()
+        instead of the string.  Returns None if the pattern is malformed.
+
+        Compiled patterns are cached (up to patternCacheSize of them), so
+        compiling the same string again is cheap.  The returned TreePattern
+        is shared and must not be modified.  If pattern is already a
+        TreePattern, it is returned as is.
+        """
+
+        if isinstance(pattern, TreePattern):
+            return pattern
+
+        cache = self._patternCache
+        try:
+            tpattern = cache[pattern]
+
+        except KeyError:
+            tokenizer = TreePatternLexer(pattern)
+            parser = TreePatternParser(tokenizer, self, TreePatternTreeAdaptor())
+            tpattern = parser.pattern()
+
+            cache[pattern] = tpattern
+            if len(cache) > self.patternCacheSize:
+                cache.popitem(last=False)
+
+        else:
+            cache.move_to_end(pattern)
+
+        return tpattern
+
     def getTokenType(self, tokenName):
         """Using the map of token names to token types, return the type."""
 
@@ -364,10 +862,35 @@ class TreeWizard:
         of your AST node type.  The int is the token type of the node.
         """
 
+        index = self._indexOf(tree)
+        if index is not None:
+            return index.toDict()
+
         m = {}
         self._index(tree, m)
         return m
 
+    def buildIndex(self, tree):
+        """
+        Build a TreeIndex for tree.  If this wizard's adaptor is an
+        IndexingTreeAdaptor, the index is kept up to date as the tree is
+        modified, and find() and visit() on tree are answered from the index
+        in time proportional to the number of matches rather than the size
+        of the tree.  Nodes are then reported in index order, which is only
+        preorder until the tree is modified.
+        """
+
+        return TreeIndex(tree, self.adaptor)
+
+    def _indexOf(self, tree):
+        """Return the maintained TreeIndex rooted at tree, if there is one."""
+
+        for index in getattr(self.adaptor, "indexes", ()):
+            if index.root is tree:
+                return index
+
+        return None
+
     def _index(self, t, m):
         """Do the work for index"""
 
@@ -388,14 +911,15 @@ class TreeWizard:
         """Return a list of matching token.
 
         what may either be an integer specifzing the token type to find or
-        a string with a pattern that must be matched.
+        a string with a pattern that must be matched (or a TreePattern
+        returned by compile()).
 
         """
 
         if isinstance(what, int):
             return self._findTokenType(tree, what)
 
-        elif isinstance(what, str):
+        elif isinstance(what, (str, TreePattern)):
             return self._findPattern(tree, what)
 
         else:
@@ -404,6 +928,10 @@ class TreeWizard:
     def _findTokenType(self, t, ttype):
         """Return a List of tree nodes with token type ttype"""
 
+        index = self._indexOf(t)
+        if index is not None:
+            return index.get(ttype)
+
         nodes = []
 
         def visitor(tree, parent, childIndex, labels):
@@ -418,10 +946,7 @@ class TreeWizard:
 
         subtrees = []
 
-        # Create a TreePattern from the pattern
-        tokenizer = TreePatternLexer(pattern)
-        parser = TreePatternParser(tokenizer, self, TreePatternTreeAdaptor())
-        tpattern = parser.pattern()
+        tpattern = self.compile(pattern)
 
         # don't allow invalid patterns
         if (
@@ -444,8 +969,8 @@ class TreeWizard:
     def visit(self, tree, what, visitor):
         """Visit every node in tree matching what, invoking the visitor.
 
-        If what is a string, it is parsed as a pattern and only matching
-        subtrees will be visited.
+        If what is a string, it is parsed as a pattern (see compile()) and
+        only matching subtrees will be visited.
         The implementation uses the root node of the pattern in combination
         with visit(t, ttype, visitor) so nil-rooted patterns are not allowed.
         Patterns with wildcard roots are also not allowed.
@@ -458,9 +983,13 @@ class TreeWizard:
         """
 
         if isinstance(what, int):
-            self._visitType(tree, None, 0, what, visitor)
+            index = self._indexOf(tree)
+            if index is not None:
+                self._visitIndex(index, what, visitor)
+            else:
+                self._visitType(tree, None, 0, what, visitor)
 
-        elif isinstance(what, str):
+        elif isinstance(what, (str, TreePattern)):
             self._visitPattern(tree, what, visitor)
 
         else:
@@ -479,15 +1008,23 @@ class TreeWizard:
             child = self.adaptor.getChild(t, i)
             self._visitType(child, t, i, ttype, visitor)
 
+    def _visitIndex(self, index, ttype, visitor):
+        """Do the work for visit using a TreeIndex"""
+
+        for t in index.get(ttype):
+            if t is index.root:
+                visitor(t, None, 0, None)
+            else:
+                visitor(
+                    t, self.adaptor.getParent(t), self.adaptor.getChildIndex(t), None
+                )
+
     def _visitPattern(self, tree, pattern, visitor):
         """
         For all subtrees that match the pattern, execute the visit action.
         """
 
-        # Create a TreePattern from the pattern
-        tokenizer = TreePatternLexer(pattern)
-        parser = TreePatternParser(tokenizer, self, TreePatternTreeAdaptor())
-        tpattern = parser.pattern()
+        tpattern = self.compile(pattern)
 
         # don't allow invalid patterns
         if (
@@ -506,6 +1043,71 @@ class TreeWizard:
 
         self.visit(tree, rootTokenType, rootvisitor)
 
+    def matchAll(self, tree, patterns):
+        """
+        @brief Match many patterns against tree in a single walk.
+
+        patterns is either a dict mapping pattern ids to patterns or a
+        sequence of patterns, in which case the ids are the indexes into
+        the sequence.  Patterns may be strings or TreePatterns from
+        compile(); nil rooted patterns are not allowed, wildcard roots are.
+
+        This is a generator yielding a (patternId, node, labels) tuple for
+        each match, nodes in preorder and, for each node, the patterns in
+        the order they were given.  The patterns are dispatched on the type
+        and child count of their root, so each node is only checked against
+        the patterns that can possibly match it.
+        """
+
+        if isinstance(patterns, dict):
+            items = patterns.items()
+        else:
+            items = enumerate(patterns)
+
+        # (root type, child count) -> [(order, id, pattern)], root type None
+        # for wildcard roots
+        table = {}
+        for order, (patternId, pattern) in enumerate(items):
+            tpattern = self.compile(pattern)
+            if tpattern is None or tpattern.isNil():
+                raise ValueError("invalid pattern {!r}".format(patternId))
+
+            if isinstance(tpattern, WildcardTreePattern):
+                rootType = None
+            else:
+                rootType = tpattern.getType()
+
+            key = (rootType, tpattern.getChildCount())
+            table.setdefault(key, []).append((order, patternId, tpattern))
+
+        # candidate lists for node shapes seen so far, with wildcard rooted
+        # patterns merged in
+        candidates = {}
+        empty = []
+
+        adaptor = self.adaptor
+        work = [tree] if tree is not None else []
+        while work:
+            t = work.pop()
+            n = adaptor.getChildCount(t)
+            key = (adaptor.getType(t), n)
+
+            matching = candidates.get(key)
+            if matching is None:
+                matching = table.get(key, empty) + table.get((None, n), empty)
+                matching.sort(key=lambda c: c[0])
+                candidates[key] = matching
+
+            for _, patternId, tpattern in matching:
+                labels = {}
+                if self._parse(t, tpattern, labels):
+                    yield patternId, t, labels
+
+            for i in range(n - 1, -1, -1):
+                work.append(adaptor.getChild(t, i))
+
+    match_all = matchAll
+
     def parse(self, t, pattern, labels=None):
         """
         Given a pattern like (ASSIGN %lhs:ID %rhs:.) with optional labels
@@ -516,13 +1118,11 @@ class TreeWizard:
 
         If a node specifies a text arg in pattern, then that must match
         for that node in t.
-        """
 
-        tokenizer = TreePatternLexer(pattern)
-        parser = TreePatternParser(tokenizer, self, TreePatternTreeAdaptor())
-        tpattern = parser.pattern()
+        pattern may also be a TreePattern returned by compile().
+        """
 
-        return self._parse(t, tpattern, labels)
+        return self._parse(t, self.compile(pattern), labels)
 
     def _parse(self, t1, tpattern, labels):
         """
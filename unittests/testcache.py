@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import antlr3
+from antlr3.cache import ParseCache
+from antlr3.tree import CommonTreeAdaptor, FlatTreeAdaptor
+
+WORD = 4
+
+
+class WordLexer(antlr3.Lexer):
+    api_version = "HEAD"
+
+    def mTokens(self):
+        if self.input.LA(1) == ord(" "):
+            self.match(" ")
+            self.skip()
+
+        else:
+            self.matchRange(ord("a"), ord("z"))
+            while ord("a") <= self.input.LA(1) <= ord("z"):
+                self.input.consume()
+            self._state.type = WORD
+
+    def emitErrorMessage(self, msg):
+        pass
+
+
+class WordParser(antlr3.Parser):
+    """words : WORD* -> ^(nil WORD*)"""
+
+    api_version = "HEAD"
+    parses = 0
+
+    def __init__(self, input, state=None):
+        super().__init__(input, state)
+        self.adaptor = CommonTreeAdaptor()
+
+    def words(self):
+        WordParser.parses += 1
+
+        retval = antlr3.ParserRuleReturnScope()
+        retval.start = self.input.LT(1)
+        root = self.adaptor.nil()
+        while self.input.LA(1) == WORD:
+            token = self.match(self.input, WORD, None)
+            self.adaptor.addChild(root, self.adaptor.createWithPayload(token))
+        self.match(self.input, antlr3.EOF, None)
+        retval.tree = self.adaptor.rulePostProcessing(root)
+        return retval
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParseCache(self.directory)
+        WordParser.parses = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, text, **kwargs):
+        return self.cache.parse(text, WordLexer, WordParser, "words", **kwargs)
+
+    def testMissThenHit(self):
+        tokens, tree = self.parse("foo bar baz")
+        self.assertEqual(tree.toStringTree(), "foo bar baz")
+        self.assertEqual(WordParser.parses, 1)
+
+        tokens, tree = self.parse("foo bar baz")
+        self.assertEqual(tree.toStringTree(), "foo bar baz")
+        self.assertEqual([t.text for t in tokens], ["foo", "bar", "baz"])
+        self.assertEqual(WordParser.parses, 1)
+
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.stores, 1)
+
+    def testKeyDependsOnInputAndRule(self):
+        key = self.cache.key("foo", WordLexer, WordParser, "words")
+
+        self.assertEqual(key, self.cache.key("foo", WordLexer, WordParser, "words"))
+        self.assertNotEqual(key, self.cache.key("fo", WordLexer, WordParser, "words"))
+        self.assertNotEqual(key, self.cache.key("foo", WordLexer, WordParser, "x"))
+
+    def testNoStoreOnSyntaxError(self):
+        self.parse("foo Bar")
+        self.assertEqual(self.cache.stores, 0)
+        self.assertEqual(self.cache.misses, 1)
+
+        self.parse("foo Bar")
+        self.assertEqual(WordParser.parses, 2)
+
+    def testStats(self):
+        self.parse("foo")
+        self.parse("foo")
+        self.parse("bar")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertAlmostEqual(stats["hitRate"], 1 / 3)
+
+    def testCorruptEntry(self):
+        self.parse("foo")
+        key = self.cache.key("foo", WordLexer, WordParser, "words")
+        path = os.path.join(self.directory, key + ".a3pr")
+        with open(path, "wb") as fp:
+            fp.write(b"garbage")
+
+        _, tree = self.parse("foo")
+        self.assertEqual(tree.toStringTree(), "foo")
+        self.assertEqual(WordParser.parses, 2)
+
+    def testEviction(self):
+        cache = None
+        for i, text in enumerate(["aaa", "bbb", "ccc", "ddd"]):
+            if cache is None:
+                self.parse(text)
+                (name,) = os.listdir(self.directory)
+                size = os.path.getsize(os.path.join(self.directory, name))
+                cache = ParseCache(self.directory, maxSize=2 * size)
+
+            else:
+                cache.parse(text, WordLexer, WordParser, "words")
+
+            # don't let the LRU order depend on the timestamp resolution
+            key = cache.key(text, WordLexer, WordParser, "words")
+            path = os.path.join(self.directory, key + ".a3pr")
+            os.utime(path, ns=(i + 1, i + 1))
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(cache.evictions, 2)
+        _, tree = cache.parse("ddd", WordLexer, WordParser, "words")
+        self.assertEqual(tree.toStringTree(), "ddd")
+        self.assertEqual(cache.hits, 1)
+
+    def testFlatAdaptor(self):
+        self.parse("foo bar")
+
+        adaptor = FlatTreeAdaptor()
+        _, root = self.parse("foo bar", adaptor=adaptor)
+
+        self.assertEqual(WordParser.parses, 1)
+        self.assertEqual(adaptor.getChildCount(root), 2)
+        self.assertEqual(adaptor.getText(adaptor.getChild(root, 1)), "bar")
+
+    def testClear(self):
+        self.parse("foo")
+        self.cache.clear()
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,439 @@
+import io
+import json
+import socket
+import threading
+import time
+import unittest
+
+from antlr3.debug import (
+    BinaryEventRecorder,
+    BinaryEventReplayer,
+    DebugEventSocketProxy,
+    ProfileDebugEventListener,
+)
+from antlr3.exceptions import MismatchedTokenException, RecognitionException
+from antlr3.tokens import CommonToken, Token
+from antlr3.tree import CommonTree, FlatTreeAdaptor
+
+
+def freePort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+class Recognizer:
+    def getGrammarFileName(self):
+        return "T.g"
+
+
+class Debugger(threading.Thread):
+    """A fake debugger, which acks every event like ANTLRWorks does."""
+
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.port = port
+        self.handshake = []
+        self.events = []
+
+    def run(self):
+        tstart = time.time()
+        while True:
+            try:
+                s = socket.create_connection(("127.0.0.1", self.port))
+                break
+            except ConnectionRefusedError:
+                if time.time() - tstart > 10:
+                    raise
+                time.sleep(0.01)
+
+        s.settimeout(10.0)
+        with s, s.makefile("rb") as input, s.makefile("wb") as output:
+            self.handshake.append(input.readline().decode().rstrip("\n"))
+            self.handshake.append(input.readline().decode().rstrip("\n"))
+            output.write(b"ACK\n")
+            output.flush()
+
+            while True:
+                event = input.readline().decode().rstrip("\n")
+                self.events.append(event)
+                output.write(b"ACK\n")
+                output.flush()
+
+                if event == "terminate":
+                    break
+
+
+class TestDebugEventSocketProxy(unittest.TestCase):
+    def connect(self, **kwargs):
+        port = freePort()
+        debugger = Debugger(port)
+        debugger.start()
+
+        proxy = DebugEventSocketProxy(Recognizer(), port=port, **kwargs)
+        proxy.handshake()
+        return proxy, debugger
+
+    def sendEvents(self, proxy):
+        token = CommonToken(type=4, text="a\nb")
+        token.index = 3
+        token.line = 2
+        token.charPositionInLine = 7
+
+        proxy.enterRule("T.g", "a")
+        for i in range(100):
+            proxy.enterDecision(i, False)
+            proxy.LT(1, token)
+            proxy.exitDecision(i)
+            proxy.consumeToken(token)
+        proxy.exitRule("T.g", "a")
+        proxy.terminate()
+
+    def testHandshake(self):
+        proxy, debugger = self.connect()
+        proxy.terminate()
+        debugger.join()
+
+        self.assertEqual(debugger.handshake, ["ANTLR 2", 'grammar "T.g"'])
+        self.assertEqual(debugger.events, ["terminate"])
+
+    def testLockStep(self):
+        proxy, debugger = self.connect()
+
+        proxy.enterRule("T.g", "a")
+        self.assertEqual(proxy._unacked, 0)
+        self.assertEqual(debugger.events, ["enterRule\tT.g\ta"])
+
+        self.sendEvents(proxy)
+        debugger.join()
+
+        self.assertEqual(len(debugger.events), 404)
+        self.assertEqual(debugger.events[3], 'LT\t1\t3\t4\t0\t2\t7\t"a%0Ab')
+
+    def testPipelined(self):
+        proxy, debugger = self.connect()
+        self.sendEvents(proxy)
+        debugger.join()
+
+        proxy, pipelinedDebugger = self.connect(window=64, batchSize=16)
+        proxy.enterRule("T.g", "a")
+        self.assertEqual(proxy._pending, 1)
+        proxy.exitRule("T.g", "a")
+        self.sendEvents(proxy)
+        pipelinedDebugger.join()
+
+        self.assertEqual(pipelinedDebugger.events[2:], debugger.events)
+        self.assertEqual(proxy._unacked, 0)
+        self.assertEqual(proxy._pending, 0)
+
+    def testClassDefaults(self):
+        class Proxy(DebugEventSocketProxy):
+            window = 100
+            batchSize = 10
+
+        proxy = Proxy(Recognizer())
+        self.assertEqual(proxy.window, 100)
+        self.assertEqual(proxy.batchSize, 10)
+
+        self.assertRaises(ValueError, DebugEventSocketProxy, Recognizer(), window=0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProfileDebugEventListener(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.profiler = ProfileDebugEventListener(timer=self.clock)
+        self.token = CommonToken(type=4, text="a")
+
+    def testRuleTimes(self):
+        p = self.profiler
+        p.enterRule("T.g", "a")
+        self.clock.now = 2.0
+        p.enterRule("T.g", "b")
+        self.clock.now = 3.0
+        p.enterRule("T.g", "b")
+        self.clock.now = 5.0
+        p.exitRule("T.g", "b")
+        p.exitRule("T.g", "b")
+        self.clock.now = 10.0
+        p.exitRule("T.g", "a")
+
+        rules = p.report()["rules"]
+        self.assertEqual(rules["a"]["invocations"], 1)
+        self.assertEqual(rules["a"]["inclusiveTime"], 10.0)
+        self.assertEqual(rules["a"]["exclusiveTime"], 7.0)
+        self.assertEqual(rules["b"]["invocations"], 2)
+        self.assertEqual(rules["b"]["inclusiveTime"], 3.0)
+        self.assertEqual(rules["b"]["exclusiveTime"], 3.0)
+        self.assertEqual(p.report()["time"], 10.0)
+
+    def testLookahead(self):
+        p = self.profiler
+        p.enterRule("T.g", "a")
+
+        p.enterDecision(1, False)
+        p.LT(1, self.token)
+        p.LT(2, self.token)
+        p.exitDecision(1)
+        p.consumeToken(self.token)
+
+        p.enterDecision(1, False)
+        p.LT(-1, self.token)
+        p.LT(1, self.token)
+        p.exitDecision(1)
+
+        decision = p.report()["decisions"][1]
+        self.assertEqual(decision["rule"], "a")
+        self.assertEqual(decision["invocations"], 2)
+        self.assertEqual(decision["lookahead"], {1: 1, 2: 1})
+        self.assertEqual(decision["maxLookahead"], 2)
+        self.assertEqual(decision["meanLookahead"], 1.5)
+        self.assertIsNone(decision["backtrackSuccessRate"])
+
+    def testBacktracking(self):
+        p = self.profiler
+        p.enterDecision(3, True)
+        for successful in (False, True):
+            p.LT(1, self.token)
+            p.mark(7)
+            p.beginBacktrack(1)
+            p.consumeToken(self.token)
+            p.consumeToken(self.token)
+
+            # a decision within the syntactic predicate
+            p.enterDecision(4, False)
+            p.LT(2, self.token)
+            p.exitDecision(4)
+
+            p.endBacktrack(1, successful)
+            p.rewind()
+        p.exitDecision(3)
+        p.consumeToken(self.token)
+
+        report = p.report()
+        self.assertEqual(report["decisions"][3]["lookahead"], {4: 1})
+        self.assertEqual(report["decisions"][3]["backtracks"], 2)
+        self.assertEqual(report["decisions"][3]["backtrackSuccessRate"], 0.5)
+        self.assertEqual(report["decisions"][4]["lookahead"], {2: 2})
+        self.assertEqual(report["tokens"]["consumed"], 5)
+        self.assertEqual(report["tokens"]["speculative"], 4)
+
+    def testTokensAndPredicates(self):
+        p = self.profiler
+        p.enterRule("T.g", "a")
+        p.consumeHiddenToken(self.token)
+        p.consumeToken(self.token)
+        p.semanticPredicate(True, "x > 1")
+        p.semanticPredicate(False, "x > 1")
+        p.recognitionException(None)
+        p.beginResync()
+        p.consumeToken(self.token)
+        p.endResync()
+        p.exitRule("T.g", "a")
+
+        report = p.report()
+        self.assertEqual(
+            report["tokens"],
+            {"consumed": 2, "hidden": 1, "speculative": 0, "resync": 1},
+        )
+        self.assertEqual(report["predicates"], {"x > 1": {"evaluations": 2, "true": 1}})
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual(report["rules"]["a"]["errors"], 1)
+
+    def testWriteReport(self):
+        p = self.profiler
+        p.enterRule("T.g", "a")
+        p.enterDecision(1, False)
+        p.LT(1, self.token)
+        p.exitDecision(1)
+        p.exitRule("T.g", "a")
+
+        out = io.StringIO()
+        p.writeReport(out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report["decisions"]["1"]["lookahead"], {"1": 1})
+        self.assertEqual(report["rules"]["a"]["invocations"], 1)
+
+        p.reset()
+        self.assertEqual(p.report()["rules"], {})
+
+
+class Calls:
+    """Records listener calls, with tokens, nodes and exceptions simplified."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def method(*args):
+            self.calls.append((name,) + tuple(self.simplify(a) for a in args))
+
+        return method
+
+    def simplify(self, arg):
+        if isinstance(arg, Token):
+            return ("token", arg.index, arg.type, arg.channel)
+        if isinstance(arg, CommonTree):
+            return ("node", arg.getType())
+        if isinstance(arg, RecognitionException):
+            return (type(arg).__name__, arg.index, arg.line, arg.charPositionInLine)
+        return arg
+
+
+class TestBinaryEventLog(unittest.TestCase):
+    def setUp(self):
+        self.tokens = []
+        for i, ttype in enumerate([4, 5, 4]):
+            token = CommonToken(type=ttype, text=str(i))
+            token.index = i
+            self.tokens.append(token)
+
+    def sendEvents(self, *listeners):
+        def send(name, *args):
+            for listener in listeners:
+                getattr(listener, name)(*args)
+
+        a, b, c = self.tokens
+        exc = MismatchedTokenException(4, None)
+        exc.index, exc.line, exc.charPositionInLine = 2, 1, 5
+        root, child = CommonTree(a), CommonTree(b)
+
+        send("commence")
+        send("enterRule", "T.g", "a")
+        send("location", 3, 7)
+        send("enterDecision", 1, True)
+        send("LT", 1, a)
+        send("mark", 0)
+        send("beginBacktrack", 1)
+        send("consumeToken", a)
+        send("consumeHiddenToken", b)
+        send("endBacktrack", 1, True)
+        send("rewind", 0)
+        send("rewind")
+        send("exitDecision", 1)
+        send("enterAlt", 2)
+        send("enterSubRule", 3)
+        send("semanticPredicate", False, "x > 1")
+        send("exitSubRule", 3)
+        send("recognitionException", exc)
+        send("beginResync")
+        send("endResync")
+        send("LT", 2, None)
+        send("nilNode", root)
+        send("createNode", root, a)
+        send("createNode", child)
+        send("becomeRoot", root, child)
+        send("addChild", root, child)
+        send("setTokenBoundaries", root, 0, 2)
+        send("consumeNode", root)
+        send("LT", 1, child)
+        send("exitRule", "T.g", "a")
+        send("terminate")
+
+    def testRoundTrip(self):
+        expected = Calls()
+        recorder = BinaryEventRecorder()
+        self.sendEvents(expected, recorder)
+
+        replayed = Calls()
+        BinaryEventReplayer(recorder.getvalue()).replay(replayed)
+
+        self.assertEqual(replayed.calls, expected.calls)
+        self.assertEqual(recorder.count, len(expected.calls))
+
+    def testTokens(self):
+        recorder = BinaryEventRecorder()
+        recorder.consumeToken(self.tokens[1])
+
+        consumed = []
+        listener = ProfileDebugEventListener()
+        listener.consumeToken = consumed.append
+        BinaryEventReplayer(recorder.getvalue(), tokens=self.tokens).replay(listener)
+
+        self.assertIs(consumed[0], self.tokens[1])
+
+    def testNodeIdentity(self):
+        recorder = BinaryEventRecorder()
+        root, child = CommonTree(self.tokens[0]), CommonTree(self.tokens[1])
+        recorder.addChild(root, child)
+        recorder.consumeNode(child)
+
+        nodes = []
+        listener = Calls()
+        listener.addChild = lambda r, c: nodes.extend([r, c])
+        listener.consumeNode = nodes.append
+        BinaryEventReplayer(recorder.getvalue()).replay(listener)
+
+        self.assertIsNot(nodes[0], nodes[1])
+        self.assertIs(nodes[1], nodes[2])
+
+    def testFlatAdaptor(self):
+        adaptor = FlatTreeAdaptor()
+        root = adaptor.createWithPayload(self.tokens[0])
+        child = adaptor.createWithPayload(self.tokens[1])
+
+        expected = Calls()
+        recorder = BinaryEventRecorder(adaptor=adaptor)
+        recorder.LT(1, root)
+        recorder.consumeNode(child)
+        recorder.LT(1, child)
+
+        replayed = Calls()
+        BinaryEventReplayer(recorder.getvalue()).replay(replayed)
+
+        self.assertEqual(
+            replayed.calls,
+            [
+                ("LT", 1, ("node", 4)),
+                ("consumeNode", ("node", 5)),
+                ("LT", 1, ("node", 5)),
+            ],
+        )
+
+    def testRingBuffer(self):
+        expected = Calls()
+        recorder = BinaryEventRecorder(ringSize=4)
+        self.sendEvents(expected, recorder)
+
+        replayed = Calls()
+        BinaryEventReplayer(recorder.getvalue()).replay(replayed)
+
+        self.assertEqual(replayed.calls, expected.calls[-4:])
+        self.assertEqual(replayed.calls[2], ("exitRule", "T.g", "a"))
+
+    def testFile(self):
+        out = io.BytesIO()
+        expected = Calls()
+        recorder = BinaryEventRecorder(out, bufferSize=64)
+        self.sendEvents(expected, recorder)
+        recorder.flush()
+
+        replayed = Calls()
+        BinaryEventReplayer(io.BytesIO(out.getvalue())).replay(replayed)
+
+        self.assertEqual(replayed.calls, expected.calls)
+        self.assertRaises(RuntimeError, recorder.getvalue)
+
+    def testBadData(self):
+        recorder = BinaryEventRecorder()
+        recorder.enterAlt(1)
+        data = recorder.getvalue()
+
+        self.assertRaises(ValueError, BinaryEventReplayer, b"XXXX" + data[4:])
+        replayer = BinaryEventReplayer(data[:-1])
+        self.assertRaises(ValueError, replayer.replay, Calls())
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,118 @@
+import types
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import antlr3
+from antlr3.cache import ParseCache
+from antlr3.main import LexerMain, ParserMain
+
+WORD = 4
+
+
+class WordLexer(antlr3.Lexer):
+    api_version = "HEAD"
+
+    def mTokens(self):
+        if self.input.LA(1) == ord(" "):
+            self.match(" ")
+            self._state.channel = antlr3.HIDDEN_CHANNEL
+
+        else:
+            self.matchRange(ord("a"), ord("z"))
+            while ord("a") <= self.input.LA(1) <= ord("z"):
+                self.input.consume()
+            self._state.type = WORD
+
+
+class WordParser(antlr3.Parser):
+    api_version = "HEAD"
+
+    def words(self):
+        while self.input.LA(1) == WORD:
+            self.match(self.input, WORD, None)
+        self.match(self.input, antlr3.EOF, None)
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        module = types.ModuleType("WordLexer")
+        module.WordLexer = WordLexer
+        sys.modules["WordLexer"] = module
+
+    def tearDown(self):
+        del sys.modules["WordLexer"]
+
+    def execute(self, main, *argv):
+        main.stdout = io.StringIO()
+        main.execute(["main"] + list(argv))
+        return main.stdout.getvalue()
+
+    def testLexerBenchmarkJSON(self):
+        output = self.execute(
+            LexerMain(WordLexer),
+            "--input=foo bar baz",
+            "--benchmark",
+            "--repeat=3",
+            "--warmup=0",
+            "--json",
+        )
+        report = json.loads(output)
+
+        self.assertEqual(report["repeat"], 3)
+        self.assertEqual(report["warmup"], 0)
+        self.assertEqual(report["chars"], 11)
+        self.assertEqual(report["tokens"], 5)
+        self.assertEqual(list(report["phases"]), ["lex", "total"])
+        self.assertGreater(report["peakMemory"], 0)
+        self.assertEqual(len(report["gcCollections"]), 3)
+
+    def testParserBenchmark(self):
+        output = self.execute(
+            ParserMain("WordLexer", WordParser),
+            "--rule=words",
+            "--input=foo bar",
+            "--benchmark",
+            "--repeat=2",
+        )
+
+        self.assertTrue(output.startswith("7 chars, 3 tokens, best of 2 runs"))
+        self.assertIn("  parse ", output)
+        self.assertIn("chars/s", output)
+
+    def testProfileOutput(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lexer.prof")
+            output = self.execute(
+                LexerMain(WordLexer),
+                "--input=foo",
+                "--no-output",
+                "--profile",
+                "--profile-output=" + path,
+            )
+
+            self.assertTrue(os.path.exists(path))
+            self.assertIn("function calls", output)
+
+    def testCachedEntryWithoutTree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory)
+            key = cache.key("foo bar", WordLexer, WordParser, "words")
+            cache.put(key, [], None)
+
+            output = self.execute(
+                ParserMain("WordLexer", WordParser),
+                "--rule=words",
+                "--input=foo bar",
+                "--cache-dir=" + directory,
+            )
+
+            self.assertEqual(output, "")
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
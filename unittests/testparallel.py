@@ -0,0 +1,140 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import antlr3
+from antlr3.parallel import ParallelLexer
+
+WORD = 4
+WS = 5
+NUM = 6
+
+
+class LineLexer(antlr3.Lexer):
+    """
+    WORD : 'a'..'z'+ ;
+    NUM : '0'..'9'+ { setText("#" + $text) } ;
+    WS : ' ' { $channel = HIDDEN } ;
+    NL : '\\n' { skip() } ;
+    """
+
+    api_version = "HEAD"
+
+    def mTokens(self):
+        c = self.input.LA(1)
+        if c == ord("\n"):
+            self.match("\n")
+            self.skip()
+
+        elif c == ord(" "):
+            self.match(" ")
+            self._state.type = WS
+            self._state.channel = antlr3.HIDDEN_CHANNEL
+
+        elif ord("0") <= c <= ord("9"):
+            while ord("0") <= self.input.LA(1) <= ord("9"):
+                self.input.consume()
+            self._state.type = NUM
+            self.text = "#" + self.text
+
+        else:
+            self.matchRange(ord("a"), ord("z"))
+            while ord("a") <= self.input.LA(1) <= ord("z"):
+                self.input.consume()
+            self._state.type = WORD
+
+    def emitErrorMessage(self, msg):
+        pass
+
+
+TEXT = "".join("line {} has Some words and 12 numbers\n".format(i) for i in range(200))
+
+
+def fields(stream):
+    return [
+        (
+            t.type,
+            t.channel,
+            t.text,
+            t.index,
+            t.start,
+            t.stop,
+            t.line,
+            t.charPositionInLine,
+        )
+        for t in stream.getTokens()
+    ]
+
+
+class TestParallelLexer(unittest.TestCase):
+    def setUp(self):
+        self.serial = antlr3.CommonTokenStream(LineLexer(antlr3.StringStream(TEXT)))
+        self.serial.fillBuffer()
+
+    def assertSameTokens(self, stream, serial=None):
+        serial = serial or self.serial
+        self.assertEqual(fields(stream), fields(serial))
+        self.assertEqual(
+            stream.tokenSource.getNumberOfSyntaxErrors(),
+            serial.tokenSource.getNumberOfSyntaxErrors(),
+        )
+        self.assertEqual(stream.LT(1).text, serial.LT(1).text)
+
+        eof, serialEOF = stream.makeEOFToken(), serial.makeEOFToken()
+        self.assertEqual(
+            (eof.start, eof.line, eof.charPositionInLine),
+            (serialEOF.start, serialEOF.line, serialEOF.charPositionInLine),
+        )
+
+    def testChunks(self):
+        lexer = ParallelLexer(LineLexer, chunkSize=10)
+
+        self.assertEqual(lexer.chunks("aaaaaaaaaaaa\nbb\nc"), [(0, 13), (13, 17)])
+        self.assertEqual(lexer.chunks("a\nb"), [(0, 3)])
+        self.assertEqual(lexer.chunks(""), [])
+
+    def testThreads(self):
+        with ThreadPoolExecutor(4) as executor:
+            lexer = ParallelLexer(LineLexer, chunkSize=500, executor=executor)
+            stream = lexer.tokenize(TEXT)
+
+        self.assertEqual(len(lexer.chunks(TEXT)), 15)
+        self.assertSameTokens(stream)
+        self.assertEqual(stream.tokenSource.getNumberOfSyntaxErrors(), 200)
+
+    def testProcesses(self):
+        with ProcessPoolExecutor(2) as executor:
+            lexer = ParallelLexer(LineLexer, chunkSize=2000, executor=executor)
+            stream = lexer.tokenize(antlr3.StringStream(TEXT))
+
+        self.assertSameTokens(stream)
+
+    def testFindBoundary(self):
+        """Chunks that don't start at the beginning of a line"""
+
+        def findBoundary(text, offset):
+            i = text.find(" ", offset)
+            return len(text) if i == -1 else i
+
+        with ThreadPoolExecutor(4) as executor:
+            lexer = ParallelLexer(
+                LineLexer, chunkSize=100, findBoundary=findBoundary, executor=executor
+            )
+            stream = lexer.tokenize(TEXT)
+
+        self.assertSameTokens(stream)
+
+    def testChannel(self):
+        serial = LineLexer(antlr3.StringStream(TEXT)).tokenize(antlr3.DEFAULT_CHANNEL)
+
+        with ThreadPoolExecutor(4) as executor:
+            lexer = ParallelLexer(LineLexer, chunkSize=500, executor=executor)
+            stream = lexer.tokenize(TEXT, antlr3.DEFAULT_CHANNEL)
+
+        self.assertEqual(
+            [(t.index, t.text, t.line) for t in stream.getTokens()],
+            [(t.index, t.text, t.line) for t in serial],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -44,6 +44,25 @@ class TestTokenSource(unittest.TestCase):
         self.assertEqual(tokens, [1, 2, 3, 4])
 
 
+class WordLexer(antlr3.Lexer):
+    """WORD : 'a'..'z'+ ; WS : ' ' { skip() } ;"""
+
+    api_version = "HEAD"
+
+    WORD = 4
+
+    def mTokens(self):
+        if self.input.LA(1) == ord(" "):
+            self.match(" ")
+            self.skip()
+
+        else:
+            self.matchRange(ord("a"), ord("z"))
+            while ord("a") <= self.input.LA(1) <= ord("z"):
+                self.matchRange(ord("a"), ord("z"))
+            self._state.type = self.WORD
+
+
 class TestLexer(unittest.TestCase):
     def testInit(self):
         """Lexer.__init__()"""
@@ -54,6 +73,396 @@ class TestLexer(unittest.TestCase):
         stream = antlr3.StringStream("foo")
         TLexer(stream)
 
+    def testTextInterning(self):
+        """Lexer.setTextInterning()"""
+
+        lexer = WordLexer(antlr3.StringStream("foo bar foo"))
+        lexer.setTextInterning()
+        tokens = list(lexer)
+
+        self.assertEqual([t.text for t in tokens], ["foo", "bar", "foo"])
+        self.assertIs(tokens[0].text, tokens[2].text)
+        self.assertEqual((tokens[2].start, tokens[2].stop), (8, 10))
+
+    def matchLiteral(self, stream, literal):
+        class TLexer(antlr3.Lexer):
+            api_version = "HEAD"
+
+            def reportError(self, e):
+                pass
+
+        lexer = TLexer(stream)
+        try:
+            lexer.match(literal)
+        except antlr3.MismatchedTokenException as exc:
+            return stream.index(), (exc.index, exc.c, exc.line, exc.charPositionInLine)
+        return stream.index(), (stream.line, stream.charPositionInLine)
+
+    def testMatchLiteral(self):
+        """Lexer.match(str)"""
+
+        class SlowStream(antlr3.StringStream):
+            def LA(self, i):
+                return super().LA(i)
+
+        for text, literal in [
+            ("foo\nbar baz", "foo\nbar"),
+            ("foo\nbax", "foo\nbar"),
+            ("fo", "foo"),
+            ("", "x"),
+        ]:
+            self.assertEqual(
+                self.matchLiteral(antlr3.StringStream(text), literal),
+                self.matchLiteral(SlowStream(text), literal),
+            )
+
+        self.assertEqual(
+            self.matchLiteral(antlr3.StringStream("foo\nbar baz"), "foo\nbar"),
+            (7, (2, 3)),
+        )
+        self.assertEqual(
+            self.matchLiteral(antlr3.StringStream("foo\nbax"), "foo\nbar"),
+            (7, (6, "x", 2, 2)),
+        )
+
+
+class HiddenLexer(WordLexer):
+    """WORD : 'a'..'z'+ ; WS : ' ' { $channel = HIDDEN } ; NL : '\\n' { skip() } ;"""
+
+    def mTokens(self):
+        if self.input.LA(1) == ord("\n"):
+            self.match("\n")
+            self.skip()
+
+        elif self.input.LA(1) == ord(" "):
+            self.match(" ")
+            self._state.channel = antlr3.HIDDEN_CHANNEL
+
+        else:
+            super().mTokens()
+
+    def reportError(self, e):
+        pass
+
+
+class TestTokenize(unittest.TestCase):
+    text = "foo bar\nbaz  X qux\n"
+
+    def fields(self, tokens):
+        return [
+            (t.type, t.channel, t.text, t.index, t.line, t.charPositionInLine)
+            for t in tokens
+        ]
+
+    def expected(self, lexerClass, channel=None):
+        tokens = [
+            t
+            for t in lexerClass(antlr3.StringStream(self.text))
+            if channel is None or t.channel == channel
+        ]
+        for i, t in enumerate(tokens):
+            t.index = i
+        return self.fields(tokens)
+
+    def testTokenize(self):
+        """Lexer.tokenize()"""
+
+        tokens = HiddenLexer(antlr3.StringStream(self.text)).tokenize()
+        self.assertEqual(self.fields(tokens), self.expected(HiddenLexer))
+        self.assertEqual(
+            [t.text for t in tokens], ["foo", " ", "bar", "baz", " ", " ", " ", "qux"]
+        )
+
+    def testChannel(self):
+        """Lexer.tokenize(channel)"""
+
+        tokens = HiddenLexer(antlr3.StringStream(self.text)).tokenize(
+            antlr3.DEFAULT_CHANNEL
+        )
+        self.assertEqual(
+            self.fields(tokens), self.expected(HiddenLexer, antlr3.DEFAULT_CHANNEL)
+        )
+        self.assertEqual([t.index for t in tokens], [0, 1, 2, 3])
+
+    def testTokenizeInto(self):
+        """Lexer.tokenizeInto()"""
+
+        buffer = ["x"]
+        count = HiddenLexer(antlr3.StringStream("foo bar")).tokenizeInto(buffer)
+
+        self.assertEqual(count, 3)
+        self.assertEqual([t.index for t in buffer[1:]], [1, 2, 3])
+
+    def testOverriddenEmit(self):
+        """Lexer.tokenize() with a custom emit()"""
+
+        class UpperLexer(HiddenLexer):
+            def emit(self, token=None):
+                token = super().emit(token)
+                token.text = token.text.upper()
+                return token
+
+        tokens = UpperLexer(antlr3.StringStream(self.text)).tokenize()
+        self.assertEqual(self.fields(tokens), self.expected(UpperLexer))
+        self.assertEqual(tokens[0].text, "FOO")
+
+    def testHookedEmit(self):
+        """CommonTokenStream.fillBuffer() with emit() set on the instance"""
+
+        lexer = HiddenLexer(antlr3.StringStream(self.text))
+        emitted = []
+
+        def emit(token=None):
+            token = antlr3.Lexer.emit(lexer, token)
+            emitted.append(token)
+            return token
+
+        lexer.emit = emit
+        stream = antlr3.CommonTokenStream(lexer)
+        stream.fillBuffer()
+
+        self.assertEqual(len(emitted), 8)
+        self.assertEqual(emitted, stream.getTokens())
+
+    def testCounters(self):
+        """Lexer.tokenize() with counters enabled"""
+
+        lexer = HiddenLexer(antlr3.StringStream(self.text))
+        counters = lexer.enableCounters()
+        tokens = lexer.tokenize()
+
+        self.assertEqual(self.fields(tokens), self.expected(HiddenLexer))
+        self.assertEqual(counters.tokens, 8)
+
+    def testCommonTokenStream(self):
+        """CommonTokenStream.fillBuffer() with a lexer"""
+
+        stream = antlr3.CommonTokenStream(HiddenLexer(antlr3.StringStream(self.text)))
+        stream.discardOffChannelTokens = True
+        stream.fillBuffer()
+
+        self.assertEqual(
+            self.fields(stream.getTokens()),
+            self.expected(HiddenLexer, antlr3.DEFAULT_CHANNEL),
+        )
+
+
+class CountedParser(antlr3.Parser):
+    """words : ( (pair)=> pair | WORD )* EOF ; pair : WORD WORD ;"""
+
+    api_version = "HEAD"
+
+    def __init__(self, input, state=None):
+        super().__init__(input, state)
+        self._state.ruleMemo = {}
+
+        # WORD -> alt 1, EOF -> alt 2
+        self.dfa1 = antlr3.DFA(
+            self,
+            1,
+            eot=[-1, -1, -1],
+            eof=[2, -1, -1],
+            min=[WordLexer.WORD, 0, 0],
+            max=[WordLexer.WORD, 0, 0],
+            accept=[-1, 1, 2],
+            special=[-1, -1, -1],
+            transition=[[1], [], []],
+        )
+
+    def words(self):
+        while self.dfa1.predict(self.input) == 1:
+            if self.synpred1_T():
+                self.pair()
+            else:
+                self.match(self.input, WordLexer.WORD, None)
+        self.match(self.input, antlr3.EOF, None)
+
+    def pair(self):
+        start = self.input.index()
+        if self._state.backtracking > 0 and self.alreadyParsedRule(self.input, 1):
+            return
+
+        success = False
+        try:
+            self.match(self.input, WordLexer.WORD, None)
+            self.match(self.input, WordLexer.WORD, None)
+            success = True
+        finally:
+            if self._state.backtracking > 0:
+                self.memoize(self.input, 1, start, success)
+
+    def synpred1_T_fragment(self):
+        self.pair()
+
+    def synpred1_T(self):
+        self._state.backtracking += 1
+        start = self.input.mark()
+        try:
+            self.synpred1_T_fragment()
+            success = True
+        except antlr3.BacktrackingFailed:
+            success = False
+        self.input.rewind(start)
+        self._state.backtracking -= 1
+        return success
+
+
+class SynpredDFA(antlr3.DFA):
+    """Predict alt 1 if synpred1_T() matches, else alt 2"""
+
+    def __init__(self, recognizer):
+        super().__init__(
+            recognizer,
+            2,
+            eot=[-1, -1, -1],
+            eof=[-1, -1, -1],
+            min=[0, 0, 0],
+            max=[0, 0, 0],
+            accept=[-1, 1, 2],
+            special=[0, -1, -1],
+            transition=[[], [], []],
+        )
+
+    def specialStateTransition(self, s, input):
+        if self.recognizer.synpred1_T():
+            return 1
+        return 2
+
+
+class PredictedParser(CountedParser):
+    """words : ( (pair)=> pair | WORD )* EOF ; with the synpred in a DFA"""
+
+    def __init__(self, input, state=None):
+        super().__init__(input, state)
+        self.dfa2 = SynpredDFA(self)
+
+    def words(self):
+        while self.input.LA(1) == WordLexer.WORD:
+            if self.dfa2.predict(self.input) == 1:
+                self.pair()
+            else:
+                self.match(self.input, WordLexer.WORD, None)
+        self.match(self.input, antlr3.EOF, None)
+
+
+class PredictedLexer(antlr3.Lexer):
+    """FOO : ('foo')=> 'foo' | 'bar' ;"""
+
+    api_version = "HEAD"
+
+    def __init__(self, input=None, state=None):
+        super().__init__(input, state)
+        self.dfa1 = SynpredDFA(self)
+
+    def mTokens(self):
+        if self.dfa1.predict(self.input) == 1:
+            self.match("foo")
+        else:
+            self.match("bar")
+        self._state.type = 4
+
+    def synpred1_T_fragment(self):
+        self.match("foo")
+
+    def synpred1_T(self):
+        self._state.backtracking += 1
+        start = self.input.mark()
+        try:
+            self.synpred1_T_fragment()
+            success = True
+        except antlr3.BacktrackingFailed:
+            success = False
+        self.input.rewind(start)
+        self._state.backtracking -= 1
+        return success
+
+
+class TestRecognizerCounters(unittest.TestCase):
+    def testParser(self):
+        lexer = WordLexer(antlr3.StringStream("a b c"))
+        parser = CountedParser(antlr3.CommonTokenStream(lexer))
+        self.assertNotIn("match", vars(parser))
+        self.assertIsNone(parser.getCounters())
+
+        counters = parser.enableCounters()
+        parser.words()
+
+        self.assertIs(parser.getCounters(), counters)
+        self.assertEqual(
+            counters.toDict(),
+            {
+                "tokens": 7,
+                "predictions": 3,
+                "predictionSteps": 2,
+                "backtracks": 2,
+                "backtrackFailures": 1,
+                "memoHits": 0,
+                "memoMisses": 2,
+                "exceptions": 0,
+                "recoveries": 0,
+            },
+        )
+
+        # pair already failed at 'c'
+        parser.input.seek(2)
+        parser._state.backtracking = 1
+        self.assertRaises(antlr3.BacktrackingFailed, parser.pair)
+        self.assertEqual(counters.memoHits, 1)
+
+        counters.reset()
+        self.assertEqual(counters.tokens, 0)
+
+    def testDisable(self):
+        lexer = WordLexer(antlr3.StringStream("a"))
+        parser = CountedParser(antlr3.CommonTokenStream(lexer))
+        counters = parser.enableCounters()
+        parser.disableCounters()
+
+        self.assertIsNone(parser.getCounters())
+        self.assertNotIn("match", vars(parser))
+        self.assertNotIn("synpred1_T", vars(parser))
+        self.assertNotIn("predict", vars(parser.dfa1))
+
+        parser.words()
+        self.assertEqual(counters.tokens, 0)
+        self.assertIsNone(parser.dfa1.counters)
+
+    def testSynpredInPrediction(self):
+        """Symbols consumed by a syntactic predicate during prediction"""
+
+        lexer = HiddenLexer(antlr3.StringStream("a b c"))
+        parser = PredictedParser(antlr3.CommonTokenStream(lexer))
+        counters = parser.enableCounters()
+        parser.words()
+
+        # 1 + 'a b', 1 + 'c', hidden whitespace doesn't count
+        self.assertEqual(counters.predictions, 2)
+        self.assertEqual(counters.predictionSteps, 5)
+        self.assertEqual(counters.backtracks, 2)
+        self.assertEqual(counters.backtrackFailures, 1)
+
+    def testLexerSynpredInPrediction(self):
+        """Literals matched by a lexer's syntactic predicate"""
+
+        lexer = PredictedLexer(antlr3.StringStream("foobar"))
+        counters = lexer.enableCounters()
+
+        self.assertEqual([t.text for t in lexer], ["foo", "bar"])
+        # 1 + 'foo', 1 + nothing
+        self.assertEqual(counters.predictions, 2)
+        self.assertEqual(counters.predictionSteps, 5)
+        self.assertEqual(counters.backtrackFailures, 1)
+
+    def testLexer(self):
+        lexer = WordLexer(antlr3.StringStream("foo ? bar"))
+        lexer.emitErrorMessage = lambda msg: None
+        counters = lexer.enableCounters()
+
+        self.assertEqual([t.text for t in lexer], ["foo", "bar"])
+        self.assertEqual(counters.tokens, 2)
+        self.assertEqual(counters.exceptions, 1)
+        self.assertEqual(counters.recoveries, 1)
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,204 @@
+import io
+import unittest
+
+from antlr3 import serialize
+from antlr3.streams import ANTLRStringStream
+from antlr3.tokens import CommonToken
+from antlr3.tree import (
+    CommonErrorNode,
+    CommonTree,
+    CommonTreeAdaptor,
+    FlatTreeAdaptor,
+)
+
+
+class TestSerialize(unittest.TestCase):
+    """Test case for the serialize module."""
+
+    def setUp(self):
+        self.input = ANTLRStringStream("a + b\n* c")
+        self.tokens = []
+        for i, (ttype, start, stop, line, pos) in enumerate(
+            [
+                (4, 0, 0, 1, 0),
+                (5, 2, 2, 1, 2),
+                (4, 4, 4, 1, 4),
+                (6, 6, 6, 2, 0),
+                (4, 8, 8, 2, 2),
+            ]
+        ):
+            token = CommonToken(type=ttype, input=self.input, start=start, stop=stop)
+            token.index = i
+            token.line = line
+            token.charPositionInLine = pos
+            self.tokens.append(token)
+
+        # (* (+ a b) c) with an imaginary root
+        a, plus, b, times, c = (CommonTree(t) for t in self.tokens)
+        plus.addChild(a)
+        plus.addChild(b)
+        times.addChild(plus)
+        times.addChild(c)
+        self.tree = CommonTree(CommonToken(type=10, text="EXPR"))
+        self.tree.addChild(times)
+
+    def testRoundTrip(self):
+        data = serialize.dumps(self.tree, self.tokens)
+        tokens, tree = serialize.loads(data)
+
+        self.assertEqual(tree.toStringTree(), "(EXPR (* (+ a b) c))")
+        self.assertEqual(len(tokens), 5)
+
+    def testTokenFields(self):
+        tokens, _ = serialize.loads(serialize.dumps(tokens=self.tokens))
+
+        for orig, token in zip(self.tokens, tokens):
+            self.assertEqual(token.type, orig.type)
+            self.assertEqual(token.channel, orig.channel)
+            self.assertEqual(token.start, orig.start)
+            self.assertEqual(token.stop, orig.stop)
+            self.assertEqual(token.line, orig.line)
+            self.assertEqual(token.charPositionInLine, orig.charPositionInLine)
+            self.assertEqual(token.index, orig.index)
+            self.assertEqual(token.text, orig.text)
+            self.assertIsNone(token.input)
+
+    def testTreeSharesTokens(self):
+        self.tree.getChild(0).setTokenStartIndex(0)
+        self.tree.getChild(0).setTokenStopIndex(4)
+
+        tokens, tree = serialize.loads(serialize.dumps(self.tree, self.tokens))
+
+        self.assertIs(tree.getChild(0).token, tokens[3])
+        self.assertEqual(tree.getChild(0).getTokenStartIndex(), 0)
+        self.assertEqual(tree.getChild(0).getTokenStopIndex(), 4)
+
+    def testNoTree(self):
+        tokens, tree = serialize.loads(serialize.dumps(tokens=self.tokens))
+
+        self.assertIsNone(tree)
+        self.assertEqual(len(tokens), 5)
+
+    def testNilRoot(self):
+        root = CommonTree(None)
+        root.addChild(CommonTree(self.tokens[0]))
+        root.addChild(CommonTree(self.tokens[2]))
+
+        _, tree = serialize.loads(serialize.dumps(root))
+
+        self.assertTrue(tree.isNil())
+        self.assertEqual(tree.toStringTree(), "a b")
+
+    def testErrorNode(self):
+        root = CommonTree(self.tokens[1])
+        root.addChild(CommonErrorNode(None, self.tokens[0], self.tokens[0], None))
+
+        _, tree = serialize.loads(serialize.dumps(root))
+
+        self.assertEqual(tree.getChildCount(), 1)
+        self.assertEqual(tree.getChild(0).getType(), 0)
+
+    def testFlatAdaptor(self):
+        data = serialize.dumps(self.tree, self.tokens)
+        adaptor = FlatTreeAdaptor()
+        _, root = serialize.loads(data, adaptor)
+
+        self.assertEqual(adaptor.size(), 6)
+        self.assertEqual(
+            adaptor.toCommonTree(root).toStringTree(), "(EXPR (* (+ a b) c))"
+        )
+
+        # and back again
+        _, tree = serialize.loads(serialize.dumps(root, adaptor=adaptor))
+        self.assertEqual(tree.toStringTree(), "(EXPR (* (+ a b) c))")
+
+    def testNodeTypes(self):
+        adaptor = FlatTreeAdaptor()
+        root = adaptor.importTree(self.tree)
+        times = adaptor.getChild(root, 0)
+        adaptor.setType(times, 42)
+        data = serialize.dumps(root, self.tokens, adaptor)
+
+        flat = FlatTreeAdaptor()
+        _, root = serialize.loads(data, flat)
+        self.assertEqual(flat.getType(flat.getChild(root, 0)), 42)
+
+        _, tree = serialize.loads(data)
+        self.assertEqual(tree.getChild(0).getType(), 42)
+        self.assertEqual(tree.getChild(0).getText(), "*")
+
+    def testCustomAdaptor(self):
+        class Adaptor(CommonTreeAdaptor):
+            def __init__(self):
+                self.boundaries = []
+
+            def setTokenBoundaries(self, t, startToken, stopToken):
+                self.boundaries.append((startToken, stopToken))
+                super().setTokenBoundaries(t, startToken, stopToken)
+
+        self.tree.setTokenStartIndex(0)
+        self.tree.setTokenStopIndex(4)
+        adaptor = Adaptor()
+        tokens, tree = serialize.loads(serialize.dumps(self.tree, self.tokens), adaptor)
+
+        self.assertEqual(adaptor.boundaries[0], (tokens[0], tokens[4]))
+        self.assertEqual(tree.getTokenStopIndex(), 4)
+
+    def testNestedNil(self):
+        nil = CommonTree(None)
+        nil.addChild(CommonTree(self.tokens[0]))
+        self.tree.children.append(nil)
+
+        self.assertRaises(ValueError, serialize.dumps, self.tree)
+
+    def testUnicodeText(self):
+        token = CommonToken(type=4, text="ä€\U0001f600")
+
+        tokens, _ = serialize.loads(serialize.dumps(tokens=[token]))
+
+        self.assertEqual(tokens[0].text, "ä€\U0001f600")
+
+    def testDeepTree(self):
+        root = node = CommonTree(CommonToken(type=4, text="x"))
+        for _ in range(5000):
+            child = CommonTree(CommonToken(type=4, text="x"))
+            node.addChild(child)
+            node = child
+
+        _, tree = serialize.loads(serialize.dumps(root))
+
+        depth = 0
+        while tree.getChildCount():
+            tree = tree.getChild(0)
+            depth += 1
+        self.assertEqual(depth, 5000)
+
+    def testFile(self):
+        buf = io.BytesIO()
+        serialize.dump(buf, self.tree, self.tokens)
+        buf.seek(0)
+
+        _, tree = serialize.load(buf)
+
+        self.assertEqual(tree.toStringTree(), "(EXPR (* (+ a b) c))")
+
+    def testBadMagic(self):
+        data = serialize.dumps(self.tree, self.tokens)
+
+        self.assertRaises(ValueError, serialize.loads, b"XXXX" + data[4:])
+
+    def testBadVersion(self):
+        data = bytearray(serialize.dumps(self.tree, self.tokens))
+        data[4] = 99
+
+        self.assertRaises(ValueError, serialize.loads, bytes(data))
+
+    def testTruncated(self):
+        data = serialize.dumps(self.tree, self.tokens)
+
+        self.assertRaises(ValueError, serialize.loads, data[:-3])
+        self.assertRaises(ValueError, serialize.loads, data[:10])
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
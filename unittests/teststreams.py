@@ -1,4 +1,6 @@
 import os
+import pickle
+import random
 import unittest
 from io import StringIO
 
@@ -124,19 +126,73 @@ class TestStringStream(unittest.TestCase):
         self.assertEqual(stream.charPositionInLine, 0)
         self.assertEqual(stream.LT(1), "b")
 
-    ##     # not yet implemented
-    ##     def testSeekBackward(self):
-    ##         """StringStream.seek(): backward"""
+    def testSeekBackward(self):
+        """StringStream.seek(): backward"""
 
-    ##         stream = antlr3.StringStream('foo\nbar')
+        stream = antlr3.StringStream("foo\nbar")
+
+        stream.seek(4)
+        stream.seek(1)
+
+        self.assertEqual(stream.index(), 1)
+        self.assertEqual(stream.line, 1)
+        self.assertEqual(stream.charPositionInLine, 1)
+        self.assertEqual(stream.LA(1), ord("o"))
+
+    def testSeekPastEnd(self):
+        """StringStream.seek(): past EOF"""
+
+        stream = antlr3.StringStream("foo\nbar")
+
+        stream.seek(100)
+
+        self.assertEqual(stream.index(), 7)
+        self.assertEqual(stream.line, 2)
+        self.assertEqual(stream.charPositionInLine, 3)
+
+    def testSetLine(self):
+        """StringStream.line and charPositionInLine assignment"""
+
+        stream = antlr3.StringStream("foo\nbar\nbaz")
+
+        stream.consume()
+        stream.line = 10
+        stream.charPositionInLine = 5
+        marker = stream.mark()
+
+        stream.consume()
+        self.assertEqual(stream.line, 10)
+        self.assertEqual(stream.charPositionInLine, 6)
+
+        stream.seek(5)
+        self.assertEqual(stream.line, 11)
+        self.assertEqual(stream.charPositionInLine, 1)
+
+        stream.line = 1
+        stream.seek(9)
+        self.assertEqual(stream.line, 2)
+
+        stream.rewind(marker)
+        self.assertEqual(stream.line, 10)
+        self.assertEqual(stream.charPositionInLine, 5)
+
+    def testApplyEdit(self):
+        """StringStream.applyEdit()"""
+
+        stream = antlr3.StringStream("foo\nbar\nbaz")
+        stream.seek(9)
+        self.assertEqual((stream.line, stream.charPositionInLine), (3, 1))
+
+        stream.applyEdit(1, 5, "x\ny\nz")
+        self.assertEqual(stream.substring(0, stream.size() - 1), "fx\ny\nzar\nbaz")
+        self.assertEqual(stream.size(), 12)
+        self.assertEqual(stream.LA(1), ord("b"))
+        self.assertEqual((stream.line, stream.charPositionInLine), (4, 0))
 
-    ##         stream.seek(4)
-    ##         stream.seek(1)
+        stream.seek(12)
+        self.assertEqual((stream.line, stream.charPositionInLine), (4, 3))
 
-    ##         self.assertEqual(stream.index(), 1)
-    ##         self.assertEqual(stream.line, 1)
-    ##         self.assertEqual(stream.charPositionInLine, 1)
-    ##         self.assertEqual(stream.LA(1), 'o')
+        self.assertRaises(ValueError, stream.applyEdit, 5, 4, "")
 
     def testMark(self):
         """StringStream.mark()"""
@@ -569,6 +625,153 @@ class TestCommonTokenStream(unittest.TestCase):
             stream.toString(stream.tokens[1], stream.tokens[-2]), "bargnurz"
         )
 
+    def makeInputTokens(self):
+        inStream = antlr3.StringStream("foo bar foo")
+        for start, stop in [(0, 2), (4, 6), (8, 10)]:
+            self.source.tokens.append(
+                antlr3.CommonToken(type=12, input=inStream, start=start, stop=stop)
+            )
+
+    def testMaterializeText(self):
+        """CommonTokenStream.materializeText()"""
+
+        self.makeInputTokens()
+        stream = antlr3.CommonTokenStream(self.source)
+        stream.materializeText()
+
+        self.assertEqual([t.text for t in stream.tokens], ["foo", "bar", "foo"])
+        self.assertIs(stream.tokens[0].text, stream.tokens[2].text)
+        self.assertIsNotNone(stream.tokens[0].input)
+
+    def testTextInterning(self):
+        """CommonTokenStream.setTextInterning()"""
+
+        self.makeInputTokens()
+        stream = antlr3.CommonTokenStream(self.source)
+        stream.setTextInterning()
+
+        self.assertEqual(stream.toString(), "foobarfoo")
+        self.assertIs(stream.tokens[0].text, stream.tokens[2].text)
+        self.assertIs(stream.internTable["foo"], stream.tokens[0].text)
+
+    def testDetach(self):
+        """CommonTokenStream.detach()"""
+
+        self.makeInputTokens()
+        stream = antlr3.CommonTokenStream(self.source)
+        stream.LT(1)
+        stream.consume()
+        stream.detach()
+
+        self.assertIsNone(stream.getTokenSource())
+        self.assertTrue(all(t.input is None for t in stream.tokens))
+        self.assertEqual(stream.toString(), "foobarfoo")
+        self.assertEqual(stream.LT(1).text, "bar")
+        self.assertEqual(stream.LT(3).type, antlr3.EOF)
+
+        data = pickle.dumps(stream.tokens)
+        self.assertNotIn(b"StringStream", data)
+        self.assertEqual([t.text for t in pickle.loads(data)], ["foo", "bar", "foo"])
+
+
+class EditLexer(antlr3.Lexer):
+    """
+    WORD : 'a'..'z'+ ;
+    STRING : '"' ~'"'* '"' ;
+    WS : ' '+ { $channel = HIDDEN } ;
+    NL : '\\n' { skip() } ;
+    """
+
+    api_version = "HEAD"
+
+    def mTokens(self):
+        c = self.input.LA(1)
+        if c == ord("\n"):
+            self.match("\n")
+            self.skip()
+
+        elif c == ord(" "):
+            while self.input.LA(1) == ord(" "):
+                self.input.consume()
+            self._state.type = 5
+            self._state.channel = antlr3.HIDDEN_CHANNEL
+
+        elif c == ord('"'):
+            self.match('"')
+            while self.input.LA(1) not in (ord('"'), antlr3.EOF):
+                self.input.consume()
+            self.match('"')
+            self._state.type = 6
+
+        else:
+            self.matchRange(ord("a"), ord("z"))
+            while ord("a") <= self.input.LA(1) <= ord("z"):
+                self.input.consume()
+            self._state.type = 4
+
+    def emitErrorMessage(self, msg):
+        pass
+
+
+class TestIncrementalTokenStream(unittest.TestCase):
+    def fields(self, stream):
+        return [
+            (
+                t.type,
+                t.channel,
+                t.text,
+                t.index,
+                t.start,
+                t.stop,
+                t.line,
+                t.charPositionInLine,
+            )
+            for t in stream.getTokens() or []
+        ]
+
+    def lex(self, text):
+        stream = antlr3.IncrementalTokenStream(EditLexer(antlr3.StringStream(text)))
+        stream.fillBuffer()
+        return stream
+
+    def testApplyEdit(self):
+        """IncrementalTokenStream.applyEdit()"""
+
+        stream = self.lex("foo bar\nbaz qux\nquux")
+        qux = stream.tokens[-2]
+        first, stop = stream.applyEdit(4, 7, "x\ny z")
+
+        text = "foo x\ny z\nbaz qux\nquux"
+        self.assertEqual(stream.tokenSource.input.strdata, text)
+        self.assertEqual(self.fields(stream), self.fields(self.lex(text)))
+        self.assertEqual((first, stop), (1, 6))
+        self.assertIs(stream.tokens[-2], qux)
+        self.assertEqual(stream.LT(1).text, "foo")
+        self.assertEqual(stream.makeEOFToken().start, 22)
+
+    def testUnterminatedString(self):
+        """IncrementalTokenStream.applyEdit() changing the rest of the input"""
+
+        stream = self.lex('foo "bar" baz\nqux')
+        stream.applyEdit(0, 0, '"')
+
+        expected = self.lex('"foo "bar" baz\nqux')
+        self.assertEqual(self.fields(stream), self.fields(expected))
+
+    def testRandomEdits(self):
+        rnd = random.Random(1)
+        text = "foo bar\n" * 20
+        stream = self.lex(text)
+
+        for _ in range(300):
+            start = rnd.randint(0, len(text))
+            end = rnd.randint(start, min(len(text), start + 5))
+            newText = "".join(rnd.choices('ab \n"', k=rnd.randint(0, 4)))
+            text = text[:start] + newText + text[end:]
+
+            stream.applyEdit(start, end, newText)
+            self.assertEqual(self.fields(stream), self.fields(self.lex(text)), text)
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -1,3 +1,4 @@
+import io
 import unittest
 
 from antlr3 import DOWN, EOF, UP, CommonToken
@@ -5,6 +6,9 @@ from antlr3.tree import (
     CommonTree,
     CommonTreeAdaptor,
     CommonTreeNodeStream,
+    CompactCommonTree,
+    CompactTreeAdaptor,
+    FlatTreeAdaptor,
     TreeIterator,
     TreeParser,
     TreeVisitor,
@@ -524,6 +528,116 @@ class TestCommonTreeNodeStream(unittest.TestCase):
         stream.pop()
         self.assertEqual(EOF, stream.LT(1).getType())
 
+    def testGetNodeIndex(self):
+        # ^(101 ^(102 103) 104)
+        r0 = CommonTree(CommonToken(101))
+        r1 = CommonTree(CommonToken(102))
+        n103 = CommonTree(CommonToken(103))
+        r1.addChild(n103)
+        r0.addChild(r1)
+        n104 = CommonTree(CommonToken(104))
+        r0.addChild(n104)
+
+        stream = CommonTreeNodeStream(r0)
+        self.assertEqual(0, stream.getNodeIndex(r0))
+        self.assertEqual(2, stream.getNodeIndex(r1))
+        self.assertEqual(4, stream.getNodeIndex(n103))
+        self.assertEqual(6, stream.getNodeIndex(n104))
+        self.assertEqual(1, stream.getNodeIndex(stream.down))
+        self.assertEqual(5, stream.getNodeIndex(stream.up))
+        self.assertEqual(-1, stream.getNodeIndex(CommonTree(CommonToken(104))))
+
+    def testGetNodeIndexUniqueNavigationNodes(self):
+        # ^(101 ^(102 103) 104)
+        r0 = CommonTree(CommonToken(101))
+        r1 = CommonTree(CommonToken(102))
+        r1.addChild(CommonTree(CommonToken(103)))
+        r0.addChild(r1)
+        n104 = CommonTree(CommonToken(104))
+        r0.addChild(n104)
+
+        stream = CommonTreeNodeStream(r0)
+        stream.setUniqueNavigationNodes(True)
+        self.assertEqual(6, stream.getNodeIndex(n104))
+        for i in range(stream.size()):
+            self.assertEqual(i, stream.getNodeIndex(stream.get(i)))
+
+    def testGetNodeIndexAfterReplaceChildren(self):
+        # ^(101 102 103)
+        r0 = CommonTree(CommonToken(101))
+        n102 = CommonTree(CommonToken(102))
+        r0.addChild(n102)
+        n103 = CommonTree(CommonToken(103))
+        r0.addChild(n103)
+
+        stream = CommonTreeNodeStream(r0)
+        self.assertEqual(3, stream.getNodeIndex(n103))
+
+        n104 = CommonTree(CommonToken(104))
+        stream.replaceChildren(r0, 1, 1, n104)
+        self.assertEqual(3, stream.getNodeIndex(n103))
+        self.assertEqual(-1, stream.getNodeIndex(n104))
+        self.assertEqual("101 2 102 103 3", str(stream))
+
+    def testLA(self):
+        # ^(101 ^(102 103) 104)
+        r0 = CommonTree(CommonToken(101))
+        r1 = CommonTree(CommonToken(102))
+        r1.addChild(CommonTree(CommonToken(103)))
+        r0.addChild(r1)
+        r0.addChild(CommonTree(CommonToken(104)))
+
+        stream = CommonTreeNodeStream(r0)
+        found = []
+        while stream.LA(1) != EOF:
+            found.append(stream.LA(1))
+            self.assertEqual(stream.LT(2).getType(), stream.LA(2))
+            stream.consume()
+
+        self.assertEqual([101, DOWN, 102, DOWN, 103, UP, 104, UP], found)
+        self.assertEqual(EOF, stream.LA(3))
+        self.assertEqual(UP, stream.LA(-1))
+        self.assertTrue(stream.isEOF(stream.LT(1)))
+
+    def testLAWithUntypedNodes(self):
+        # ^(101 <no type>)
+        r0 = CommonTree(CommonToken(101))
+        r0.addChild(CommonTree(CommonToken()))
+
+        stream = CommonTreeNodeStream(r0)
+        self.assertEqual(101, stream.LA(1))
+        self.assertEqual(DOWN, stream.LA(2))
+        self.assertIsNone(stream.LA(3))
+        self.assertEqual(UP, stream.LA(4))
+
+    def testLAWithLargeTypes(self):
+        # ^(101 2**40)
+        r0 = CommonTree(CommonToken(101))
+        r0.addChild(CommonTree(CommonToken(2**40)))
+
+        stream = CommonTreeNodeStream(r0)
+        self.assertEqual(101, stream.LA(1))
+        self.assertEqual(2**40, stream.LA(3))
+
+        # a stream over a part of the buffer of another one
+        stream = CommonTreeNodeStream(stream, 2, 4)
+        stream.p = 0
+        self.assertEqual(2**40, stream.LA(1))
+
+    def testToStringWithoutTokenStream(self):
+        # ^(101 ^(102 103) 104)
+        r0 = CommonTree(CommonToken(101, text="a"))
+        r1 = CommonTree(CommonToken(102, text="b"))
+        n103 = CommonTree(CommonToken(103, text="c"))
+        r1.addChild(n103)
+        r0.addChild(r1)
+        n104 = CommonTree(CommonToken(104, text="d"))
+        r0.addChild(n104)
+
+        stream = CommonTreeNodeStream(r0)
+        self.assertEqual("bDOWNcUPd", stream.toString(r1, n104))
+        self.assertEqual("c", stream.toString(n103, n103))
+
 
 class TestCommonTree(unittest.TestCase):
     """Test case for the CommonTree class."""
@@ -638,6 +752,51 @@ class TestCommonTree(unittest.TestCase):
         self.assertEqual(-1, dup.childIndex)
         dup.sanityCheckParentAndChildIndexes()
 
+    def testToStringTree(self):
+        # ^(nil ^(101 ^(102 103)) 104)
+        r0 = self.adaptor.nil()
+        r1 = CommonTree(CommonToken(101, text="a"))
+        r0.addChild(r1)
+        r2 = CommonTree(CommonToken(102, text="b"))
+        r1.addChild(r2)
+        r2.addChild(CommonTree(CommonToken(103, text="c")))
+        r0.addChild(CommonTree(CommonToken(104, text="d")))
+
+        self.assertEqual("(a (b c)) d", r0.toStringTree())
+        self.assertEqual("(a (b c))", r1.toStringTree())
+        self.assertEqual("c", r2.getChild(0).toStringTree())
+
+        buf = io.StringIO()
+        r0.writeStringTree(buf)
+        self.assertEqual("(a (b c)) d", buf.getvalue())
+
+    def testToStringTreeCustomNodes(self):
+        class V(CommonTree):
+            def __str__(self):
+                return self.token.text + "<V>"
+
+        class W(CommonTree):
+            def toStringTree(self):
+                return "W"
+
+        r0 = V(CommonToken(101, text="a"))
+        r1 = V(CommonToken(102, text="b"))
+        r0.addChild(r1)
+        r1.addChild(W(CommonToken(103, text="c")))
+        r0.addChild(V(CommonToken(104, text="d")))
+
+        self.assertEqual("(a<V> (b<V> W) d)", r0.toStringTree())
+
+    def testToStringTreeDeep(self):
+        r0 = CommonTree(CommonToken(101, text="a"))
+        t = r0
+        for _ in range(5000):
+            child = CommonTree(CommonToken(101, text="a"))
+            t.addChild(child)
+            t = child
+
+        self.assertEqual("(a " * 5000 + "a" + ")" * 5000, r0.toStringTree())
+
     def testBecomeRoot(self):
         # 5 becomes root of ^(nil 101 102 103)
         newRoot = CommonTree(CommonToken(5))
@@ -854,6 +1013,286 @@ class TestCommonTree(unittest.TestCase):
         t.sanityCheckParentAndChildIndexes()
 
 
+class TestCompactCommonTree(unittest.TestCase):
+    """Test case for the CompactCommonTree class."""
+
+    def setUp(self):
+        """Setup test fixure"""
+
+        self.adaptor = CompactTreeAdaptor()
+
+    def node(self, ttype):
+        return self.adaptor.createWithPayload(CommonToken(ttype, text=str(ttype)))
+
+    def testSingleNode(self):
+        t = self.node(101)
+        self.assertIsInstance(t, CompactCommonTree)
+        self.assertIsNone(t.parent)
+        self.assertEqual(-1, t.childIndex)
+        self.assertEqual(0, t.getChildCount())
+        self.assertFalse(hasattr(t, "__dict__"))
+        self.assertRaises(AttributeError, setattr, t, "foo", 1)
+
+    def testLeavesShareChildren(self):
+        a = self.node(101)
+        b = self.node(102)
+        self.assertIs(a.children, b.children)
+
+        a.addChild(self.node(103))
+        self.assertEqual(1, a.getChildCount())
+        self.assertEqual(0, b.getChildCount())
+        self.assertEqual("(101 103)", a.toStringTree())
+        a.sanityCheckParentAndChildIndexes()
+
+    def testAddEmptyList(self):
+        t = self.node(101)
+        t.addChild(self.adaptor.nil())
+        self.assertEqual(0, t.getChildCount())
+
+    def testSetChildOfLeaf(self):
+        t = self.node(101)
+        self.assertRaises(IndexError, t.setChild, 0, self.node(102))
+
+    def testBecomeRoot(self):
+        newRoot = self.node(5)
+
+        oldRoot = self.adaptor.nil()
+        oldRoot.addChild(self.node(101))
+        oldRoot.addChild(self.node(102))
+        oldRoot.addChild(self.node(103))
+
+        root = self.adaptor.becomeRoot(newRoot, oldRoot)
+        self.assertIs(newRoot, root)
+        self.assertEqual("(5 101 102 103)", root.toStringTree())
+        root.sanityCheckParentAndChildIndexes()
+
+    def testDupTree(self):
+        r0 = self.node(101)
+        r1 = self.node(102)
+        r0.addChild(r1)
+        r1.addChild(self.node(103))
+        r0.addChild(self.node(104))
+
+        dup = self.adaptor.dupTree(r0)
+        self.assertIsInstance(dup, CompactCommonTree)
+        self.assertEqual(r0.toStringTree(), dup.toStringTree())
+        dup.sanityCheckParentAndChildIndexes()
+
+    def testMixedTrees(self):
+        t = CommonTree(CommonToken(101, text="101"))
+        t.addChild(self.node(102))
+        t.addChild(self.adaptor.nil())
+        self.assertEqual("(101 102)", t.toStringTree())
+
+        root = self.adaptor.becomeRoot(CommonTree(CommonToken(5, text="5")), t)
+        self.assertEqual("(5 (101 102))", root.toStringTree())
+        self.assertIs(t.token, self.adaptor.getToken(t))
+
+
+class TestFlatTreeAdaptor(unittest.TestCase):
+    """Test case for the FlatTreeAdaptor class."""
+
+    def setUp(self):
+        """Setup test fixure"""
+
+        self.adaptor = FlatTreeAdaptor()
+
+    def node(self, ttype):
+        return self.adaptor.createWithPayload(CommonToken(ttype, text=str(ttype)))
+
+    def toStringTree(self, t):
+        return self.adaptor.toCommonTree(t).toStringTree()
+
+    def testSingleNode(self):
+        t = self.node(101)
+        self.assertIsInstance(t, int)
+        self.assertIsNone(self.adaptor.getParent(t))
+        self.assertEqual(-1, self.adaptor.getChildIndex(t))
+        self.assertEqual(101, self.adaptor.getType(t))
+        self.assertEqual("101", self.adaptor.getText(t))
+        self.assertFalse(self.adaptor.isNil(t))
+        self.assertEqual(0, self.adaptor.getChildCount(t))
+
+    def test4Nodes(self):
+        # ^(101 ^(102 103) 104)
+        r0 = self.node(101)
+        r1 = self.node(102)
+        self.adaptor.addChild(r0, r1)
+        self.adaptor.addChild(r1, self.node(103))
+        self.adaptor.addChild(r0, self.node(104))
+
+        self.assertIsNone(self.adaptor.getParent(r0))
+        self.assertEqual(r0, self.adaptor.getParent(r1))
+        self.assertEqual(1, self.adaptor.getChildIndex(self.adaptor.getChild(r0, 1)))
+        self.assertEqual(104, self.adaptor.getType(self.adaptor.getChild(r0, -1)))
+        self.assertIsNone(self.adaptor.getChild(r0, 2))
+        self.assertEqual("(101 (102 103) 104)", self.toStringTree(r0))
+
+    def testList(self):
+        r0 = self.adaptor.nil()
+        self.adaptor.addChild(r0, self.node(101))
+        self.adaptor.addChild(r0, self.node(102))
+        self.assertTrue(self.adaptor.isNil(r0))
+        self.assertEqual("101 102", self.toStringTree(r0))
+
+        t = self.node(5)
+        self.adaptor.addChild(t, self.node(100))
+        self.adaptor.addChild(t, r0)
+        self.assertEqual("(5 100 101 102)", self.toStringTree(t))
+        self.assertEqual(0, self.adaptor.getChildCount(r0))
+        for i in range(3):
+            c = self.adaptor.getChild(t, i)
+            self.assertEqual(t, self.adaptor.getParent(c))
+            self.assertEqual(i, self.adaptor.getChildIndex(c))
+
+    def testAddListToItself(self):
+        r0 = self.adaptor.nil()
+        self.assertRaises(ValueError, self.adaptor.addChild, r0, r0)
+
+    def testBecomeRoot(self):
+        oldRoot = self.adaptor.nil()
+        self.adaptor.addChild(oldRoot, self.node(101))
+        self.adaptor.addChild(oldRoot, self.node(102))
+
+        newRoot = self.adaptor.nil()
+        self.adaptor.addChild(newRoot, self.node(5))
+
+        root = self.adaptor.becomeRoot(newRoot, oldRoot)
+        self.assertEqual(5, self.adaptor.getType(root))
+        self.assertEqual("(5 101 102)", self.toStringTree(root))
+
+        newRoot = self.adaptor.nil()
+        self.adaptor.addChild(newRoot, self.node(6))
+        self.adaptor.addChild(newRoot, self.node(7))
+        self.assertRaises(RuntimeError, self.adaptor.becomeRoot, newRoot, self.node(8))
+
+    def testRulePostProcessing(self):
+        r0 = self.adaptor.nil()
+        self.assertIsNone(self.adaptor.rulePostProcessing(r0))
+
+        r0 = self.adaptor.nil()
+        t = self.node(101)
+        self.adaptor.addChild(r0, t)
+        self.assertEqual(t, self.adaptor.rulePostProcessing(r0))
+        self.assertIsNone(self.adaptor.getParent(t))
+
+    def testReplaceAndDeleteChildren(self):
+        t = self.node(99)
+        for ttype in (100, 101, 102, 103):
+            self.adaptor.addChild(t, self.node(ttype))
+
+        newChildren = self.adaptor.nil()
+        self.adaptor.addChild(newChildren, self.node(200))
+        self.adaptor.addChild(newChildren, self.node(201))
+        self.adaptor.replaceChildren(t, 1, 2, newChildren)
+        self.assertEqual("(99 100 200 201 103)", self.toStringTree(t))
+
+        self.adaptor.setChild(t, 0, self.node(300))
+        self.assertEqual("(99 300 200 201 103)", self.toStringTree(t))
+
+        killed = self.adaptor.deleteChild(t, 1)
+        self.assertEqual(200, self.adaptor.getType(killed))
+        self.assertEqual("(99 300 201 103)", self.toStringTree(t))
+        for i in range(3):
+            c = self.adaptor.getChild(t, i)
+            self.assertEqual(i, self.adaptor.getChildIndex(c))
+
+        self.assertRaises(
+            IndexError, self.adaptor.replaceChildren, t, 3, 3, newChildren
+        )
+
+    def testDupTree(self):
+        r0 = self.node(101)
+        r1 = self.node(102)
+        self.adaptor.addChild(r0, r1)
+        self.adaptor.addChild(r1, self.node(103))
+        self.adaptor.setTokenBoundaries(r0, CommonToken(1), CommonToken(1))
+
+        dup = self.adaptor.dupTree(r0)
+        self.assertNotEqual(r0, dup)
+        self.assertEqual("(101 (102 103))", self.toStringTree(dup))
+
+    def testGetChildAnyOrder(self):
+        r0 = self.node(100)
+        children = [self.node(101 + i) for i in range(5)]
+        for c in children:
+            self.adaptor.addChild(r0, c)
+            self.adaptor.addChild(c, self.node(200))
+
+        for i in [3, 1, 2, 4, 0, 2]:
+            self.assertEqual(children[i], self.adaptor.getChild(r0, i))
+            grandchild = self.adaptor.getChild(children[i], 0)
+            self.assertEqual(200, self.adaptor.getType(grandchild))
+
+        # the child lists follow changes
+        extra = self.adaptor.nil()
+        self.adaptor.addChild(extra, self.node(106))
+        self.adaptor.addChild(r0, extra)
+        self.adaptor.deleteChild(r0, 0)
+        self.assertEqual(
+            [102, 103, 104, 105, 106],
+            [self.adaptor.getType(self.adaptor.getChild(r0, i)) for i in range(5)],
+        )
+
+    def testSetText(self):
+        t = self.node(101)
+        self.adaptor.setText(t, "foo")
+        self.assertEqual("foo", self.adaptor.getText(t))
+
+        self.assertRaises(ValueError, self.adaptor.setText, self.adaptor.nil(), "foo")
+
+    def testTokenBoundaries(self):
+        start = CommonToken(101, text="a")
+        start.index = 3
+        t = self.adaptor.createWithPayload(start)
+        self.assertEqual(3, self.adaptor.getTokenStartIndex(t))
+        self.assertEqual(3, self.adaptor.getTokenStopIndex(t))
+
+        stop = CommonToken(102, text="b")
+        stop.index = 7
+        self.adaptor.setTokenBoundaries(t, start, stop)
+        self.assertEqual(3, self.adaptor.getTokenStartIndex(t))
+        self.assertEqual(7, self.adaptor.getTokenStopIndex(t))
+
+    def testConversion(self):
+        wiz = TreeWizard(CommonTreeAdaptor(), ["", "", "", "", "A", "B", "C", "D"])
+        tree = wiz.create("(A (B C) (D A B))")
+        tree.setUnknownTokenBoundaries()
+
+        t = self.adaptor.importTree(tree)
+        self.assertEqual(6, len(self.adaptor))
+        self.assertEqual(tree.toStringTree(), self.toStringTree(t))
+
+        back = self.adaptor.toCommonTree(t)
+        self.assertIsInstance(back, CommonTree)
+        back.sanityCheckParentAndChildIndexes()
+        self.assertEqual(tree.getChild(1).token, back.getChild(1).token)
+
+    def testNodeStream(self):
+        r0 = self.node(101)
+        r1 = self.node(102)
+        self.adaptor.addChild(r0, r1)
+        self.adaptor.addChild(r1, self.node(103))
+        self.adaptor.addChild(r0, self.node(104))
+
+        stream = CommonTreeNodeStream(self.adaptor, r0)
+        self.assertEqual("101 2 102 2 103 3 104 3", str(stream))
+
+    def testNodeStreamNodeIndex(self):
+        # handles above 256 are distinct int objects for equal values
+        for _ in range(300):
+            self.node(1)
+
+        r0 = self.node(101)
+        self.adaptor.addChild(r0, self.node(102))
+        n103 = self.node(103)
+        self.adaptor.addChild(r0, n103)
+
+        stream = CommonTreeNodeStream(self.adaptor, r0)
+        self.assertEqual(3, stream.getNodeIndex(int(str(n103))))
+        self.assertEqual("102103", stream.toString(stream.get(2), int(str(n103))))
+
+
 class TestTreeContext(unittest.TestCase):
     """Test the TreeParser.inContext() method"""
 
@@ -1060,6 +1499,28 @@ class TestTreeContext(unittest.TestCase):
         )
         self.assertEqual(expecting, found)
 
+    def testCustomParent(self):
+        """Ancestors that override getParent() are asked for their parent"""
+
+        class DetachedTree(CommonTree):
+            def getParent(self):
+                return None
+
+        adaptor = CommonTreeAdaptor()
+        vec = CommonTree(CommonToken(type=4, text="VEC"))
+        printNode = DetachedTree(CommonToken(type=6, text="PRINT"))
+        node = CommonTree(CommonToken(type=11, text="1"))
+        vec.addChild(printNode)
+        printNode.addChild(node)
+
+        self.assertTrue(TreeParser._inContext(adaptor, self.tokenNames, node, "PRINT"))
+        self.assertFalse(
+            TreeParser._inContext(adaptor, self.tokenNames, node, "VEC PRINT")
+        )
+        self.assertFalse(
+            TreeParser._inContext(adaptor, self.tokenNames, node, "VEC ...")
+        )
+
     ## TEST INVALID CONTEXTS
 
     def testNotParent(self):
@@ -1179,6 +1640,46 @@ class TestTreeContext(unittest.TestCase):
             "PRINT .. VEC",
         )
 
+    def testCompiledContextIsCached(self):
+        compiled = TreeParser._compileContext(self.tokenNames, "PRINT ... VEC")
+        self.assertEqual((frozenset([6]), None, frozenset([4])), compiled)
+        self.assertIs(
+            compiled, TreeParser._compileContext(self.tokenNames, "PRINT ... VEC")
+        )
+
+    def testUnknownTokenName(self):
+        tree = "(PRINT (MULT ID[x] (VEC INT[1] INT[2] INT[3])))"
+        adaptor = CommonTreeAdaptor()
+        wiz = TreeWizard(adaptor, self.tokenNames)
+        t = wiz.create(tree)
+
+        node = t.getChild(0).getChild(1).getChild(0)
+        self.assertFalse(
+            TreeParser._inContext(adaptor, self.tokenNames, node, "FOO ... VEC")
+        )
+        self.assertTrue(TreeParser._inContext(adaptor, self.tokenNames, node, "VEC"))
+
+    def testCustomAdaptor(self):
+        class RecordingAdaptor(CommonTreeAdaptor):
+            def __init__(self):
+                super().__init__()
+                self.parents = 0
+
+            def getParent(self, t):
+                self.parents += 1
+                return super().getParent(t)
+
+        tree = "(PRINT (MULT ID[x] (VEC INT[1] INT[2] INT[3])))"
+        adaptor = RecordingAdaptor()
+        wiz = TreeWizard(adaptor, self.tokenNames)
+        t = wiz.create(tree)
+
+        node = t.getChild(0).getChild(1).getChild(0)
+        self.assertTrue(
+            TreeParser._inContext(adaptor, self.tokenNames, node, "PRINT MULT VEC")
+        )
+        self.assertEqual(4, adaptor.parents)
+
 
 class TestTreeVisitor(unittest.TestCase):
     """Test of the TreeVisitor class."""
@@ -1316,6 +1817,45 @@ class TestTreeIterator(unittest.TestCase):
         found = self.toString(it)
         self.assertEqual(expecting, found)
 
+    def testNextAndHasNext(self):
+        adaptor = CommonTreeAdaptor()
+        wiz = TreeWizard(adaptor, self.tokens)
+        t = wiz.create("(A (B C) D)")
+        it = TreeIterator(t)
+        buf = []
+        while it.has_next():
+            self.assertTrue(it.has_next())
+            buf.append(str(next(it)))
+
+        self.assertEqual("A DOWN B DOWN C UP D UP EOF", " ".join(buf))
+        self.assertRaises(StopIteration, next, it)
+
+    def testHasNextWhileIterating(self):
+        adaptor = CommonTreeAdaptor()
+        wiz = TreeWizard(adaptor, self.tokens)
+        t = wiz.create("(A (B C) D)")
+        it = TreeIterator(t)
+        buf = []
+        for n in it:
+            buf.append(str(n))
+            it.has_next()
+
+        self.assertEqual("A DOWN B DOWN C UP D UP EOF", " ".join(buf))
+
+    def testEmptyTree(self):
+        it = TreeIterator(None)
+        self.assertFalse(it.has_next())
+        self.assertEqual("", self.toString(it))
+
+    def testSubtree(self):
+        adaptor = CommonTreeAdaptor()
+        wiz = TreeWizard(adaptor, self.tokens)
+        t = wiz.create("(A (B C D) E)")
+        it = TreeIterator(t.getChild(0))
+        expecting = "B DOWN C D UP EOF"
+        found = self.toString(it)
+        self.assertEqual(expecting, found)
+
     def toString(self, it):
         buf = []
         for n in it:
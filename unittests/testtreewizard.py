@@ -10,6 +10,9 @@ from antlr3.treewizard import (
     EOF,
     ID,
     PERCENT,
+    IndexingTreeAdaptor,
+    SubtreeHasher,
+    TreeIndex,
     TreePattern,
     TreePatternLexer,
     TreePatternParser,
@@ -613,6 +616,297 @@ class TestTreeWizard(unittest.TestCase):
         expecting = ["A", "foo", "big"]
         self.assertEqual(expecting, found)
 
+    def testCompile(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        tpattern = wiz.compile("(%a:A %b:B .)")
+        self.assertIsInstance(tpattern, TreePattern)
+        self.assertIs(tpattern, wiz.compile("(%a:A %b:B .)"))
+        self.assertIs(tpattern, wiz.compile(tpattern))
+
+        t = wiz.create("(A B C)")
+        labels = {}
+        self.assertTrue(wiz.parse(t, tpattern, labels))
+        self.assertEqual("B", str(labels["b"]))
+
+    def testCompileInvalid(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        self.assertIsNone(wiz.compile("(A B"))
+        self.assertIsNone(wiz.compile("(A XYZ)"))
+
+    def testCompileCacheSize(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        wiz.patternCacheSize = 2
+        a = wiz.compile("A")
+        wiz.compile("B")
+        wiz.compile("A")  # make B the least recently used
+        wiz.compile("C")
+
+        self.assertEqual(list(wiz._patternCache), ["A", "C"])
+        self.assertIs(a, wiz.compile("A"))
+
+    def testFindCompiledPattern(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        t = wiz.create("(A B C (A[foo] B[bar]) (D (A[big] B[dog])))")
+        subtrees = wiz.find(t, wiz.compile("(A B)"))
+        found = [str(node) for node in subtrees]
+        self.assertEqual(["foo", "big"], found)
+
+    def testMatchAll(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        t = wiz.create("(A B C (A[foo] B[bar]) (D (A[big] B[dog])))")
+        matches = [
+            (patternId, str(node), {k: str(v) for k, v in labels.items()})
+            for patternId, node, labels in wiz.matchAll(
+                t, {"ab": "(A %b:B)", "d": "(D (. B))", "any": "(%x:. B)"}
+            )
+        ]
+        expecting = [
+            ("ab", "foo", {"b": "bar"}),
+            ("any", "foo", {"x": "foo"}),
+            ("d", "D", {}),
+            ("ab", "big", {"b": "dog"}),
+            ("any", "big", {"x": "big"}),
+        ]
+        self.assertEqual(expecting, matches)
+
+    def testMatchAllSequence(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        t = wiz.create("(A B C (A[foo] B[bar]) (D (A[big] B[dog])))")
+        matches = [
+            (patternId, str(node))
+            for patternId, node, _ in wiz.match_all(t, ["(A B)", "B"])
+        ]
+        expecting = [(1, "B"), (0, "foo"), (1, "bar"), (0, "big"), (1, "dog")]
+        self.assertEqual(expecting, matches)
+
+    def testMatchAllInvalidPattern(self):
+        wiz = TreeWizard(self.adaptor, self.tokens)
+        t = wiz.create("(A B)")
+        self.assertRaises(ValueError, list, wiz.matchAll(t, ["(nil A)"]))
+        self.assertRaises(ValueError, list, wiz.matchAll(t, ["(A"]))
+
+
+class TestTreeIndex(unittest.TestCase):
+    """Test case for the TreeIndex and IndexingTreeAdaptor classes."""
+
+    def setUp(self):
+        self.adaptor = IndexingTreeAdaptor()
+        self.tokens = ["", "", "", "", "", "A", "B", "C", "D", "E", "ID", "VAR"]
+        self.wiz = TreeWizard(self.adaptor, self.tokens)
+
+    def texts(self, nodes):
+        return sorted(str(node) for node in nodes)
+
+    def testBuild(self):
+        t = self.wiz.create("(A B C (A[foo] B[bar]) (D (A[big] B[dog])))")
+        index = self.wiz.buildIndex(t)
+
+        self.assertEqual(len(index), 8)
+        self.assertEqual(["A", "foo", "big"], [str(n) for n in index.get(5)])
+        self.assertEqual([], index.get(9))
+        self.assertEqual({5, 6, 7, 8}, index.types())
+        self.assertEqual(self.wiz.index(t), index.toDict())
+
+    def testFindUsesIndex(self):
+        t = self.wiz.create("(A B C (A[foo] B[bar]))")
+        index = self.wiz.buildIndex(t)
+
+        # a node added behind the adaptor's back is only seen by a walk
+        t.addChild(self.wiz.create("B[hidden]"))
+        self.assertEqual(["B", "bar"], self.texts(self.wiz.find(t, 6)))
+
+        index.rebuild()
+        self.assertEqual(["B", "bar", "hidden"], self.texts(self.wiz.find(t, 6)))
+
+    def testAddChild(self):
+        t = self.wiz.create("(A B)")
+        self.wiz.buildIndex(t)
+
+        self.adaptor.addChild(t, self.wiz.create("(C D[x])"))
+        self.adaptor.addChild(t, self.wiz.create("(nil D[y] D[z])"))
+
+        self.assertEqual(["x", "y", "z"], self.texts(self.wiz.find(t, 8)))
+        self.assertEqual(["C"], self.texts(self.wiz.find(t, 7)))
+
+    def testSetChild(self):
+        t = self.wiz.create("(A B (C D))")
+        self.wiz.buildIndex(t)
+
+        self.adaptor.setChild(t, 1, self.wiz.create("E"))
+
+        self.assertEqual([], self.wiz.find(t, 7))
+        self.assertEqual([], self.wiz.find(t, 8))
+        self.assertEqual(["E"], self.texts(self.wiz.find(t, 9)))
+
+    def testDeleteChild(self):
+        t = self.wiz.create("(A B (C D))")
+        index = self.wiz.buildIndex(t)
+
+        self.adaptor.deleteChild(t, 1)
+
+        self.assertEqual([], self.wiz.find(t, 8))
+        self.assertEqual(2, len(index))
+
+    def testReplaceChildren(self):
+        t = self.wiz.create("(A B C D[x] E)")
+        self.wiz.buildIndex(t)
+
+        new = self.wiz.create("(nil D[y] (D[z] B))")
+        self.adaptor.replaceChildren(t, 1, 2, new)
+
+        self.assertEqual("(A B y (z B) E)", t.toStringTree())
+        self.assertEqual(["y", "z"], self.texts(self.wiz.find(t, 8)))
+        self.assertEqual([], self.wiz.find(t, 7))
+        self.assertEqual(["B", "B"], self.texts(self.wiz.find(t, 6)))
+
+    def testBecomeRoot(self):
+        old = self.wiz.create("(nil B C)")
+        index = self.wiz.buildIndex(old)
+
+        root = self.adaptor.becomeRoot(self.wiz.create("A"), old)
+
+        self.assertIs(index.root, root)
+        self.assertEqual(["A"], self.texts(self.wiz.find(root, 5)))
+        self.assertEqual(3, len(index))
+
+    def testBecomeRootIndexedTree(self):
+        """becomeRoot() doesn't walk the subtree that is already indexed"""
+
+        class CountingAdaptor(IndexingTreeAdaptor):
+            calls = 0
+
+            def getChildCount(self, t):
+                self.calls += 1
+                return super().getChildCount(t)
+
+        adaptor = CountingAdaptor()
+        wiz = TreeWizard(adaptor, self.tokens)
+        old = wiz.create("(B " + " ".join(["C"] * 100) + ")")
+        index = wiz.buildIndex(old)
+
+        adaptor.calls = 0
+        root = adaptor.becomeRoot(wiz.create("A"), old)
+
+        self.assertLess(adaptor.calls, 10)
+        self.assertIs(index.root, root)
+        self.assertEqual(102, len(index))
+        self.assertEqual(["A"], self.texts(wiz.find(root, 5)))
+
+    def testVisit(self):
+        t = self.wiz.create("(A B C (A[foo] B[bar]))")
+        self.wiz.buildIndex(t)
+
+        visited = []
+
+        def visitor(node, parent, childIndex, labels):
+            visited.append((str(node), str(parent), childIndex))
+
+        self.wiz.visit(t, 5, visitor)
+        self.assertEqual([("A", "None", 0), ("foo", "A", 2)], visited)
+
+        visited = []
+        self.wiz.visit(t, "(A B)", visitor)
+        self.assertEqual([("foo", "A", 2)], visited)
+
+    def testClose(self):
+        t = self.wiz.create("(A B)")
+        index = self.wiz.buildIndex(t)
+        index.close()
+
+        self.adaptor.addChild(t, self.wiz.create("C"))
+        self.assertNotIn(t.getChild(1), index)
+        self.assertEqual(["C"], self.texts(self.wiz.find(t, 7)))
+
+    def testSnapshot(self):
+        t = self.wiz.create("(A B)")
+        index = TreeIndex(t, CommonTreeAdaptor())
+
+        self.assertEqual(["B"], self.texts(index.get(6)))
+        self.assertEqual([], self.adaptor.indexes)
+
+
+class TestSubtreeHasher(unittest.TestCase):
+    """Test case for the SubtreeHasher class."""
+
+    def setUp(self):
+        self.adaptor = IndexingTreeAdaptor()
+        self.tokens = ["", "", "", "", "", "A", "B", "C", "D", "E", "ID", "VAR"]
+        self.wiz = TreeWizard(self.adaptor, self.tokens)
+        self.hasher = SubtreeHasher(self.adaptor)
+
+    def testHash(self):
+        t1 = self.wiz.create("(A B (C D[x]))")
+        t2 = self.wiz.create("(A B (C D[x]))")
+        t3 = self.wiz.create("(A B (C D[y]))")
+
+        self.assertEqual(self.hasher.hash(t1), self.hasher.hash(t2))
+        self.assertNotEqual(self.hasher.hash(t1), self.hasher.hash(t3))
+        self.assertEqual(
+            self.hasher.hash(t1.getChild(1)), self.hasher.hash(t2.getChild(1))
+        )
+
+    def testEquals(self):
+        t1 = self.wiz.create("(A B (C D[x]))")
+        t2 = self.wiz.create("(A B (C D[x]))")
+        t3 = self.wiz.create("(A B C D[x])")
+
+        self.assertTrue(self.hasher.equals(t1, t2))
+        self.assertFalse(self.hasher.equals(t1, t3))
+        self.assertFalse(self.hasher.equals(t1, None))
+        self.assertEqual(self.wiz.equals(t1, t3), self.hasher.equals(t1, t3))
+        self.assertTrue(self.hasher.equals(t1, t2, exact=False))
+        self.assertFalse(self.hasher.equals(t1, t3, exact=False))
+
+    def testInvalidateOnMutation(self):
+        t1 = self.wiz.create("(A B (C D))")
+        t2 = self.wiz.create("(A B (C D E))")
+        self.assertFalse(self.hasher.equals(t1, t2))
+
+        self.adaptor.addChild(t1.getChild(1), self.wiz.create("E"))
+        self.assertTrue(self.hasher.equals(t1, t2))
+
+        self.adaptor.deleteChild(t2.getChild(1), 0)
+        self.assertFalse(self.hasher.equals(t1, t2))
+
+    def testInvalidateManually(self):
+        hasher = SubtreeHasher(CommonTreeAdaptor())
+        t1 = self.wiz.create("(A B)")
+        t2 = self.wiz.create("(A B C)")
+        self.assertFalse(hasher.equals(t1, t2))
+
+        t1.addChild(self.wiz.create("C"))
+        hasher.invalidate(t1)
+        self.assertTrue(hasher.equals(t1, t2))
+
+    def testShare(self):
+        t = self.wiz.create("(A (B C D) (E (B C D)) (B C D))")
+        t = self.hasher.share(t)
+
+        shared = t.getChild(0)
+        self.assertIs(shared, t.getChild(1).getChild(0))
+        self.assertIs(shared, t.getChild(2))
+        self.assertEqual("(A (B C D) (E (B C D)) (B C D))", t.toStringTree())
+
+    def testCanonical(self):
+        t1 = self.wiz.create("(A B)")
+        t2 = self.wiz.create("(A B)")
+
+        self.assertIs(t1, self.hasher.canonical(t1))
+        self.assertIs(t1, self.hasher.canonical(t2))
+
+    def testDeepTree(self):
+        t1 = node1 = self.wiz.create("A")
+        t2 = node2 = self.wiz.create("A")
+        for _ in range(5000):
+            child = self.wiz.create("B")
+            node1.addChild(child)
+            node1 = child
+            child = self.wiz.create("B")
+            node2.addChild(child)
+            node2 = child
+
+        self.assertTrue(self.hasher.equals(t1, t2))
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))